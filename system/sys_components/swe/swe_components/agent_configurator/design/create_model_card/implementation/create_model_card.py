@@ -3,39 +3,73 @@
 Generate a structured "model card" JSON document for a GGUF LLM.
 
 Usage:
-    python gguf_model_card.py --model path/to/model.gguf [--out model_card.json]
+    python gguf_model_card.py --model path/to/model.gguf [--out model_card.json] [--llama]
+    python gguf_model_card.py --models-dir /models    (all models + catalogue, see model_catalogue.py)
 
-Requires:
-    pip install llama-cpp-python
+Metadata is read straight from the GGUF header (gguf_reader.py, no dependencies).
+--llama additionally loads the model with llama-cpp-python (vocab only) for runtime values.
 """
 
 import argparse
 import json
 import os
+import struct
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 
-import llama_cpp  # low-level API (C bindings + Llama class)
-from llama_cpp import Llama
+from system.sys_components.swe.swe_components.agent_configurator.design.create_model_card.implementation.gguf_reader import (
+    GGUFError,
+    read_gguf_header,
+)
+
+try:
+    import llama_cpp  # low-level API (C bindings + Llama class)
+    from llama_cpp import Llama
+except Exception:
+    llama_cpp = None
+    Llama = None
 
 
 def _iso_now() -> str:
     return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
 
-def build_model_card(llm: Llama, model_path: str) -> Dict[str, Any]:
+def runtime_from_llama(llm: Any) -> Dict[str, Any]:
+    """Runtime view from a loaded llama_cpp.Llama, best effort (same keys as the header summary)."""
+    runtime: Dict[str, Any] = {}
+    for key, call in (("n_ctx", llm.n_ctx), ("n_vocab", llm.n_vocab), ("n_embd", llm.n_embd)):
+        try:
+            runtime[key] = call()
+        except Exception:
+            runtime[key] = None
+    try:
+        runtime["n_params"] = int(llama_cpp.llama_model_n_params(llm.model))  # type: ignore[attr-defined]
+    except Exception:
+        runtime["n_params"] = None
+    return runtime
+
+
+def file_mtime_utc(path: str) -> str:
+    """Last-modified time of a file as the card records it (ISO 8601, UTC, seconds)."""
+    mtime = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    return mtime.replace(microsecond=0, tzinfo=None).isoformat() + "Z"
+
+
+def build_model_card(metadata: Dict[str, Any], model_path: str, runtime: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Build a structured model card from a loaded Llama (GGUF) model.
-    Tries to preserve all essential spec from metadata while giving a clean top-level card.
+    Build a structured model card from GGUF metadata (read_gguf_header, or Llama.metadata).
+    runtime holds n_ctx / n_vocab / n_embd / n_params where known (header summary or
+    runtime_from_llama). Tries to preserve all essential spec from metadata while giving a
+    clean top-level card.
     """
     # Basic file info
     abs_path = os.path.abspath(model_path)
     file_size = os.path.getsize(model_path)
-    mtime = datetime.utcfromtimestamp(os.path.getmtime(model_path)).replace(microsecond=0).isoformat() + "Z"
+    mtime = file_mtime_utc(model_path)
 
-    # GGUF metadata from llama.cpp (scalar-only, no giant token arrays)
-    metadata: Dict[str, Any] = getattr(llm, "metadata", {}) or {}
+    metadata = metadata or {}
+    runtime = runtime or {}
 
     # General / identity info
     model_id = os.path.splitext(os.path.basename(model_path))[0]
@@ -67,6 +101,7 @@ def build_model_card(llm: Llama, model_path: str) -> Dict[str, Any]:
         "attention": {
             "head_count": md(ap + "attention.head_count"),
             "head_count_kv": md(ap + "attention.head_count_kv"),
+            "key_length": md(ap + "attention.key_length"),
             "layer_norm_rms_epsilon": md(ap + "attention.layer_norm_rms_epsilon"),
         },
         "quantization": {
@@ -75,27 +110,11 @@ def build_model_card(llm: Llama, model_path: str) -> Dict[str, Any]:
         },
     }
 
-    # Runtime view from llama.cpp
-    try:
-        n_ctx_runtime = llm.n_ctx()
-    except Exception:
-        n_ctx_runtime = None
-
-    try:
-        n_vocab = llm.n_vocab()
-    except Exception:
-        n_vocab = None
-
-    try:
-        n_embd = llm.n_embd()
-    except Exception:
-        n_embd = None
-
-    # Parameter count via low-level API (best effort)
-    try:
-        n_params = int(llama_cpp.llama_model_n_params(llm.model))  # type: ignore[attr-defined]
-    except Exception:
-        n_params = None
+    # Runtime view (no context exists when only the header was read)
+    n_ctx_runtime = runtime.get("n_ctx")
+    n_vocab = runtime.get("n_vocab")
+    n_embd = runtime.get("n_embd")
+    n_params = runtime.get("n_params")  # from tensor shapes or llama.cpp
 
     # Tokenizer info (without tokens themselves; those aren't “card” material)
     tokenizer_info = {
@@ -182,6 +201,10 @@ def build_model_card(llm: Llama, model_path: str) -> Dict[str, Any]:
     # Low-level: keep *all* llama.cpp + GGUF spec bits so nothing is lost.
     low_level = {
         "gguf_metadata": metadata,
+        "gguf_header": {
+            "version": runtime.get("gguf_version"),
+            "tensor_count": runtime.get("n_tensors"),
+        },
         "llama_cpp_runtime": {
             "n_ctx_runtime": n_ctx_runtime,
             "n_vocab_runtime": n_vocab,
@@ -207,20 +230,29 @@ def build_model_card(llm: Llama, model_path: str) -> Dict[str, Any]:
 
 def main(argv: Optional[list] = None) -> int:
     parser = argparse.ArgumentParser(description="Generate a structured model-card JSON from a GGUF model.")
-    parser.add_argument(
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
         "--model",
-        required=True,
         help="Path to GGUF model file",
     )
+    target.add_argument(
+        "--models-dir",
+        help="Directory of GGUF models: rebuild changed cards and the catalogue",
+    )
     parser.add_argument(
         "--out",
         help="Output JSON path (default: <model>.model_card.json)",
     )
+    parser.add_argument(
+        "--llama",
+        action="store_true",
+        help="Also load the model with llama-cpp-python (vocab only) for runtime values.",
+    )
     parser.add_argument(
         "--ctx",
         type=int,
         default=512,  # safe, small, and matches llama-cpp default
-        help="Context length used to init Llama. For metadata-only load, 512 is plenty.",
+        help="Context length used to init Llama (--llama). For metadata-only load, 512 is plenty.",
     )
     parser.add_argument(
         "--gpu-layers",
@@ -232,6 +264,12 @@ def main(argv: Optional[list] = None) -> int:
 
     args = parser.parse_args(argv)
 
+    if args.models_dir:
+        # imported here: model_catalogue builds on this module
+        from system.sys_components.swe.swe_components.agent_configurator.design.create_model_card.implementation import model_catalogue
+
+        return model_catalogue.main(["--models-dir", args.models_dir])
+
     model_path = args.model
     if not os.path.exists(model_path):
         print(f"ERROR: model file does not exist: {model_path}", file=sys.stderr)
@@ -239,32 +277,45 @@ def main(argv: Optional[list] = None) -> int:
 
     out_path = args.out or (model_path + ".model_card.json")
 
-    # Load GGUF model in vocab-only mode to avoid loading full weights
     try:
-        effective_ctx = args.ctx if args.ctx and args.ctx > 0 else 512
-
-        llm = Llama(
-            model_path=model_path,
-            vocab_only=True,          # only vocab + metadata, no weights
-            n_ctx=effective_ctx,      # never 0, avoids buggy code paths
-            n_gpu_layers=args.gpu_layers,  # fine as-is
-            embedding=False,
-            logits_all=False,
-            verbose=False,
-)
-
-    except Exception as e:
-        print(f"ERROR: failed to load model with llama_cpp.Llama: {e}", file=sys.stderr)
+        metadata, runtime = read_gguf_header(model_path)
+    except (GGUFError, OSError, struct.error) as e:
+        print(f"ERROR: failed to read GGUF header: {e}", file=sys.stderr)
         return 1
 
-    try:
-        card = build_model_card(llm, model_path)
-    finally:
-        # Be nice and free resources explicitly
+    if args.llama:
+        if Llama is None:
+            print("ERROR: --llama needs llama-cpp-python (pip install llama-cpp-python)", file=sys.stderr)
+            return 1
+
+        # Load GGUF model in vocab-only mode to avoid loading full weights
         try:
-            llm.close()
-        except Exception:
-            pass
+            effective_ctx = args.ctx if args.ctx and args.ctx > 0 else 512
+
+            llm = Llama(
+                model_path=model_path,
+                vocab_only=True,          # only vocab + metadata, no weights
+                n_ctx=effective_ctx,      # never 0, avoids buggy code paths
+                n_gpu_layers=args.gpu_layers,  # fine as-is
+                embedding=False,
+                logits_all=False,
+                verbose=False,
+            )
+        except Exception as e:
+            print(f"ERROR: failed to load model with llama_cpp.Llama: {e}", file=sys.stderr)
+            return 1
+
+        try:
+            # header metadata is typed and complete; llama.cpp adds the runtime values
+            runtime.update({k: v for k, v in runtime_from_llama(llm).items() if v is not None})
+        finally:
+            # Be nice and free resources explicitly
+            try:
+                llm.close()
+            except Exception:
+                pass
+
+    card = build_model_card(metadata, model_path, runtime)
 
     # Dump JSON (pretty, but still deterministic)
     with open(out_path, "w", encoding="utf-8") as f:
@@ -0,0 +1,250 @@
+"""
+Pure-Python GGUF header reader (no llama.cpp needed).
+
+The file is memory-mapped and only the header is touched: the key/value metadata section and,
+on first access, the tensor-info table. Large arrays (the tokenizer's token/score/merge lists)
+are skipped by default and can be decoded on demand, so reading a 50 GB model takes
+milliseconds.
+
+    with GGUFFile(path) as gguf:
+        gguf.metadata["general.architecture"]
+        gguf.array_length("tokenizer.ggml.tokens")
+        gguf.parameter_count()
+"""
+
+import mmap
+import struct
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+GGUF_MAGIC = b"GGUF"
+DEFAULT_ALIGNMENT = 32
+
+# arrays with more elements than this are not decoded into metadata (read_array() decodes them)
+MAX_INLINE_ARRAY = 64
+
+# GGUF value types -> struct format (None: variable size)
+_UINT8, _INT8, _UINT16, _INT16, _UINT32, _INT32, _FLOAT32, _BOOL, _STRING, _ARRAY, _UINT64, _INT64, _FLOAT64 = range(13)
+_SCALAR_FORMATS = {
+    _UINT8: "B",
+    _INT8: "b",
+    _UINT16: "H",
+    _INT16: "h",
+    _UINT32: "I",
+    _INT32: "i",
+    _FLOAT32: "f",
+    _BOOL: "?",
+    _UINT64: "Q",
+    _INT64: "q",
+    _FLOAT64: "d",
+}
+
+
+class GGUFError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TensorInfo:
+    name: str
+    shape: Tuple[int, ...]
+    ggml_type: int
+    offset: int             # relative to the start of the tensor data section
+
+    @property
+    def n_elements(self) -> int:
+        n = 1
+        for d in self.shape:
+            n *= d
+        return n
+
+
+@dataclass(frozen=True)
+class _ArrayRef:
+    elem_type: int
+    count: int
+    offset: int             # first element
+
+
+class GGUFFile:
+    def __init__(self, path: str, max_inline_array: int = MAX_INLINE_ARRAY):
+        self.path = path
+        self.max_inline_array = max_inline_array
+        self._file = open(path, "rb")
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise GGUFError(f"empty file: {path}")
+
+        if self._buf[:4] != GGUF_MAGIC:
+            self.close()
+            raise GGUFError(f"not a GGUF file: {path}")
+        # files written on big-endian hosts have a byte-swapped version field
+        self._endian = "<"
+        (self.version,) = struct.unpack_from("<I", self._buf, 4)
+        if self.version > 0xFFFF:
+            self._endian = ">"
+            (self.version,) = struct.unpack_from(">I", self._buf, 4)
+        if self.version < 2:
+            self.close()
+            raise GGUFError(f"GGUF v{self.version} is not supported (v2+ only): {path}")
+
+        self.tensor_count, self.kv_count = struct.unpack_from(self._endian + "QQ", self._buf, 8)
+        self.metadata: Dict[str, Any] = {}
+        self._arrays: Dict[str, _ArrayRef] = {}
+        self._tensor_table_offset = self._read_metadata(24)
+        self._tensors: Optional[List[TensorInfo]] = None
+        self._data_offset: Optional[int] = None
+
+    # ---- public API ----
+
+    def array_length(self, key: str) -> Optional[int]:
+        ref = self._arrays.get(key)
+        if ref is not None:
+            return ref.count
+        value = self.metadata.get(key)
+        return len(value) if isinstance(value, list) else None
+
+    def read_array(self, key: str) -> Optional[List[Any]]:
+        """Decode an array that was skipped because of its size (e.g. tokenizer.ggml.tokens)."""
+        ref = self._arrays.get(key)
+        if ref is None:
+            value = self.metadata.get(key)
+            return value if isinstance(value, list) else None
+        values, _ = self._read_array_values(ref.elem_type, ref.count, ref.offset)
+        return values
+
+    @property
+    def tensors(self) -> List[TensorInfo]:
+        if self._tensors is None:
+            self._read_tensor_table()
+        return self._tensors  # type: ignore[return-value]
+
+    @property
+    def data_offset(self) -> int:
+        """File offset of the tensor data section."""
+        if self._data_offset is None:
+            self._read_tensor_table()
+        return self._data_offset  # type: ignore[return-value]
+
+    def parameter_count(self) -> int:
+        return sum(t.n_elements for t in self.tensors)
+
+    def close(self) -> None:
+        try:
+            self._buf.close()
+        except Exception:
+            pass
+        self._file.close()
+
+    def __enter__(self) -> "GGUFFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- parsing ----
+
+    def _unpack(self, fmt: str, offset: int) -> Tuple[Any, int]:
+        fmt = self._endian + fmt
+        return struct.unpack_from(fmt, self._buf, offset)[0], offset + struct.calcsize(fmt)
+
+    def _read_string(self, offset: int) -> Tuple[str, int]:
+        n, offset = self._unpack("Q", offset)
+        end = offset + n
+        if end > len(self._buf):
+            raise GGUFError(f"truncated string at offset {offset} in {self.path}")
+        return self._buf[offset:end].decode("utf-8", errors="replace"), end
+
+    def _skip_string(self, offset: int) -> int:
+        n, offset = self._unpack("Q", offset)
+        return offset + n
+
+    def _read_value(self, vtype: int, offset: int) -> Tuple[Any, int]:
+        fmt = _SCALAR_FORMATS.get(vtype)
+        if fmt is not None:
+            return self._unpack(fmt, offset)
+        if vtype == _STRING:
+            return self._read_string(offset)
+        if vtype == _ARRAY:
+            elem_type, offset = self._unpack("I", offset)
+            count, offset = self._unpack("Q", offset)
+            return self._read_array_values(elem_type, count, offset)
+        raise GGUFError(f"unknown GGUF value type {vtype} at offset {offset} in {self.path}")
+
+    def _read_array_values(self, elem_type: int, count: int, offset: int) -> Tuple[List[Any], int]:
+        fmt = _SCALAR_FORMATS.get(elem_type)
+        if fmt is not None:
+            # one struct call for the whole array
+            full = f"{self._endian}{count}{fmt}"
+            return list(struct.unpack_from(full, self._buf, offset)), offset + struct.calcsize(full)
+        values = []
+        for _ in range(count):
+            value, offset = self._read_value(elem_type, offset)
+            values.append(value)
+        return values, offset
+
+    def _skip_array_values(self, elem_type: int, count: int, offset: int) -> int:
+        fmt = _SCALAR_FORMATS.get(elem_type)
+        if fmt is not None:
+            return offset + count * struct.calcsize(self._endian + fmt)
+        if elem_type == _STRING:
+            for _ in range(count):
+                offset = self._skip_string(offset)
+            return offset
+        if elem_type == _ARRAY:
+            for _ in range(count):
+                inner_type, offset = self._unpack("I", offset)
+                inner_count, offset = self._unpack("Q", offset)
+                offset = self._skip_array_values(inner_type, inner_count, offset)
+            return offset
+        raise GGUFError(f"unknown GGUF array element type {elem_type} in {self.path}")
+
+    def _read_metadata(self, offset: int) -> int:
+        for _ in range(self.kv_count):
+            key, offset = self._read_string(offset)
+            vtype, offset = self._unpack("I", offset)
+            if vtype == _ARRAY:
+                elem_type, offset = self._unpack("I", offset)
+                count, offset = self._unpack("Q", offset)
+                if count > self.max_inline_array:
+                    self._arrays[key] = _ArrayRef(elem_type, count, offset)
+                    offset = self._skip_array_values(elem_type, count, offset)
+                else:
+                    self.metadata[key], offset = self._read_array_values(elem_type, count, offset)
+            else:
+                self.metadata[key], offset = self._read_value(vtype, offset)
+        return offset
+
+    def _read_tensor_table(self) -> None:
+        offset = self._tensor_table_offset
+        tensors = []
+        for _ in range(self.tensor_count):
+            name, offset = self._read_string(offset)
+            n_dims, offset = self._unpack("I", offset)
+            dims = struct.unpack_from(f"{self._endian}{n_dims}Q", self._buf, offset)
+            offset += 8 * n_dims
+            ggml_type, offset = self._unpack("I", offset)
+            data_off, offset = self._unpack("Q", offset)
+            tensors.append(TensorInfo(name=name, shape=tuple(dims), ggml_type=ggml_type, offset=data_off))
+        alignment = int(self.metadata.get("general.alignment", DEFAULT_ALIGNMENT) or DEFAULT_ALIGNMENT)
+        self._data_offset = offset + (-offset % alignment)
+        self._tensors = tensors
+
+
+def read_gguf_header(path: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    (metadata, summary) of a GGUF file. summary has what llama.cpp would report at runtime
+    and can be computed from the header: vocab size, embedding size, parameter and tensor count.
+    """
+    with GGUFFile(path) as gguf:
+        arch = gguf.metadata.get("general.architecture")
+        summary = {
+            "gguf_version": gguf.version,
+            "n_vocab": gguf.array_length("tokenizer.ggml.tokens"),
+            "n_embd": gguf.metadata.get(f"{arch}.embedding_length") if arch else None,
+            "n_params": gguf.parameter_count(),
+            "n_tensors": gguf.tensor_count,
+        }
+        return dict(gguf.metadata), summary
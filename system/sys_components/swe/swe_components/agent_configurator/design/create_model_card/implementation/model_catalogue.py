@@ -0,0 +1,245 @@
+"""
+Model-card catalogue for a whole models directory.
+
+Scans <root> for *.gguf, regenerates <model>.model_card.json only for new or changed files
+(process pool, or serially with --workers 0), and writes <root>/model_catalogue.json with one
+summary row per model that agent_configurator can query:
+
+    python model_catalogue.py --models-dir /models [--workers 8] [--force]
+
+Change detection uses <root>/.model_card_index.json, keyed by relative path: unchanged
+size + mtime means unchanged; otherwise a digest of the GGUF header (metadata and tensor
+table, everything before the tensor data) decides whether the card has to be rebuilt.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from system.sys_components.swe.swe_components.agent_configurator.design.create_model_card.implementation.create_model_card import (
+    build_model_card,
+    file_mtime_utc,
+)
+from system.sys_components.swe.swe_components.agent_configurator.design.create_model_card.implementation.gguf_reader import (
+    GGUFFile,
+    read_gguf_header,
+)
+
+INDEX_FILE = ".model_card_index.json"
+CATALOGUE_FILE = "model_catalogue.json"
+# files that do not parse as GGUF (their card build fails anyway) are digested by their head
+FALLBACK_DIGEST_BYTES = 1024 * 1024
+DIGEST_READ_BYTES = 8 * 1024 * 1024
+
+# llama.cpp llama_ftype (general.file_type)
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1", 10: "Q2_K",
+    11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M", 16: "Q5_K_S",
+    17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S", 22: "IQ3_XS",
+    23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M", 28: "IQ2_S",
+    29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16", 36: "TQ1_0", 37: "TQ2_0",
+}
+
+
+def header_digest(path: str) -> str:
+    """sha256 of everything before the tensor data: metadata, tokenizer arrays and tensor table."""
+    try:
+        with GGUFFile(path) as gguf:
+            end = gguf.data_offset
+    except Exception:
+        end = FALLBACK_DIGEST_BYTES
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while end > 0:
+            block = f.read(min(end, DIGEST_READ_BYTES))
+            if not block:
+                break
+            h.update(block)
+            end -= len(block)
+    return h.hexdigest()
+
+
+def card_path_for(model_path: str) -> str:
+    return model_path + ".model_card.json"
+
+
+def summarize(card: Dict[str, Any], rel_path: str) -> Dict[str, Any]:
+    """Catalogue row: the fields models are selected by."""
+    arch = card["availability_or_operational_profile"]["architecture"]
+    file_type = arch["quantization"]["file_type_raw"]
+    return {
+        "path": rel_path,
+        "model_id": card["identity"]["model_id"],
+        "display_name": card["identity"]["display_name"],
+        "architecture": card["identity"]["architecture"],
+        "parameter_count": card["identity"]["parameter_count"],
+        "quantization": FILE_TYPES.get(file_type, str(file_type) if file_type is not None else None),
+        "context_length": arch["context_length_train"],
+        "size_bytes": card["credentials_or_provenance"]["source_file"]["size_bytes"],
+        "card": card_path_for(rel_path),
+    }
+
+
+def _build_card(model_path: str, rel_path: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """Process-pool worker: (rel_path, catalogue row, error)."""
+    try:
+        metadata, runtime = read_gguf_header(model_path)
+        card = build_model_card(metadata, model_path, runtime)
+        tmp = card_path_for(model_path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(card, f, ensure_ascii=False, indent=2, sort_keys=False)
+        os.replace(tmp, card_path_for(model_path))
+        return rel_path, summarize(card, rel_path), None
+    except Exception as e:
+        return rel_path, None, f"{type(e).__name__}: {e}"
+
+
+def _refresh_card_mtime(model_path: str) -> None:
+    """The file was touched but its header is unchanged: only the card's mtime is out of date."""
+    path = Path(card_path_for(model_path))
+    card = _load_json(path, None)
+    if card is None:
+        return
+    card["credentials_or_provenance"]["source_file"]["last_modified_utc"] = file_mtime_utc(model_path)
+    _write_json(path, card)
+
+
+def _load_json(path: Path, default: Any) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _write_json(path: Path, data: Any) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def refresh_catalogue(root: Path, workers: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Bring cards, index and catalogue of `root` up to date; returns the catalogue.
+    workers: card-building processes (None: CPU count; spawned, never forked), 0 builds them
+    in this process, which is what callers inside a threaded agent should use.
+    """
+    root = Path(root)
+    t0 = time.perf_counter()
+    index: Dict[str, Dict[str, Any]] = {} if force else _load_json(root / INDEX_FILE, {})
+
+    current: Dict[str, Dict[str, Any]] = {}
+    todo: List[str] = []
+    for path in sorted(root.rglob("*.gguf")):
+        rel = path.relative_to(root).as_posix()
+        st = path.stat()
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        old = index.get(rel)
+        card_exists = os.path.exists(card_path_for(str(path)))
+        if old is not None and card_exists and old.get("row") is not None:
+            if old["size"] == entry["size"] and old["mtime_ns"] == entry["mtime_ns"]:
+                current[rel] = old
+                continue
+            entry["digest"] = header_digest(str(path))
+            if entry["digest"] == old.get("digest") and old["size"] == entry["size"]:
+                # touched, not changed
+                _refresh_card_mtime(str(path))
+                current[rel] = {**old, **entry}
+                continue
+        entry.setdefault("digest", header_digest(str(path)))
+        current[rel] = entry
+        todo.append(rel)
+
+    errors: Dict[str, str] = {}
+    if todo and workers == 0:
+        results = [_build_card(str(root / rel), rel) for rel in todo]
+    elif todo:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            results = [f.result() for f in [pool.submit(_build_card, str(root / rel), rel) for rel in todo]]
+    else:
+        results = []
+    for rel, row, error in results:
+        if error is not None:
+            errors[rel] = error
+            current.pop(rel)
+        else:
+            current[rel]["row"] = row
+
+    _write_json(root / INDEX_FILE, current)
+    catalogue = {
+        "root": str(root.resolve()),
+        "generated_at_unix": int(time.time()),
+        "models": [current[rel]["row"] for rel in sorted(current)],
+        "errors": errors,
+    }
+    _write_json(root / CATALOGUE_FILE, catalogue)
+    logging.info(
+        "Catalogue: %d model(s), %d card(s) rebuilt, %d error(s), removed %d in %.2f s",
+        len(current),
+        len(todo) - len(errors),
+        len(errors),
+        len(set(index) - set(current) - set(errors)),
+        time.perf_counter() - t0,
+    )
+    return catalogue
+
+
+def load_catalogue(root: Path) -> Dict[str, Any]:
+    return _load_json(Path(root) / CATALOGUE_FILE, {"root": str(root), "models": [], "errors": {}})
+
+
+def query_catalogue(
+    catalogue: Dict[str, Any],
+    architecture: Optional[str] = None,
+    min_params: Optional[int] = None,
+    max_params: Optional[int] = None,
+    quantization: Optional[str] = None,
+    min_context: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Catalogue rows matching all given filters, smallest models first."""
+    rows = []
+    for row in catalogue.get("models", []):
+        params = row.get("parameter_count")
+        context = row.get("context_length")
+        if architecture is not None and row.get("architecture") != architecture:
+            continue
+        if quantization is not None and (row.get("quantization") or "").upper() != quantization.upper():
+            continue
+        if min_params is not None and (params is None or params < min_params):
+            continue
+        if max_params is not None and (params is None or params > max_params):
+            continue
+        if min_context is not None and (context is None or context < min_context):
+            continue
+        rows.append(row)
+    return sorted(rows, key=lambda r: (r.get("parameter_count") or 0, r.get("size_bytes") or 0))
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or refresh the model-card catalogue of a models directory.")
+    parser.add_argument("--models-dir", required=True, help="Directory scanned recursively for *.gguf")
+    parser.add_argument("--workers", type=int, default=None, help="Card-building processes (default: CPU count, 0: none)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every card, ignoring the index")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if not os.path.isdir(args.models_dir):
+        print(f"ERROR: models directory does not exist: {args.models_dir}", file=sys.stderr)
+        return 1
+    catalogue = refresh_catalogue(Path(args.models_dir), workers=args.workers, force=args.force)
+    for rel, error in catalogue["errors"].items():
+        print(f"ERROR: {rel}: {error}", file=sys.stderr)
+    return 1 if catalogue["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
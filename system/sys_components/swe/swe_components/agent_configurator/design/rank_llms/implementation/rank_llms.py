@@ -1,10 +1,23 @@
 #!/usr/bin/env python
 import argparse
+import json
+import os
+import re
+import sys
+import time
 from dataclasses import dataclass
+from pathlib import Path
 from typing import List, Optional, Dict
 
+import numpy as np
 import pandas as pd
-from datasets import load_dataset
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
 
 
 # -------------------------
@@ -25,13 +38,50 @@ CODE_MODEL_KEYWORDS = [
     "deepseek-coder", "qwen2.5-coder", "replit", "magicoder",
 ]
 
-# rough VRAM per billion params (includes some overhead)
+LEADERBOARD_DATASET = "open-llm-leaderboard/contents"
+
+# local Parquet copy of the leaderboard; only the columns below are kept
+DEFAULT_CACHE_PATH = Path(os.environ.get(
+    "RANK_LLMS_CACHE",
+    Path.home() / ".cache" / "swe" / "open_llm_leaderboard.parquet",
+))
+
+# row filters applied while reading the cache (same as base_filters); column -> required value
+PUSHDOWN_FILTERS = {
+    "Available on the hub": True,
+    "Official Providers": False,
+    "Flagged": False,
+}
+
+# GB of weights per billion params: bytes per param of the GGUF types, block scales included;
+# runtime overhead is counted separately (RUNTIME_OVERHEAD_GB)
 PRECISION_FACTORS = {
-    "q4": 0.6,    # 4-bit quant
-    "q8": 1.2,    # 8-bit quant
-    "fp16": 2.3,  # 16-bit weights
+    "q4": 0.56,   # Q4_K_M, ~4.5 bits per weight
+    "q8": 1.06,   # Q8_0, 8.5 bits per weight
+    "fp16": 2.0,  # 16-bit weights
 }
 
+# bytes per KV cache element (llama.cpp cache types; q8_0/q4_0 include the block scales)
+KV_CACHE_BYTES = {
+    "f16": 2.0,
+    "q8_0": 34 / 32,
+    "q4_0": 18 / 32,
+}
+
+# CUDA context + compute buffers, independent of the model
+RUNTIME_OVERHEAD_GB = 0.8
+
+GIB = 1024 ** 3
+
+# shape fallback when no model card is known: layer count by size (log-interpolated),
+# GQA with 8 KV heads of 128 dims, as in the Llama/Qwen/Mistral families
+_LAYERS_BY_PARAMS_B = ((0.5, 1.5, 3.0, 7.0, 13.0, 34.0, 70.0, 180.0), (24, 28, 28, 32, 40, 60, 80, 96))
+DEFAULT_KV_HEADS = 8
+DEFAULT_HEAD_DIM = 128
+# trained context assumed for a model without a card that states it: conservative, so the
+# planner does not promise a context the model was never trained for
+DEFAULT_N_CTX_TRAIN = 8192
+
 
 @dataclass
 class HardwareConfig:
@@ -39,23 +89,109 @@ class HardwareConfig:
     cpu_ram_gb: float
     precision: str
     max_vram_frac: float = 0.9  # use at most this fraction of VRAM
-
-    def max_model_params_b(self, moe: bool = False) -> float:
-        """Return upper bound on params (in billions) we can comfortably fit."""
+    max_ram_frac: float = 0.75  # use at most this fraction of RAM for offloaded layers
+    context_length: int = 16384  # context the model has to run with
+    kv_cache_type: str = "f16"
+    allow_offload: bool = False  # count models that only fit with layers in RAM
+    assumed_n_ctx_train: int = DEFAULT_N_CTX_TRAIN  # trained context of models whose card does not state it
+
+    @property
+    def vram_budget_gb(self) -> float:
+        return self.gpu_vram_gb * self.max_vram_frac
+
+    @property
+    def ram_budget_gb(self) -> float:
+        return self.cpu_ram_gb * self.max_ram_frac
+
+    def max_model_params_b(self) -> float:
+        """
+        Return upper bound on params (in billions) whose weights fit in the VRAM budget,
+        without KV cache. MoE models count in full: every expert stays resident.
+        """
         factor = PRECISION_FACTORS[self.precision]
-        effective_vram = self.gpu_vram_gb * self.max_vram_frac
-        # crude MoE discount: only ~1/4 experts active
-        moe_discount = 0.25 if moe else 1.0
-        return (effective_vram / factor) / moe_discount
+        return max(self.vram_budget_gb - RUNTIME_OVERHEAD_GB, 0.0) / factor
+
+
+def used_columns() -> List[str]:
+    """Every column rank_models and its filters can read."""
+    cols = ["Model", "#Params (B)", "Type", "Precision", "Architecture", "MoE", *PUSHDOWN_FILTERS]
+    for candidates in TASK_TO_METRIC_CANDIDATES.values():
+        cols += candidates
+    return list(dict.fromkeys(cols))
+
+
+# -------------------------
+# Leaderboard cache
+# -------------------------
+
+def _load_hub_dataset():
+    # `datasets` takes seconds to import; only the download paths pay for it
+    try:
+        from datasets import load_dataset
+    except Exception as e:
+        raise RuntimeError("Downloading the leaderboard needs `pip install datasets`") from e
+    return load_dataset(LEADERBOARD_DATASET, split="train")
+
+
+def _read_snapshot(source: Optional[str]) -> "pa.Table":
+    """A leaderboard snapshot as an Arrow table: a local .parquet/.csv/.arrow file, or the hub."""
+    if source is None:
+        return _load_hub_dataset().data.table
+    if source.endswith(".parquet"):
+        return pq.read_table(source)
+    if source.endswith(".csv"):
+        return pa.Table.from_pandas(pd.read_csv(source), preserve_index=False)
+    if source.endswith((".arrow", ".feather")):
+        import pyarrow.feather as feather
+        return feather.read_table(source)
+    raise ValueError(f"Unsupported snapshot format: {source}")
+
+
+def refresh_leaderboard_cache(
+    cache_path: Path = DEFAULT_CACHE_PATH,
+    source: Optional[str] = None,
+    force: bool = False,
+) -> bool:
+    """
+    Rewrite the Parquet cache from a snapshot (a local file, or the hub when source is None),
+    keeping only used_columns(). A file snapshot that is not newer than the one the cache was
+    built from is skipped unless force. The new file replaces the old one atomically, so
+    concurrent readers see either the old or the new cache. Returns True if rewritten.
+    """
+    if pq is None:
+        raise RuntimeError("The leaderboard cache needs `pip install pyarrow`")
+    cache_path = Path(cache_path)
+    snapshot_mtime = os.path.getmtime(source) if source is not None else time.time()
+    if not force and source is not None and cache_path.exists():
+        cached = (pq.read_schema(cache_path).metadata or {}).get(b"snapshot_mtime")
+        if cached is not None and snapshot_mtime <= float(cached):
+            print(f"Leaderboard cache is up to date with {source}")
+            return False
+
+    table = _read_snapshot(source)
+    table = table.select([c for c in used_columns() if c in table.column_names])
+    table = table.replace_schema_metadata({
+        b"snapshot_source": (source or LEADERBOARD_DATASET).encode("utf-8"),
+        b"snapshot_mtime": repr(snapshot_mtime).encode("ascii"),
+    })
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, cache_path)
+    print(f"Leaderboard cache written: {cache_path} ({table.num_rows} rows, {table.num_columns} columns)")
+    return True
 
 
 # -------------------------
 # Core logic
 # -------------------------
 
-def load_leaderboard_df() -> pd.DataFrame:
+def load_leaderboard_df(cache_path: Path = DEFAULT_CACHE_PATH, offline: bool = False) -> pd.DataFrame:
     """
-    Load Open LLM Leaderboard v2 'contents' dataset as a pandas DataFrame.
+    Load the Open LLM Leaderboard v2 'contents' table as a pandas DataFrame, from the local
+    Parquet cache. Only used_columns() are read, and the hub/provider/flagged filters of
+    base_filters are pushed down into the Parquet scan.
 
     Dataset has columns like:
     - 'Model' (hf repo id)
@@ -63,10 +199,32 @@ def load_leaderboard_df() -> pd.DataFrame:
     - 'Average ⬆️'
     - 'MATH Lvl 5', 'MMLU-PRO', etc.
     - 'Available on the hub', 'Official Providers', 'Type', 'MoE', ...
+
+    Without a cache the table is downloaded once (refresh_leaderboard_cache), unless offline.
     """
-    ds = load_dataset("open-llm-leaderboard/contents", split="train")
-    df = ds.to_pandas()
-    return df
+    if pq is None:
+        # no pyarrow: the old path, full download every time
+        if offline:
+            raise RuntimeError("Offline mode needs the Parquet cache, i.e. `pip install pyarrow`")
+        return _load_hub_dataset().to_pandas()
+
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        if offline:
+            raise FileNotFoundError(
+                f"No leaderboard cache at {cache_path}; create it with --refresh-cache <snapshot file> "
+                f"(or --refresh-cache on a machine with network access)"
+            )
+        refresh_leaderboard_cache(cache_path)
+
+    available = set(pq.read_schema(cache_path).names)
+    filters = [(col, "=", value) for col, value in PUSHDOWN_FILTERS.items() if col in available]
+    table = pq.read_table(
+        cache_path,
+        columns=[c for c in used_columns() if c in available],
+        filters=filters or None,
+    )
+    return table.to_pandas()
 
 
 def pick_metric_column(df: pd.DataFrame, task_type: str) -> str:
@@ -84,37 +242,123 @@ def pick_metric_column(df: pd.DataFrame, task_type: str) -> str:
     )
 
 
-def estimate_vram_gb(params_b: float, precision: str, moe: bool) -> float:
-    factor = PRECISION_FACTORS[precision]
-    moe_discount = 0.25 if moe else 1.0
-    return params_b * factor * moe_discount
+def estimate_vram_gb(params_b, precision: str):
+    """
+    Weight memory in GB; scalars or arrays. MoE models are sized by their total params:
+    only a few experts run per token, but all of them are loaded.
+    """
+    return params_b * PRECISION_FACTORS[precision]
 
 
-def filter_by_hardware(df: pd.DataFrame, hw: HardwareConfig) -> pd.DataFrame:
-    # Keep only rows with a valid param count
+# -------------------------
+# Memory planner
+# -------------------------
+
+def model_key(name: str) -> str:
+    """Join key between leaderboard repo ids and model cards: 'Qwen/Qwen2.5-7B-Instruct' -> 'qwen257binstruct'."""
+    return re.sub(r"[^0-9a-z]", "", str(name).rsplit("/", 1)[-1].lower())
+
+
+def shapes_from_model_cards(cards_dir: Path) -> pd.DataFrame:
+    """
+    Attention shapes from the *.model_card.json files under cards_dir (create_model_card):
+    one row per card with model_key, n_layers, n_kv_heads, head_dim, n_ctx_train.
+    """
+    rows = []
+    for path in sorted(Path(cards_dir).rglob("*.model_card.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                card = json.load(f)
+            arch = card["availability_or_operational_profile"]["architecture"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping model card {path}: {e}", file=sys.stderr)
+            continue
+        heads = arch["attention"].get("head_count")
+        embd = arch.get("embedding_length")
+        # K width per head; some families (Gemma) set it apart from embedding_length / head_count
+        head_dim = arch["attention"].get("key_length") or (embd // heads if embd and heads else None)
+        row = {
+            "n_layers": arch.get("block_count"),
+            "n_kv_heads": arch["attention"].get("head_count_kv") or heads,
+            "head_dim": head_dim,
+            "n_ctx_train": arch.get("context_length_train"),
+        }
+        for name in {card["identity"].get("display_name"), card["identity"].get("model_id")}:
+            if name:
+                rows.append({"model_key": model_key(name), **row})
+    shapes = pd.DataFrame(rows, columns=["model_key", "n_layers", "n_kv_heads", "head_dim", "n_ctx_train"])
+    return shapes.drop_duplicates("model_key")
+
+
+def plan_memory(df: pd.DataFrame, hw: HardwareConfig, shapes: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Memory plan per row, vectorised over the table. Needs '#Params (B)'; MoE models are sized by total params.
+
+    Memory = weights + KV cache for hw.context_length + runtime overhead. The overhead stays
+    on the GPU; weights and KV cache are split by layer, so the GPU takes the fraction of
+    layers that fits in the VRAM budget and the rest goes to the RAM budget. Attention
+    shapes come from `shapes` (shapes_from_model_cards) where a card matches, otherwise from
+    the size heuristic. Adds columns:
+
+    - weights_gb, kv_gb, est_vram_gb (all on the GPU), gpu_layer_frac
+    - fits_vram, fits_offload: at hw.context_length
+    - max_ctx_vram, max_ctx_offload: longest context that fits, capped at the trained context
+      (n_ctx_train from the card, else hw.assumed_n_ctx_train; ctx_from_card says which)
+    """
     df = df.copy()
+    params_b = df["#Params (B)"].to_numpy(dtype=float)
+
+    layers = np.rint(np.interp(np.log(np.maximum(params_b, 0.1)), np.log(_LAYERS_BY_PARAMS_B[0]), _LAYERS_BY_PARAMS_B[1]))
+    kv_heads = np.full(len(df), float(DEFAULT_KV_HEADS))
+    head_dim = np.full(len(df), float(DEFAULT_HEAD_DIM))
+    n_ctx_train = np.full(len(df), np.nan)
+    if shapes is not None and len(shapes) and "Model" in df.columns:
+        known = pd.DataFrame({"model_key": df["Model"].map(model_key)}).merge(shapes, on="model_key", how="left")
+        layers = known["n_layers"].astype(float).fillna(pd.Series(layers)).to_numpy()
+        kv_heads = known["n_kv_heads"].astype(float).fillna(pd.Series(kv_heads)).to_numpy()
+        head_dim = known["head_dim"].astype(float).fillna(pd.Series(head_dim)).to_numpy()
+        n_ctx_train = known["n_ctx_train"].astype(float).to_numpy()
+    ctx_from_card = ~np.isnan(n_ctx_train)
+    n_ctx_train = np.where(ctx_from_card, n_ctx_train, float(hw.assumed_n_ctx_train))
+
+    # K and V, per layer, per token
+    kv_gb_per_token = 2 * layers * kv_heads * head_dim * KV_CACHE_BYTES[hw.kv_cache_type] / GIB
+    weights_gb = estimate_vram_gb(params_b, hw.precision)
+    kv_gb = kv_gb_per_token * hw.context_length
+    layered_gb = weights_gb + kv_gb
+
+    gpu_free = max(hw.vram_budget_gb - RUNTIME_OVERHEAD_GB, 0.0)
+    gpu_layer_frac = np.clip(gpu_free / np.maximum(layered_gb, 1e-9), 0.0, 1.0)
+    ram_gb = layered_gb * (1.0 - gpu_layer_frac)
+
+    def max_ctx(budget_gb: float) -> np.ndarray:
+        tokens = np.floor((budget_gb - weights_gb) / kv_gb_per_token)
+        return np.clip(np.minimum(tokens, n_ctx_train), 0, None)
+
+    df["weights_gb"] = weights_gb.round(2)
+    df["kv_gb"] = kv_gb.round(2)
+    df["est_vram_gb"] = (layered_gb + RUNTIME_OVERHEAD_GB).round(2)
+    df["gpu_layer_frac"] = gpu_layer_frac.round(2)
+    df["max_ctx_vram"] = max_ctx(gpu_free)
+    df["max_ctx_offload"] = max_ctx(gpu_free + hw.ram_budget_gb)
+    df["ctx_from_card"] = ctx_from_card
+    df["fits_vram"] = df["max_ctx_vram"].to_numpy() >= hw.context_length
+    df["fits_offload"] = (df["max_ctx_offload"].to_numpy() >= hw.context_length) & (ram_gb <= hw.ram_budget_gb)
+    return df
+
+
+def filter_by_hardware(df: pd.DataFrame, hw: HardwareConfig, shapes: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Rows that can run hw.context_length: fully on the GPU, or with RAM offload if hw.allow_offload."""
     if "#Params (B)" not in df.columns:
         raise ValueError("Leaderboard table has no '#Params (B)' column")
 
-    df = df[df["#Params (B)"].notna()]
+    # Keep only rows with a valid param count
+    df = df[df["#Params (B)"].notna()].copy()
     df["#Params (B)"] = df["#Params (B)"].astype(float)
 
-    # MoE flag might be missing; treat missing as False
-    moe_col = "MoE"
-    if moe_col in df.columns:
-        moe_flags = df[moe_col].fillna(False).astype(bool)
-    else:
-        moe_flags = pd.Series([False] * len(df), index=df.index)
-
-    df["est_vram_gb"] = [
-        estimate_vram_gb(params_b, hw.precision, bool(moe))
-        for params_b, moe in zip(df["#Params (B)"], moe_flags)
-    ]
-
-    vram_limit = hw.gpu_vram_gb * hw.max_vram_frac
-    df = df[df["est_vram_gb"] <= vram_limit]
-
-    return df
+    df = plan_memory(df, hw, shapes)
+    fits = df["fits_offload"] if hw.allow_offload else df["fits_vram"]
+    return df[fits]
 
 
 def base_filters(df: pd.DataFrame, chat_only: bool) -> pd.DataFrame:
@@ -154,10 +398,11 @@ def rank_models(
     hw: HardwareConfig,
     chat_only: bool,
     top_k: int,
+    shapes: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
     df = base_filters(df, chat_only=chat_only)
     df = filter_for_task_type(df, task_type=task_type)
-    df = filter_by_hardware(df, hw)
+    df = filter_by_hardware(df, hw, shapes)
 
     metric_col = pick_metric_column(df, task_type)
     df = df[df[metric_col].notna()]
@@ -173,6 +418,9 @@ def rank_models(
         "Precision" if "Precision" in df.columns else None,
         "Architecture" if "Architecture" in df.columns else None,
         "est_vram_gb",
+        "kv_gb",
+        "gpu_layer_frac" if hw.allow_offload else None,
+        "max_ctx_offload" if hw.allow_offload else "max_ctx_vram",
     ]
     keep_cols = [c for c in keep_cols if c is not None and c in df.columns]
 
@@ -203,7 +451,42 @@ def parse_args() -> argparse.Namespace:
         "--cpu-ram-gb",
         type=float,
         default=128.0,
-        help="System RAM in GB (currently not heavily used, but kept for future offload logic).",
+        help="System RAM in GB (holds the layers that do not fit in VRAM with --allow-offload).",
+    )
+    p.add_argument(
+        "--max-ram-frac",
+        type=float,
+        default=0.75,
+        help="Use at most this fraction of system RAM for offloaded layers.",
+    )
+    p.add_argument(
+        "--context-length",
+        type=int,
+        default=16384,
+        help="Context the model has to run with; its KV cache counts against memory.",
+    )
+    p.add_argument(
+        "--kv-cache-type",
+        choices=list(KV_CACHE_BYTES.keys()),
+        default="f16",
+        help="llama.cpp KV cache type.",
+    )
+    p.add_argument(
+        "--allow-offload",
+        action="store_true",
+        help="Also keep models that only fit with some layers in system RAM (slower).",
+    )
+    p.add_argument(
+        "--model-cards",
+        type=Path,
+        default=None,
+        help="Directory with *.model_card.json files; their layer/head counts replace the size heuristic.",
+    )
+    p.add_argument(
+        "--assumed-ctx-train",
+        type=int,
+        default=DEFAULT_N_CTX_TRAIN,
+        help="Trained context assumed for models without a model card stating it; caps their usable context.",
     )
     p.add_argument(
         "--precision",
@@ -228,6 +511,29 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="If set, do NOT restrict to chat/instruct models.",
     )
+    p.add_argument(
+        "--cache",
+        type=Path,
+        default=DEFAULT_CACHE_PATH,
+        help="Local Parquet copy of the leaderboard (env RANK_LLMS_CACHE).",
+    )
+    p.add_argument(
+        "--offline",
+        action="store_true",
+        help="Never touch the network; fail if there is no cache.",
+    )
+    p.add_argument(
+        "--refresh-cache",
+        nargs="?",
+        const="hub",
+        metavar="SNAPSHOT",
+        help="Rewrite the cache from a snapshot file (.parquet/.csv/.arrow), or from the hub without an argument.",
+    )
+    p.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="With --refresh-cache: rewrite even if the snapshot is not newer than the cache.",
+    )
     return p.parse_args()
 
 
@@ -239,10 +545,29 @@ def main():
         cpu_ram_gb=args.cpu_ram_gb,
         precision=args.precision,
         max_vram_frac=args.max_vram_frac,
+        max_ram_frac=args.max_ram_frac,
+        context_length=args.context_length,
+        kv_cache_type=args.kv_cache_type,
+        allow_offload=args.allow_offload,
+        assumed_n_ctx_train=args.assumed_ctx_train,
     )
+    shapes = shapes_from_model_cards(args.model_cards) if args.model_cards else None
+    if hw.context_length > hw.assumed_n_ctx_train:
+        print(
+            f"Note: models without a model card are assumed to be trained for {hw.assumed_n_ctx_train} tokens "
+            f"and do not fit {hw.context_length}; pass --model-cards or --assumed-ctx-train",
+            file=sys.stderr,
+        )
+
+    if args.refresh_cache:
+        source = None if args.refresh_cache == "hub" else args.refresh_cache
+        if source is None and args.offline:
+            print("ERROR: --offline cannot refresh from the hub; pass a snapshot file", file=sys.stderr)
+            sys.exit(1)
+        refresh_leaderboard_cache(args.cache, source=source, force=args.force_refresh)
 
     print(f"Loading Open LLM Leaderboard table...")
-    df = load_leaderboard_df()
+    df = load_leaderboard_df(args.cache, offline=args.offline)
 
     chat_only = not args.no_chat_only
 
@@ -252,6 +577,7 @@ def main():
         hw=hw,
         chat_only=chat_only,
         top_k=args.top_k,
+        shapes=shapes,
     )
 
     pd.set_option("display.max_columns", None)
@@ -259,7 +585,8 @@ def main():
     print()
     print(f"Top {len(ranked)} models for task='{args.task_type}' "
           f"under ~{hw.gpu_vram_gb}GB VRAM ({hw.precision}, "
-          f"≤{hw.max_vram_frac*100:.0f}% of VRAM):")
+          f"≤{hw.max_vram_frac*100:.0f}% of VRAM, {hw.context_length} context"
+          f"{f', offload to ≤{hw.ram_budget_gb:.0f}GB RAM' if hw.allow_offload else ''}):")
     print(ranked.to_string(index=False))
 
 
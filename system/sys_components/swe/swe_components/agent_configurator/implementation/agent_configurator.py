@@ -1,8 +1,11 @@
 #interfaces
 from pathlib import Path
+from sos_interfaces.if_system_configuration import resources_data
 from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import agent_configurator_port, leaderboard, llm_config, llm_interview_results, model_card
-from system.sys_components.swe.swe_interfaces.implementation.if_resources import resources_data
 from system.sys_components.swe.swe_interfaces.implementation.if_task import task_spec
+# functions
+from system.sys_components.swe.swe_components.llm.local.implementation.autotune import load_tuning, physical_cores
+from system.sys_components.swe.swe_components.agent_configurator.design.create_model_card.implementation.model_catalogue import load_catalogue, query_catalogue, refresh_catalogue
 
 class agent_configurator (agent_configurator_port):
     def rank_llm_options(self, task: task_spec, resources: resources_data) -> leaderboard:
@@ -10,9 +13,34 @@ class agent_configurator (agent_configurator_port):
     def choose_optimal_llm (self, task: task_spec):
         ...
     def configure_llm (self, model: str, task: dict[str, str]) -> llm_config:
-        ...
+        '''
+        Hardware settings come from the autotune table for (model, this host) when present
+        (see llm/local/implementation/autotune.py), otherwise from core count.
+        task may override n_ctx / max_tokens / temperature.
+        '''
+        tuned = load_tuning(model) or {}
+        return llm_config(
+            model_path=model,
+            n_ctx=int(task.get("n_ctx", 16384)),
+            n_gpu_layers=int(tuned.get("n_gpu_layers", -1)),
+            n_batch=int(tuned.get("n_batch", 512)),
+            n_threads=int(tuned.get("n_threads", physical_cores())),
+            temperature=float(task.get("temperature", 0.25)),
+            top_p=0.9,
+            repeat_penalty=1.1,
+            max_tokens=int(task.get("max_tokens", 2048)),
+        )
     def create_model_card(self, model_path: Path) -> model_card:
         ...
+    def find_models(self, models_root: Path, refresh: bool = True, **filters) -> list[dict]:
+        '''
+        Catalogue rows of the local models under models_root, smallest first. filters:
+        architecture, min_params, max_params, quantization, min_context (see query_catalogue).
+        refresh only rebuilds cards of new or changed files, in this process (no worker pool
+        inside the agent).
+        '''
+        catalogue = refresh_catalogue(models_root, workers=0) if refresh else load_catalogue(models_root)
+        return query_catalogue(catalogue, **filters)
     def interview_llm(self, task: task_spec, model: Path) -> llm_interview_results:
         ...
     
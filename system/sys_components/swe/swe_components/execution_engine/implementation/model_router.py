@@ -0,0 +1,174 @@
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import llm_config
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import LocalLlmError, llm_answer
+from system.sys_components.swe.swe_interfaces.implementation.if_validator import validation_result
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm import percentile
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm_v1 import local_llm_engine
+
+LATENCY_SAMPLES = 1000      # latencies kept per tier for the percentiles
+
+# errors after which a bigger model may still succeed
+_ESCALATE_ON = {"LLM_CONTEXT_OVERFLOW", "LLM_OUTPUT_INVALID"}
+
+
+@dataclass(frozen=True)
+class model_tier:
+    """
+    One model of the routing ladder. A task goes to the first tier (smallest first) that accepts
+    it; empty operations / unit_types accept everything.
+    """
+    name: str
+    settings: llm_config
+    operations: Tuple[str, ...] = ()            # e.g. ("review", "test", "stitch")
+    unit_types: Tuple[str, ...] = ()
+    max_input_tokens: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class task_profile:
+    operation: str
+    unit_type: Optional[str]
+    input_tokens: int
+
+
+@dataclass
+class TierStats:
+    routed: int = 0                 # first choice for a task
+    escalated_in: int = 0           # received a task a smaller tier failed
+    runs: int = 0
+    validation_failures: int = 0
+    errors: int = 0
+    latency_p50_s: Optional[float] = None
+    latency_p95_s: Optional[float] = None
+    latency_mean_s: Optional[float] = None
+
+
+@dataclass
+class routed_answer:
+    answer: llm_answer
+    tier: str
+    profile: task_profile
+    attempts: List[str] = field(default_factory=list)    # tiers tried, in order
+    validation: Optional[validation_result] = None
+
+
+def task_operation(task_order: Mapping[str, Any]) -> str:
+    """Operation of a scheduler task order: review/test batches use artifact_operation."""
+    for key in ("artifact_operation", "operation", "operator_activity"):
+        value = task_order.get(key)
+        if isinstance(value, str) and value:
+            return value.lower()
+    return "implement"
+
+
+class model_router:
+    """
+    Dispatches tasks to a ladder of local models by difficulty (operation, unit type, input
+    size), so trivial review/format tasks do not pay large-model latency. When the validator
+    rejects an answer, or the model overflows its context / produces undecodable output, the
+    task is retried on the next bigger tier.
+    """
+
+    def __init__(self, tiers: Sequence[model_tier], llm: Optional[local_llm_engine] = None):
+        if not tiers:
+            raise ValueError("model_router needs at least one tier")
+        self.tiers = list(tiers)
+        self.llm = llm or local_llm_engine(lazy_load=True)
+        self._stats: Dict[str, TierStats] = {t.name: TierStats() for t in self.tiers}
+        self._latency: Dict[str, Deque[float]] = {t.name: deque(maxlen=LATENCY_SAMPLES) for t in self.tiers}
+
+    def classify(self, prompt: str, task_order: Mapping[str, Any], unit_type: Optional[str] = None) -> Tuple[int, task_profile]:
+        # token counts differ a little between vocabularies; the smallest tier's is good enough
+        n = self.llm.engine_for(self.tiers[0].settings).tokens.count(prompt)
+        profile = task_profile(operation=task_operation(task_order), unit_type=unit_type, input_tokens=n)
+        for i, tier in enumerate(self.tiers):
+            if self._accepts(tier, profile):
+                return i, profile
+        return len(self.tiers) - 1, profile
+
+    def run(
+        self,
+        prompt: str,
+        task_order: Mapping[str, Any],
+        unit_type: Optional[str] = None,
+        validate: Optional[Callable[[llm_answer], validation_result]] = None,
+        on_token: Callable[[str], None] | None = None,
+    ) -> routed_answer:
+        start, profile = self.classify(prompt, task_order, unit_type)
+        self._stats[self.tiers[start].name].routed += 1
+        logging.info(
+            "Routing %s task (unit_type=%s, %d input tokens) to tier '%s'",
+            profile.operation,
+            profile.unit_type,
+            profile.input_tokens,
+            self.tiers[start].name,
+        )
+
+        attempts: List[str] = []
+        for i in range(start, len(self.tiers)):
+            tier = self.tiers[i]
+            stats = self._stats[tier.name]
+            if i > start:
+                stats.escalated_in += 1
+            attempts.append(tier.name)
+            last = i == len(self.tiers) - 1
+
+            stats.runs += 1
+            t0 = time.perf_counter()
+            try:
+                answer = self.llm.trigger_local_llm(prompt, tier.settings, on_token=on_token)
+            except LocalLlmError as e:
+                stats.errors += 1
+                if last or e.info.code not in _ESCALATE_ON:
+                    raise
+                logging.warning("Tier '%s' failed with %s; escalating", tier.name, e.info.code)
+                continue
+            self._latency[tier.name].append(time.perf_counter() - t0)
+
+            result = validate(answer) if validate is not None else None
+            if result is None or result.ok or last:
+                if result is not None and not result.ok:
+                    stats.validation_failures += 1
+                    logging.warning("Tier '%s' answer failed validation and no bigger tier is left", tier.name)
+                return routed_answer(answer=answer, tier=tier.name, profile=profile, attempts=attempts, validation=result)
+            stats.validation_failures += 1
+            logging.warning(
+                "Tier '%s' answer failed validation (%d issue(s)); escalating to '%s'",
+                tier.name,
+                len(result.issues),
+                self.tiers[i + 1].name,
+            )
+        raise AssertionError("unreachable")
+
+    def stats(self) -> Dict[str, TierStats]:
+        out = {}
+        for name, s in self._stats.items():
+            samples = list(self._latency[name])
+            out[name] = TierStats(
+                routed=s.routed,
+                escalated_in=s.escalated_in,
+                runs=s.runs,
+                validation_failures=s.validation_failures,
+                errors=s.errors,
+                latency_p50_s=percentile(samples, 50),
+                latency_p95_s=percentile(samples, 95),
+                latency_mean_s=sum(samples) / len(samples) if samples else None,
+            )
+        return out
+
+    # ---- internals ----
+
+    @staticmethod
+    def _accepts(tier: model_tier, profile: task_profile) -> bool:
+        if tier.operations and profile.operation not in tier.operations:
+            return False
+        if tier.unit_types and profile.unit_type not in tier.unit_types:
+            return False
+        if tier.max_input_tokens is not None and profile.input_tokens > tier.max_input_tokens:
+            return False
+        return profile.input_tokens + tier.settings.max_tokens <= tier.settings.n_ctx
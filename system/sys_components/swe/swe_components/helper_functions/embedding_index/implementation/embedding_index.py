@@ -0,0 +1,251 @@
+# core/embedding_index/implementation/embedding_index.py
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from system.sys_components.swe.swe_interfaces.implementation.if_artifact_manager import (
+    artifact_blob,
+    artifact_engine_port,
+    artifact_ref,
+    cm_anchor_ref,
+)
+from system.sys_components.swe.swe_interfaces.implementation.if_embedding_index import (
+    embedding_hit,
+    embedding_index_port,
+    index_update,
+)
+from system.sys_components.swe.swe_components.llm.local.implementation.context_packer import ContextSection
+from system.sys_components.swe.swe_components.llm.local.implementation.map_reduce import split_structural
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+
+MIN_CAPACITY = 256      # rows; the vector file grows by doubling from here
+
+
+class llama_embedder:
+    """Local GGUF embedding model (llama.cpp with embedding=True), pooled to one vector per text."""
+
+    def __init__(self, model_path: str, n_ctx: int = 2048, n_threads: Optional[int] = None, n_gpu_layers: int = 0):
+        from llama_cpp import Llama
+
+        self.model_path = model_path
+        self.llm = Llama(
+            model_path=model_path,
+            embedding=True,
+            n_ctx=n_ctx,
+            n_batch=n_ctx,          # a whole chunk must fit one batch for pooled embeddings
+            n_threads=n_threads,
+            n_gpu_layers=n_gpu_layers,
+            verbose=False,
+        )
+
+    @property
+    def dim(self) -> int:
+        return self.llm.n_embd()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(self.llm.embed(list(texts)), dtype=np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class embedding_index(embedding_index_port):
+    """
+    Chunked artifacts and their embeddings, persisted under index_dir:
+
+        meta.json     model digest, dim, capacity, row -> (source, chunk_no, text), source -> (hash, rows)
+        vectors.f32   float32 [capacity, dim] matrix, memory-mapped, rows L2-normalised
+
+    Updates are incremental: an artifact whose content hash is unchanged is not re-embedded;
+    a changed artifact frees its old rows, which are reused for new chunks.
+    """
+
+    def __init__(
+        self,
+        artifact_engine: artifact_engine_port,
+        embedder: llama_embedder,
+        index_dir: Path,
+        chunk_tokens: int = 384,
+        batch_size: int = 16,
+    ):
+        self.artifact_engine = artifact_engine
+        self.embedder = embedder
+        self.index_dir = Path(index_dir)
+        self.chunk_tokens = chunk_tokens
+        self.batch_size = batch_size
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+
+        self._model = model_digest(embedder.model_path)
+        self._dim = embedder.dim
+        self._rows: List[Optional[Dict[str, Any]]] = []
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._load()
+
+    # ------------------------------ public API --------------------------------
+
+    def index_artifacts(self, refs: Sequence[artifact_ref | cm_anchor_ref]) -> index_update:
+        unchanged = 0
+        pending: List[Tuple[str, int, str]] = []
+        hashes: Dict[str, str] = {}
+
+        for ref in refs:
+            blob = self._load_blob(ref)
+            if blob is None:
+                logging.warning("Embedding index: artifact not found: %s", ref)
+                continue
+            source = blob.repo_relpath or f"{blob.ref.kind}:{blob.ref.id}"
+            digest = hashlib.sha256(blob.raw.encode("utf-8")).hexdigest()
+            if self._sources.get(source, {}).get("hash") == digest:
+                unchanged += 1
+                continue
+            hashes[source] = digest
+            chunks = split_structural(blob.raw, self.chunk_tokens, self.embedder.count_tokens)
+            pending.extend((source, i, text) for i, text in enumerate(chunks))
+
+        # embed before touching the index: if the embedder fails, the old rows are still there
+        t0 = time.perf_counter()
+        vectors = [
+            vec
+            for start in range(0, len(pending), self.batch_size)
+            for vec in _normalize(self.embedder.embed([text for _, _, text in pending[start : start + self.batch_size]]))
+        ]
+        embed_s = time.perf_counter() - t0
+
+        removed = sum(self._remove_source(source) for source in hashes)
+        for (source, chunk_no, text), vec in zip(pending, vectors):
+            row = self._allocate_row()
+            self._vectors[row] = vec
+            self._rows[row] = {"source": source, "chunk_no": chunk_no, "text": text}
+            self._sources.setdefault(source, {"hash": hashes[source], "rows": []})["rows"].append(row)
+
+        for source, digest in hashes.items():
+            # artifacts that chunk to nothing still record their hash
+            self._sources.setdefault(source, {"hash": digest, "rows": []})
+        self._save()
+        logging.info(
+            "Embedding index updated: +%d chunks, -%d chunks, %d unchanged artifacts (%.2f s embedding)",
+            len(pending),
+            removed,
+            unchanged,
+            embed_s,
+        )
+        return index_update(added=len(pending), removed=removed, unchanged_sources=unchanged, embed_time_s=embed_s)
+
+    def search(self, query: str, k: int = 8) -> list[embedding_hit]:
+        used = np.array([r is not None for r in self._rows], dtype=bool)
+        if self._vectors is None or not used.any():
+            return []
+        q = _normalize(self.embedder.embed([query]))[0]
+        # rows are unit vectors, so one matrix-vector product gives every cosine similarity
+        scores = np.asarray(self._vectors[: len(self._rows)] @ q)
+        scores[~used] = -np.inf
+        k = min(k, int(used.sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            embedding_hit(
+                source=self._rows[i]["source"],
+                chunk_no=self._rows[i]["chunk_no"],
+                text=self._rows[i]["text"],
+                score=float(scores[i]),
+            )
+            for i in top
+        ]
+
+    def context_sections(self, query: str, k: int = 8) -> List[ContextSection]:
+        """Top-k chunks as extra_context for LLMEngine.run; better matches survive packing longer."""
+        hits = self.search(query, k)
+        return [
+            ContextSection(name=f"{h.source}#{h.chunk_no}", text=h.text, priority=len(hits) - rank)
+            for rank, h in enumerate(hits)
+        ]
+
+    # ------------------------------ internals ---------------------------------
+
+    def _load_blob(self, ref: artifact_ref | cm_anchor_ref) -> Optional[artifact_blob]:
+        if isinstance(ref, cm_anchor_ref):
+            return self.artifact_engine.load_by_cm_anchor(ref)
+        return self.artifact_engine.load_by_ref(ref)
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.index_dir / "meta.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.index_dir / "vectors.f32"
+
+    def _load(self) -> None:
+        if not self._meta_path.exists():
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self._model or meta.get("dim") != self._dim:
+            logging.warning("Embedding index at '%s' was built with another model; rebuilding", self.index_dir)
+            return
+        self._rows = meta["rows"]
+        self._sources = meta["sources"]
+        if meta["capacity"] > 0:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(meta["capacity"], self._dim))
+
+    def _save(self) -> None:
+        if self._vectors is not None:
+            self._vectors.flush()
+        meta = {
+            "model": self._model,
+            "dim": self._dim,
+            "capacity": self._capacity(),
+            "rows": self._rows,
+            "sources": self._sources,
+        }
+        tmp = self._meta_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, self._meta_path)
+
+    def _capacity(self) -> int:
+        return 0 if self._vectors is None else self._vectors.shape[0]
+
+    def _allocate_row(self) -> int:
+        for i, r in enumerate(self._rows):
+            if r is None:
+                return i
+        if len(self._rows) >= self._capacity():
+            self._grow(max(MIN_CAPACITY, 2 * self._capacity()))
+        self._rows.append(None)
+        return len(self._rows) - 1
+
+    def _grow(self, capacity: int) -> None:
+        tmp = self._vectors_path.with_suffix(".tmp")
+        grown = np.memmap(tmp, dtype=np.float32, mode="w+", shape=(capacity, self._dim))
+        if self._vectors is not None:
+            grown[: self._capacity()] = self._vectors
+            self._vectors.flush()
+            del self._vectors
+        grown.flush()
+        del grown
+        os.replace(tmp, self._vectors_path)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+
+    def _remove_source(self, source: str) -> int:
+        entry = self._sources.pop(source, None)
+        if entry is None:
+            return 0
+        for row in entry["rows"]:
+            self._rows[row] = None
+            self._vectors[row] = 0.0
+        return len(entry["rows"])
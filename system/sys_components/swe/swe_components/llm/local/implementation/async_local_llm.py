@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Optional
+
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import (
+    KNOWN_LLM_ERRORS,
+    LocalLlmError,
+    async_local_llm_port,
+    llm_answer,
+)
+from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import llm_config
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm_v1 import local_llm_engine
+
+
+class _Stopped(Exception):
+    """Raised inside the generation thread when the caller cancelled or timed out."""
+
+
+class async_local_llm_engine(async_local_llm_port):
+    """
+    asyncio front-end for local_llm_engine.
+
+    Generation runs in one dedicated executor thread (a llama.cpp context is not thread-safe),
+    so the event loop stays free for artifact I/O and prompt compilation. Cancellation and
+    deadlines are checked between tokens; a batch of prompt evaluation already handed to
+    llama.cpp cannot be interrupted, so stopping during prompt-eval takes effect at the first token.
+    """
+
+    def __init__(self, sync_engine: Optional[local_llm_engine] = None):
+        self._sync = sync_engine or local_llm_engine()
+        self._owns_sync = sync_engine is None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-llm")
+
+    async def trigger_local_llm(
+        self,
+        prompt: str,
+        settings: llm_config,
+        on_token: Callable[[str], None] | None = None,
+        deadline_s: float | None = None,
+    ) -> llm_answer:
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+
+        def forward(delta: str) -> None:
+            if on_token is not None:
+                loop.call_soon_threadsafe(on_token, delta)
+
+        fut = loop.run_in_executor(self._executor, self._generate, prompt, settings, forward, stop)
+        try:
+            # the deadline covers time spent queued behind other requests, too
+            return await asyncio.wait_for(fut, timeout=deadline_s)
+        except asyncio.TimeoutError:
+            stop.set()
+            raise LocalLlmError(KNOWN_LLM_ERRORS["LLM_TIMEOUT"], details={"deadline_s": deadline_s}) from None
+        except asyncio.CancelledError:
+            stop.set()
+            raise
+
+    async def stream(
+        self,
+        prompt: str,
+        settings: llm_config,
+        deadline_s: float | None = None,
+    ) -> AsyncIterator[str]:
+        """Async iterator over text deltas. Breaking out of the loop stops generation."""
+        deltas: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        task = asyncio.ensure_future(self.trigger_local_llm(prompt, settings, deltas.put_nowait, deadline_s))
+        task.add_done_callback(lambda _: deltas.put_nowait(None))
+        try:
+            while True:
+                delta = await deltas.get()
+                if delta is None:
+                    break
+                yield delta
+            await task  # re-raise timeout / errors from generation
+        finally:
+            if not task.done():
+                task.cancel()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self._owns_sync:
+            self._sync.close()
+
+    # ---- runs in the executor thread ----
+
+    def _generate(
+        self,
+        prompt: str,
+        settings: llm_config,
+        forward: Callable[[str], None],
+        stop: threading.Event,
+    ) -> Optional[llm_answer]:
+        if stop.is_set():
+            return None  # cancelled while queued
+        engine = self._sync.engine_for(settings)
+        stream = engine.run_stream(system_prompt=self._sync.system_prompt, user_prompt=prompt)
+        try:
+            while True:
+                if stop.is_set():
+                    raise _Stopped()
+                try:
+                    delta = next(stream)
+                except StopIteration as done:
+                    return done.value
+                forward(delta)
+        except _Stopped:
+            logging.info("Local LLM generation stopped by caller (cancel or deadline)")
+            return None
+        finally:
+            stream.close()
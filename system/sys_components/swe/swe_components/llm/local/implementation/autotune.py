@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Calibrate n_threads / n_batch / n_gpu_layers for a GGUF model on this machine.
+
+Usage:
+    python autotune.py --model path/to/model.gguf [--threads 12,24,32] [--batches 256,512,1024]
+
+Runs a short prompt-eval + generation per grid point, measures tok/s, and persists the
+best configuration per (model, host) so agent_configurator.configure_llm can return it.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+
+try:
+    import psutil  # type: ignore
+except Exception:
+    psutil = None
+
+DEFAULT_TUNING_PATH = Path(".aios/config/llm_tuning.json")
+
+# repetitive but never-ending text keeps generation going for the whole measurement
+CALIBRATION_TEXT = (
+    "artifact_kind: interface_spec\nschema_version: '0.1'\ncard:\n  id: 'IF.example'\n"
+    "  name: 'Example interface'\n  domain: 'meta'\n"
+)
+CALIBRATION_INSTRUCTION = "\nContinue this YAML list with 200 more similar entries:\n"
+CALIBRATION_PROMPT_TOKENS = 1024   # at least; autotune() raises it to the largest n_batch of the grid
+
+
+@dataclass
+class CalibrationResult:
+    n_threads: int
+    n_batch: int
+    n_gpu_layers: int
+    prompt_tok_s: float
+    gen_tok_s: float
+    load_s: float
+
+    def workload_s(self, prompt_tokens: int, gen_tokens: int) -> float:
+        """Estimated wall time of a representative task under this configuration."""
+        if self.prompt_tok_s <= 0 or self.gen_tok_s <= 0:
+            return float("inf")
+        return prompt_tokens / self.prompt_tok_s + gen_tokens / self.gen_tok_s
+
+
+def physical_cores() -> int:
+    if psutil is not None:
+        n = psutil.cpu_count(logical=False)
+        if n:
+            return n
+    return os.cpu_count() or 1
+
+
+def logical_cores() -> int:
+    if psutil is not None:
+        n = psutil.cpu_count(logical=True)
+        if n:
+            return n
+    return os.cpu_count() or 1
+
+
+def host_id() -> str:
+    raw = f"{platform.node()}|{platform.processor() or platform.machine()}|{logical_cores()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def default_thread_grid() -> List[int]:
+    phys = physical_cores()
+    return sorted({max(1, phys // 2), phys, logical_cores()})
+
+
+def calibrate(
+    model_path: str,
+    n_threads: int,
+    n_batch: int,
+    n_gpu_layers: int,
+    prompt_tokens: int = CALIBRATION_PROMPT_TOKENS,
+    gen_tokens: int = 64,
+) -> CalibrationResult:
+    from llama_cpp import Llama
+
+    t0 = time.perf_counter()
+    llm = Llama(
+        model_path=model_path,
+        n_ctx=prompt_tokens + gen_tokens + 64,
+        n_gpu_layers=n_gpu_layers,
+        n_batch=n_batch,
+        n_threads=n_threads,
+        n_threads_batch=n_threads,
+        verbose=False,
+    )
+    load_s = time.perf_counter() - t0
+    try:
+        unit = llm.tokenize(CALIBRATION_TEXT.encode("utf-8"), add_bos=False)
+        body = (unit * (prompt_tokens // max(len(unit), 1) + 1))[:prompt_tokens]
+        tail = llm.tokenize(CALIBRATION_INSTRUCTION.encode("utf-8"), add_bos=False)
+        prompt = [llm.token_bos()] + body[: prompt_tokens - len(tail) - 1] + tail
+
+        llm.reset()
+        t_start = time.perf_counter()
+        t_first = None
+        n_chunks = 0
+        for _ in llm.create_completion(prompt=prompt, max_tokens=gen_tokens, temperature=0.0, stream=True):
+            if t_first is None:
+                t_first = time.perf_counter()
+            n_chunks += 1
+        t_end = time.perf_counter()
+    finally:
+        llm.close()
+
+    prompt_s = (t_first or t_end) - t_start
+    gen_s = t_end - (t_first or t_end)
+    return CalibrationResult(
+        n_threads=n_threads,
+        n_batch=n_batch,
+        n_gpu_layers=n_gpu_layers,
+        prompt_tok_s=len(prompt) / prompt_s if prompt_s > 0 else 0.0,
+        gen_tok_s=(n_chunks - 1) / gen_s if gen_s > 0 and n_chunks > 1 else 0.0,
+        load_s=load_s,
+    )
+
+
+def autotune(
+    model_path: str,
+    threads: Optional[Sequence[int]] = None,
+    batches: Sequence[int] = (256, 512, 1024, 2048),
+    gpu_layers: Sequence[int] = (-1,),
+    workload_prompt_tokens: int = 8000,
+    workload_gen_tokens: int = 1000,
+    tuning_path: Path = DEFAULT_TUNING_PATH,
+) -> Dict:
+    """Run the grid, persist and return the best entry (lowest estimated workload time)."""
+    results: List[CalibrationResult] = []
+    # a prompt shorter than n_batch is one batch for every larger n_batch too: those grid points
+    # would all measure the same thing and the pick between them would be noise
+    prompt_tokens = max(CALIBRATION_PROMPT_TOKENS, *batches)
+    for n_threads, n_batch, n_gpu in itertools.product(threads or default_thread_grid(), batches, gpu_layers):
+        try:
+            r = calibrate(model_path, n_threads, n_batch, n_gpu, prompt_tokens=prompt_tokens)
+        except Exception as e:
+            logging.warning("Calibration failed for threads=%d batch=%d gpu_layers=%d: %s", n_threads, n_batch, n_gpu, e)
+            continue
+        logging.info(
+            "threads=%d batch=%d gpu_layers=%d -> prompt %.1f tok/s, gen %.1f tok/s",
+            n_threads,
+            n_batch,
+            n_gpu,
+            r.prompt_tok_s,
+            r.gen_tok_s,
+        )
+        results.append(r)
+
+    if not results:
+        raise RuntimeError(f"No calibration run succeeded for {model_path}")
+
+    best = min(results, key=lambda r: r.workload_s(workload_prompt_tokens, workload_gen_tokens))
+    entry = {
+        "model_path": os.path.abspath(model_path),
+        "host_id": host_id(),
+        "n_threads": best.n_threads,
+        "n_batch": best.n_batch,
+        "n_gpu_layers": best.n_gpu_layers,
+        "prompt_tok_s": round(best.prompt_tok_s, 2),
+        "gen_tok_s": round(best.gen_tok_s, 2),
+        "tuned_at_utc": datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None).isoformat() + "Z",
+        "grid": [asdict(r) for r in results],
+    }
+    save_tuning(model_path, entry, tuning_path)
+    return entry
+
+
+def _tuning_key(model_path: str) -> str:
+    return f"{model_digest(model_path)}@{host_id()}"
+
+
+def load_tuning(model_path: str, tuning_path: Path = DEFAULT_TUNING_PATH) -> Optional[Dict]:
+    """Best known configuration for this model on this host, or None if never tuned."""
+    if not tuning_path.exists() or not os.path.exists(model_path):
+        return None
+    with open(tuning_path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    return table.get(_tuning_key(model_path))
+
+
+def save_tuning(model_path: str, entry: Dict, tuning_path: Path = DEFAULT_TUNING_PATH) -> None:
+    table: Dict = {}
+    if tuning_path.exists():
+        with open(tuning_path, "r", encoding="utf-8") as f:
+            table = json.load(f)
+    table[_tuning_key(model_path)] = entry
+    tuning_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = tuning_path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, tuning_path)
+
+
+def _int_list(raw: str) -> List[int]:
+    return [int(x) for x in raw.split(",") if x.strip()]
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Auto-tune llama.cpp threads/batch/GPU layers for a GGUF model.")
+    parser.add_argument("--model", required=True, help="Path to GGUF model file")
+    parser.add_argument("--threads", type=_int_list, help="Comma-separated thread counts (default: phys/2, phys, logical)")
+    parser.add_argument("--batches", type=_int_list, default=[256, 512, 1024, 2048], help="Comma-separated n_batch values")
+    parser.add_argument("--gpu-layers", type=_int_list, default=[-1], help="Comma-separated n_gpu_layers values")
+    parser.add_argument("--out", default=str(DEFAULT_TUNING_PATH), help="Tuning table JSON path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if not os.path.exists(args.model):
+        print(f"ERROR: model file does not exist: {args.model}", file=sys.stderr)
+        return 1
+
+    entry = autotune(
+        args.model,
+        threads=args.threads,
+        batches=args.batches,
+        gpu_layers=args.gpu_layers,
+        tuning_path=Path(args.out),
+    )
+    print(
+        f"Best: n_threads={entry['n_threads']} n_batch={entry['n_batch']} n_gpu_layers={entry['n_gpu_layers']} "
+        f"(prompt {entry['prompt_tok_s']} tok/s, gen {entry['gen_tok_s']} tok/s) -> {args.out}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,356 @@
+import bisect
+import ctypes
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import llama_cpp
+
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm import LLMEngine, percentile
+from system.sys_components.swe.swe_components.llm.local.implementation.model_pool import ModelKey, kv_cache_kwargs
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import (
+    KNOWN_LLM_ERRORS,
+    LocalLlmError,
+    llm_answer,
+)
+
+# tokens considered by repeat_penalty, same window llama.cpp uses by default
+REPEAT_LAST_N = 64
+
+
+def derive_max_parallel(n_ctx: int, max_tokens: int, typical_prompt_tokens: int = 2048) -> int:
+    """How many sequences fit into one shared KV cache of n_ctx tokens at once."""
+    per_seq = max(1, typical_prompt_tokens + max_tokens)
+    return max(1, n_ctx // per_seq)
+
+
+@dataclass
+class BatchServerStats:
+    completed: int = 0
+    failed: int = 0
+    generated_tokens: int = 0
+    decode_calls: int = 0
+    busy_s: float = 0.0            # wall time spent in llama_decode + sampling
+    peak_parallel: int = 0
+
+    @property
+    def aggregate_tok_s(self) -> float:
+        return self.generated_tokens / self.busy_s if self.busy_s > 0 else 0.0
+
+
+@dataclass
+class _Sequence:
+    future: Future
+    prompt: List[int]
+    stop: List[bytes]
+    max_tokens: int
+    submitted_at: float
+    seq_id: int = -1
+    n_past: int = 0                # tokens of this sequence already in the KV cache
+    generated: List[int] = field(default_factory=list)
+    text: bytes = b""
+    pending: Optional[int] = None  # sampled token not yet decoded
+    text_ends: List[int] = field(default_factory=list)   # len(text) after each detokenized token
+    completion_tokens: Optional[int] = None               # set when a stop string trims the text
+    first_token_at: Optional[float] = None
+    last_token_at: Optional[float] = None
+    gaps: List[float] = field(default_factory=list)
+
+    @property
+    def reserved(self) -> int:
+        return len(self.prompt) + self.max_tokens
+
+
+class BatchedLLMServer:
+    """
+    Request queue in front of one loaded model that decodes several requests in a single
+    llama.cpp context, one sequence id per request (continuous batching).
+
+    New requests join the running batch as soon as a sequence slot and enough KV space are
+    free, so short review/test prompts do not wait for a long generation to finish.
+    Sampling (temperature, top_p, repeat_penalty) follows the engine's LLMConfig.
+
+    The server holds a pool lease on the model for its lifetime, and the KV cache of its own
+    context is charged to the pool (and the memory monitor) until close().
+    """
+
+    def __init__(self, engine: LLMEngine, max_parallel: Optional[int] = None):
+        self.engine = engine
+        self.cfg = engine.cfg
+        self.pool = engine.pool
+        self.max_parallel = max_parallel or derive_max_parallel(self.cfg.n_ctx, self.cfg.max_tokens)
+
+        self._queue: "queue.Queue[Optional[_Sequence]]" = queue.Queue()
+        self._active: Dict[int, _Sequence] = {}
+        self._free_ids = list(range(self.max_parallel))
+        self._waiting: List[_Sequence] = []
+        self._stats = BatchServerStats()
+        self._rng = np.random.default_rng()
+        self._running = True
+        self._submit_lock = threading.Lock()
+
+        # own context over the pooled weights: the engine's context has n_seq_max=1
+        self.llm = self.pool.acquire(self.cfg)
+        try:
+            self._ctx_bytes = self.pool.reserve_context(self.cfg, self.cfg.n_ctx)
+        except BaseException:
+            self.pool.release(self.cfg)
+            raise
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = self.cfg.n_ctx
+        params.n_batch = self.cfg.n_batch
+        params.n_seq_max = self.max_parallel
+        params.n_threads = self.cfg.n_threads
+        params.n_threads_batch = self.cfg.n_threads
+        for name, value in kv_cache_kwargs(ModelKey.from_config(self.cfg)).items():
+            setattr(params, name, value)
+        self._ctx = llama_cpp.llama_new_context_with_model(self.llm.model, params)
+        if not self._ctx:
+            self._release_model()
+            raise RuntimeError("Failed to create batched llama.cpp context")
+        self._batch = llama_cpp.llama_batch_init(self.cfg.n_batch, 0, self.max_parallel)
+        self._n_vocab = self.llm.n_vocab()
+
+        self._worker = threading.Thread(target=self._loop, name="llm-batch-server", daemon=True)
+        self._worker.start()
+        logging.info(
+            "Batched LLM server started (max_parallel=%d, n_ctx=%d, n_batch=%d)",
+            self.max_parallel,
+            self.cfg.n_ctx,
+            self.cfg.n_batch,
+        )
+
+    # ---- public API ----
+
+    def submit(self, *, system_prompt: str, user_prompt: str, extra_context: str = "") -> "Future[llm_answer]":
+        messages = self.engine.build_messages(system_prompt, user_prompt, extra_context, "")
+        rendered = self.engine.render_prompt(messages, boundary="")
+        if rendered is not None:
+            tokens, stop = rendered.tokens, rendered.stop
+        else:
+            tokens = self.llm.tokenize((system_prompt + "\n\n" + messages[1]["content"]).encode("utf-8"))
+            stop = []
+
+        fut: "Future[llm_answer]" = Future()
+        seq = _Sequence(
+            future=fut,
+            prompt=list(tokens),
+            stop=[s.encode("utf-8") for s in stop if s],
+            max_tokens=self.cfg.max_tokens,
+            submitted_at=time.perf_counter(),
+        )
+        if seq.reserved > self.cfg.n_ctx:
+            fut.set_exception(LocalLlmError(
+                KNOWN_LLM_ERRORS["LLM_CONTEXT_OVERFLOW"],
+                details={"prompt_tokens": len(seq.prompt), "max_tokens": seq.max_tokens, "n_ctx": self.cfg.n_ctx},
+            ))
+            return fut
+        with self._submit_lock:
+            if not self._running:
+                raise LocalLlmError(KNOWN_LLM_ERRORS["LLM_INTERNAL_ERROR"], details={"reason": "batch server is closed"})
+            self._queue.put(seq)
+        return fut
+
+    def run(self, **kwargs) -> llm_answer:
+        return self.submit(**kwargs).result()
+
+    def stats(self) -> BatchServerStats:
+        return BatchServerStats(**vars(self._stats))
+
+    def close(self) -> None:
+        """Stop the server; queued and in-flight requests fail with LLM_INTERNAL_ERROR."""
+        with self._submit_lock:
+            if not self._running:
+                return
+            self._running = False
+            self._queue.put(None)
+        self._worker.join()
+
+        closed = LocalLlmError(KNOWN_LLM_ERRORS["LLM_INTERNAL_ERROR"], details={"reason": "batch server closed"})
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._waiting.append(item)
+        for seq in list(self._active.values()) + self._waiting:
+            self._finish(seq, error=closed)
+        self._waiting = []
+
+        llama_cpp.llama_batch_free(self._batch)
+        llama_cpp.llama_free(self._ctx)
+        self._release_model()
+
+    # ---- scheduling loop ----
+
+    def _loop(self) -> None:
+        while self._running:
+            self._admit(block=not self._active)
+            if not self._active:
+                continue
+            t0 = time.perf_counter()
+            try:
+                self._step()
+            except Exception as e:
+                logging.exception("Batched decode failed; failing %d in-flight requests", len(self._active))
+                for seq in list(self._active.values()):
+                    self._finish(seq, error=e)
+            self._stats.busy_s += time.perf_counter() - t0
+
+    def _admit(self, block: bool) -> None:
+        try:
+            while True:
+                item = self._queue.get(block=block and not self._waiting)
+                if item is None:
+                    return
+                self._waiting.append(item)
+                block = False
+        except queue.Empty:
+            pass
+
+        used = sum(s.reserved for s in self._active.values())
+        still_waiting = []
+        for seq in self._waiting:
+            if self._free_ids and used + seq.reserved <= self.cfg.n_ctx:
+                seq.seq_id = self._free_ids.pop(0)
+                self._active[seq.seq_id] = seq
+                used += seq.reserved
+            else:
+                still_waiting.append(seq)
+        self._waiting = still_waiting
+        self._stats.peak_parallel = max(self._stats.peak_parallel, len(self._active))
+
+    def _step(self) -> None:
+        batch = self._batch
+        n = 0
+        wants_logits: Dict[int, int] = {}   # batch index -> seq_id
+
+        # decoding sequences first (one token each), then fill the rest with prompt chunks
+        for seq in self._active.values():
+            if seq.pending is not None and n < self.cfg.n_batch:
+                self._add(batch, n, seq.pending, seq.n_past, seq.seq_id, True)
+                wants_logits[n] = seq.seq_id
+                seq.generated.append(seq.pending)
+                seq.pending = None
+                seq.n_past += 1
+                n += 1
+        for seq in self._active.values():
+            while seq.n_past < len(seq.prompt) and n < self.cfg.n_batch:
+                last = seq.n_past == len(seq.prompt) - 1
+                self._add(batch, n, seq.prompt[seq.n_past], seq.n_past, seq.seq_id, last)
+                if last:
+                    wants_logits[n] = seq.seq_id
+                seq.n_past += 1
+                n += 1
+
+        batch.n_tokens = n
+        rc = llama_cpp.llama_decode(self._ctx, batch)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode returned {rc}")
+        self._stats.decode_calls += 1
+
+        now = time.perf_counter()
+        for idx, seq_id in wants_logits.items():
+            seq = self._active[seq_id]
+            logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(self._ctx, idx), shape=(self._n_vocab,))
+            tok = self._sample(logits, seq)
+            self._stats.generated_tokens += 1
+
+            if seq.first_token_at is None:
+                seq.first_token_at = now
+            else:
+                seq.gaps.append(now - seq.last_token_at)
+            seq.last_token_at = now
+
+            if self._is_eog(tok):
+                self._finish(seq)
+                continue
+            seq.text += self.llm.detokenize([tok])
+            seq.text_ends.append(len(seq.text))
+            hit = next((s for s in seq.stop if seq.text.endswith(s)), None)
+            if hit is not None:
+                seq.text = seq.text[: -len(hit)]
+                # the tokens that spelled the stop string are not part of the completion
+                seq.completion_tokens = bisect.bisect_right(seq.text_ends, len(seq.text))
+                self._finish(seq)
+            elif len(seq.generated) + 1 >= seq.max_tokens:
+                seq.generated.append(tok)
+                self._finish(seq)
+            else:
+                seq.pending = tok
+
+    # ---- helpers ----
+
+    @staticmethod
+    def _add(batch, i: int, token: int, pos: int, seq_id: int, logits: bool) -> None:
+        batch.token[i] = token
+        batch.pos[i] = pos
+        batch.n_seq_id[i] = 1
+        batch.seq_id[i][0] = seq_id
+        batch.logits[i] = ctypes.c_int8(1 if logits else 0)
+
+    def _sample(self, logits: np.ndarray, seq: _Sequence) -> int:
+        logits = logits.astype(np.float32, copy=True)
+
+        recent = (seq.prompt + seq.generated)[-REPEAT_LAST_N:]
+        if self.cfg.repeat_penalty != 1.0 and recent:
+            ids = np.unique(np.asarray(recent, dtype=np.int64))
+            vals = logits[ids]
+            logits[ids] = np.where(vals > 0, vals / self.cfg.repeat_penalty, vals * self.cfg.repeat_penalty)
+
+        if self.cfg.temperature <= 0:
+            return int(np.argmax(logits))
+
+        logits /= self.cfg.temperature
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+
+        order = np.argsort(-probs)
+        cum = np.cumsum(probs[order])
+        keep = order[: int(np.searchsorted(cum, self.cfg.top_p)) + 1]
+        p = probs[keep] / probs[keep].sum()
+        return int(self._rng.choice(keep, p=p))
+
+    def _is_eog(self, tok: int) -> bool:
+        is_eog = getattr(llama_cpp, "llama_token_is_eog", None)
+        if is_eog is not None:
+            return bool(is_eog(self.llm.model, tok))
+        return tok == self.llm.token_eos()
+
+    def _release_model(self) -> None:
+        self.pool.release_context(self.cfg, self._ctx_bytes)
+        self.pool.release(self.cfg)
+
+    def _finish(self, seq: _Sequence, error: Optional[Exception] = None) -> None:
+        if seq.seq_id >= 0:
+            self._active.pop(seq.seq_id, None)
+            self._free_ids.append(seq.seq_id)
+            llama_cpp.llama_kv_cache_seq_rm(self._ctx, seq.seq_id, -1, -1)
+
+        if error is not None:
+            self._stats.failed += 1
+            seq.future.set_exception(error)
+            return
+
+        elapsed = time.perf_counter() - seq.submitted_at
+        n_gen = seq.completion_tokens if seq.completion_tokens is not None else len(seq.generated)
+        decode_s = (seq.last_token_at - seq.first_token_at) if seq.first_token_at and seq.last_token_at else None
+        self._stats.completed += 1
+        seq.future.set_result(llm_answer(
+            execution_time=elapsed,
+            generation_speed=(n_gen - 1) / decode_s if decode_s else 0.0,
+            response_text=seq.text.decode("utf-8", errors="ignore"),
+            time_to_first_token=(seq.first_token_at - seq.submitted_at) if seq.first_token_at else None,
+            inter_token_latency=sum(seq.gaps) / len(seq.gaps) if seq.gaps else None,
+            prompt_tokens=len(seq.prompt),
+            completion_tokens=n_gen,
+            decode_time=decode_s,
+            inter_token_latency_p50=percentile(seq.gaps, 50),
+            inter_token_latency_p95=percentile(seq.gaps, 95),
+        ))
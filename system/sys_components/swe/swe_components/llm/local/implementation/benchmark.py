@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Benchmark local inference for a GGUF model and compare against a stored baseline.
+
+Usage:
+    python benchmark.py --model path/to/model.gguf [--out report.json]
+                        [--baseline baseline.json --tolerance 0.10] [--save-baseline baseline.json]
+
+Replays a fixed prompt corpus (short, long-context, YAML output) and records load time,
+prompt-eval tok/s, TTFT, generation tok/s and peak RSS. Exit code 2 means a regression
+beyond tolerance against the baseline.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm import LLMConfig, LLMEngine
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+from system.sys_components.swe.swe_components.llm.local.implementation.model_pool import ModelPool
+
+SYSTEM_PROMPT = "You are a precise software and process architect. Follow the instructions exactly."
+
+_ARCH_SNIPPET = """
+- interface_id: 'IF.architecture_description'
+  purpose: 'Architecture description 0v1 (units, connectors, groupings, constraints).'
+  units:
+  - unit_id: 'U.def_arch'
+    unit_name: 'Define architecture description'
+    interaction_type: outbound
+  - unit_id: 'U.def_if'
+    unit_name: 'Define interface spec'
+    interaction_type: inbound
+"""
+
+DEFAULT_CORPUS: List[Dict[str, Any]] = [
+    {
+        "name": "short",
+        "user_prompt": "List three risks of storing configuration items without a CM catalogue. One line each.",
+        "max_tokens": 128,
+    },
+    {
+        "name": "long_context",
+        "user_prompt": "Connectors:\n" + _ARCH_SNIPPET * 60 + "\nHow many distinct interface_id values appear above? Answer with a number.",
+        "max_tokens": 32,
+    },
+    {
+        "name": "yaml_output",
+        "user_prompt": (
+            "Produce an interface_spec YAML document (artifact_kind, schema_version, card, kind, purpose, "
+            "binding, interaction) for IF.architecture_description. Output only YAML.\n" + _ARCH_SNIPPET
+        ),
+        "max_tokens": 512,
+    },
+]
+
+# metric -> True if higher is better
+METRIC_DIRECTION = {
+    "load_s": False,
+    "ttft_s": False,
+    "prompt_tok_s": True,
+    "gen_tok_s": True,
+    "peak_rss_mb": False,
+}
+
+
+@dataclass
+class CaseResult:
+    name: str
+    prompt_tokens: int
+    completion_tokens: int
+    ttft_s: float
+    prompt_tok_s: float
+    gen_tok_s: float
+    execution_time_s: float
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_case(engine: LLMEngine, case: Dict[str, Any], repeat: int) -> CaseResult:
+    max_tokens = int(case.get("max_tokens", 256))
+    runs = []
+    for _ in range(repeat):
+        engine.reset()  # measure cold prompt evaluation every time
+        answer = engine.complete(
+            system_prompt=case.get("system_prompt", SYSTEM_PROMPT),
+            user_prompt=case["user_prompt"],
+            bypass_cache=True,
+            max_tokens=max_tokens,
+        )
+        n_prompt = answer.prompt_tokens or 0
+        n_completion = answer.completion_tokens or 0
+        ttft = answer.time_to_first_token or answer.execution_time
+        prompt_eval_s = answer.prompt_eval_time or ttft
+        evaluated = n_prompt - (answer.cache_hit_tokens or 0)
+        runs.append(CaseResult(
+            name=case["name"],
+            prompt_tokens=n_prompt,
+            completion_tokens=n_completion,
+            ttft_s=ttft,
+            prompt_tok_s=evaluated / prompt_eval_s if prompt_eval_s > 0 else 0.0,
+            gen_tok_s=answer.generation_speed,
+            execution_time_s=answer.execution_time,
+        ))
+
+    # median per metric across repeats
+    return CaseResult(
+        name=case["name"],
+        prompt_tokens=runs[0].prompt_tokens,
+        completion_tokens=int(statistics.median(r.completion_tokens for r in runs)),
+        ttft_s=statistics.median(r.ttft_s for r in runs),
+        prompt_tok_s=statistics.median(r.prompt_tok_s for r in runs),
+        gen_tok_s=statistics.median(r.gen_tok_s for r in runs),
+        execution_time_s=statistics.median(r.execution_time_s for r in runs),
+    )
+
+
+def run_benchmark(cfg: LLMConfig, corpus: List[Dict[str, Any]], repeat: int = 3) -> Dict[str, Any]:
+    try:
+        import llama_cpp
+        llama_version = getattr(llama_cpp, "__version__", None)
+    except Exception:
+        llama_version = None
+
+    t0 = time.perf_counter()
+    engine = LLMEngine(cfg, pool=ModelPool())  # private pool: always a real load
+    load_s = time.perf_counter() - t0
+    load_report = asdict(engine.load_report) if engine.load_report is not None else None
+
+    cases = [run_case(engine, case, repeat) for case in corpus]
+    engine.close()
+
+    return {
+        "generated_at_utc": datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None).isoformat() + "Z",
+        "environment": {
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "llama_cpp_python": llama_version,
+        },
+        "model": {
+            "path": os.path.abspath(cfg.model_path),
+            "digest": model_digest(cfg.model_path),
+        },
+        "config": asdict(cfg),
+        "summary": {
+            "load_s": load_s,
+            "peak_rss_mb": peak_rss_mb(),
+        },
+        "load_report": load_report,
+        "cases": {c.name: asdict(c) for c in cases},
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable regressions of report vs baseline beyond the relative tolerance."""
+    regressions: List[str] = []
+
+    def check(label: str, metric: str, cur: Optional[float], base: Optional[float]) -> None:
+        if cur is None or base is None or base == 0:
+            return
+        higher_better = METRIC_DIRECTION[metric]
+        change = (cur - base) / base
+        worse = change < -tolerance if higher_better else change > tolerance
+        if worse:
+            regressions.append(f"{label}.{metric}: {base:.3f} -> {cur:.3f} ({change:+.1%})")
+
+    for metric in ("load_s", "peak_rss_mb"):
+        check("summary", metric, report["summary"].get(metric), baseline.get("summary", {}).get(metric))
+
+    for name, case in report["cases"].items():
+        base_case = baseline.get("cases", {}).get(name)
+        if base_case is None:
+            continue
+        for metric in ("ttft_s", "prompt_tok_s", "gen_tok_s"):
+            check(name, metric, case.get(metric), base_case.get(metric))
+
+    return regressions
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark local GGUF inference and compare against a baseline.")
+    parser.add_argument("--model", required=True, help="Path to GGUF model file")
+    parser.add_argument("--corpus", help="JSON list of {name, user_prompt, [system_prompt], [max_tokens]} (default: built-in)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per prompt; the median is reported")
+    parser.add_argument("--n-ctx", type=int, default=16384)
+    parser.add_argument("--n-gpu-layers", type=int, default=-1)
+    parser.add_argument("--n-batch", type=int, default=512)
+    parser.add_argument("--n-threads", type=int, default=16)
+    parser.add_argument("--out", help="Report JSON path (default: <model>.bench.json)")
+    parser.add_argument("--baseline", help="Baseline report JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression (default: 0.10)")
+    parser.add_argument("--save-baseline", help="Also write this report as the new baseline to this path")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if not os.path.exists(args.model):
+        print(f"ERROR: model file does not exist: {args.model}", file=sys.stderr)
+        return 1
+
+    corpus = DEFAULT_CORPUS
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            corpus = json.load(f)
+
+    cfg = LLMConfig(
+        model_path=args.model,
+        n_ctx=args.n_ctx,
+        n_gpu_layers=args.n_gpu_layers,
+        n_batch=args.n_batch,
+        n_threads=args.n_threads,
+        temperature=0.0,
+        seed=0,
+        use_prefix_cache=False,
+        use_response_cache=False,
+    )
+    report = run_benchmark(cfg, corpus, repeat=args.repeat)
+
+    out_path = args.out or (args.model + ".bench.json")
+    for path in filter(None, (out_path, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    logging.info("Benchmark report written to: %s", out_path)
+
+    for name, case in report["cases"].items():
+        print(
+            f"{name:>14}: ttft={case['ttft_s']:.2f}s prompt={case['prompt_tok_s']:.1f} tok/s "
+            f"gen={case['gen_tok_s']:.1f} tok/s"
+        )
+    print(f"load={report['summary']['load_s']:.2f}s peak_rss={report['summary']['peak_rss_mb']:.0f} MB")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"REGRESSIONS (tolerance {args.tolerance:.0%}):")
+            for r in regressions:
+                print(f"  {r}")
+            return 2
+        print(f"No regressions against baseline (tolerance {args.tolerance:.0%}).")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence
+
+# joining sections with "\n\n" can merge or add a token at each boundary
+SEPARATOR_TOKENS = 2
+
+
+@dataclass(frozen=True)
+class ContextSection:
+    name: str
+    text: str
+    priority: int = 0       # higher priority survives longer; ties: earlier sections survive longer
+    min_tokens: int = 64    # trimming below this drops the section instead
+
+
+@dataclass
+class PackedSection:
+    name: str
+    priority: int
+    original_tokens: int
+    kept_tokens: int
+    status: str             # "kept" | "trimmed" | "dropped"
+
+
+@dataclass
+class PackingReport:
+    budget_tokens: int
+    fixed_tokens: int       # system prompt, task, chat template
+    sections: List[PackedSection] = field(default_factory=list)
+
+    @property
+    def context_tokens(self) -> int:
+        return sum(s.kept_tokens for s in self.sections)
+
+
+class TokenCache:
+    """LRU of text -> tokens for one model's tokenizer, so repeated context is tokenized once."""
+
+    def __init__(
+        self,
+        tokenize: Callable[[str], List[int]],
+        detokenize: Callable[[List[int]], str],
+        max_entries: int = 512,
+    ):
+        self._tokenize = tokenize
+        self.detokenize = detokenize
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tokens(self, text: str) -> List[int]:
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                return hit
+        toks = self._tokenize(text)
+        with self._lock:
+            self._cache[key] = toks
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return toks
+
+    def count(self, text: str) -> int:
+        return len(self.tokens(text)) if text else 0
+
+
+def pack_sections(
+    sections: Sequence[ContextSection],
+    budget_tokens: int,
+    fixed_tokens: int,
+    tokens: TokenCache,
+) -> "tuple[str, PackingReport]":
+    """
+    Fit sections into budget_tokens. Lowest-priority sections (latest first among equals)
+    are trimmed from the end, or dropped when trimming would leave less than min_tokens.
+    Deterministic for the same inputs.
+    """
+    toks = [tokens.tokens(s.text) if s.text else [] for s in sections]
+    kept = [len(t) for t in toks]
+    report = PackingReport(budget_tokens=max(budget_tokens, 0), fixed_tokens=fixed_tokens)
+
+    def total() -> int:
+        return sum(k + SEPARATOR_TOKENS for k in kept if k > 0)
+
+    # victims in order: lowest priority first, later sections before earlier ones
+    order = sorted(range(len(sections)), key=lambda i: (sections[i].priority, -i))
+    for i in order:
+        excess = total() - report.budget_tokens
+        if excess <= 0:
+            break
+        if kept[i] == 0:
+            continue
+        target = kept[i] - excess
+        kept[i] = target if target >= max(sections[i].min_tokens, 1) else 0
+
+    parts: List[str] = []
+    for s, t, k in zip(sections, toks, kept):
+        status = "kept" if k == len(t) else ("dropped" if k == 0 else "trimmed")
+        report.sections.append(PackedSection(s.name, s.priority, len(t), k, status))
+        if k == 0:
+            continue
+        parts.append(s.text.strip() if k == len(t) else tokens.detokenize(t[:k]).strip())
+
+    return "\n\n".join(p for p in parts if p), report
@@ -0,0 +1,146 @@
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+from llama_cpp.llama_grammar import LlamaGrammar, json_schema_to_gbnf
+
+from system.sys_components.swe.swe_components.artifact_manager.document_codec.implementation.document_codec import document_codec
+from system.sys_components.swe.swe_interfaces.implementation.if_document_codec import artifact_blob
+from system.sys_components.swe.swe_interfaces.implementation.if_task import output_definition
+
+
+@dataclass(frozen=True)
+class OutputSchema:
+    """
+    Structure the model output must have. For YAML only the top-level mapping is enforced
+    (required keys in order; a value is inline, inline with indented continuation lines such
+    as a block scalar, or an indented block); JSON uses a full JSON schema.
+    """
+    fmt: str = "yaml"                       # "yaml" | "json"
+    required_keys: Tuple[str, ...] = ()
+    allow_extra_keys: bool = True
+    json_schema: Optional[str] = None       # JSON text, so the schema stays hashable
+
+    def key(self) -> str:
+        return json.dumps(
+            [self.fmt, list(self.required_keys), self.allow_extra_keys, self.json_schema],
+            ensure_ascii=False,
+        )
+
+
+@dataclass
+class StructuredOutputStats:
+    requests: int = 0
+    attempts: int = 0
+    failures: int = 0           # requests that never produced decodable output
+    wasted_tokens: int = 0      # completion tokens of attempts that were thrown away
+
+    @property
+    def retries(self) -> int:
+        return self.attempts - self.requests
+
+    @property
+    def retry_rate(self) -> float:
+        return self.retries / self.requests if self.requests else 0.0
+
+
+# any JSON value; an empty schema ({}) would be compiled to "object"
+_ANY_JSON = {"type": ["object", "array", "string", "number", "boolean", "null"]}
+
+
+def _json_value_schema(value: Any) -> dict:
+    """JSON schema for a template value: its type, and the keys / item shape of nested values."""
+    if isinstance(value, dict):
+        return {"type": "object", "properties": {str(k): _json_value_schema(v) for k, v in value.items()}}
+    if isinstance(value, list):
+        return {"type": "array", "items": _json_value_schema(value[0])} if value else {"type": "array"}
+    if isinstance(value, bool):
+        return {"type": "boolean"}
+    if isinstance(value, (int, float)):
+        return {"type": "number"}
+    if isinstance(value, str):
+        return {"type": "string"}
+    return dict(_ANY_JSON)
+
+
+def schema_from_output_definition(
+    definition: output_definition,
+    template: Any = None,
+    allow_extra_keys: bool = True,
+) -> Optional[OutputSchema]:
+    """
+    OutputSchema for a task output. template is the decoded template document (if the output
+    has one); its top-level keys become required keys, and for JSON its values give the value
+    types. md/txt outputs are not constrained.
+    """
+    fmt = ((definition.formatting.format_type if definition.formatting else None) or "yaml").lower()
+    fmt = "yaml" if fmt == "yml" else fmt
+    if fmt not in ("yaml", "json"):
+        return None
+
+    keys = tuple(str(k) for k in template) if isinstance(template, dict) else ()
+    json_schema = None
+    if fmt == "json":
+        json_schema = json.dumps(
+            {
+                "type": "object",
+                "properties": {str(k): _json_value_schema(v) for k, v in template.items()} if keys else {},
+                "required": list(keys),
+                "additionalProperties": allow_extra_keys,
+            },
+            ensure_ascii=False,
+        )
+    return OutputSchema(fmt=fmt, required_keys=keys, allow_extra_keys=allow_extra_keys, json_schema=json_schema)
+
+
+def _gbnf_literal(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def yaml_gbnf(schema: OutputSchema) -> str:
+    """GBNF for a top-level YAML mapping with the required keys, in order."""
+    rules = []
+    entries = []
+    for i, key in enumerate(schema.required_keys):
+        rules.append(f"entry{i} ::= {_gbnf_literal(key + ':')} value")
+        entries.append(f"entry{i}")
+    if schema.allow_extra_keys or not entries:
+        entries.append("extra*")
+        rules.append('extra ::= key ":" value')
+        rules.append("key ::= [a-zA-Z_] [a-zA-Z0-9_.-]*")
+    rules += [
+        # "key: x", "key: |" + indented lines, or "key:" + an indented block (mapping, list, ...)
+        'value ::= inline? "\\n" line*',
+        'inline ::= " " [^\\n#] [^\\n]*',
+        # nested content: indented lines or a zero-indent list under the key; blank lines occur in block scalars
+        'line ::= ("  " | "- ") [^\\n]* "\\n" | "\\n"',
+    ]
+    return "\n".join([f"root ::= {' '.join(entries)}"] + rules) + "\n"
+
+
+def compile_gbnf(schema: OutputSchema) -> str:
+    if schema.fmt == "json":
+        return json_schema_to_gbnf(schema.json_schema or '{"type": "object"}')
+    return yaml_gbnf(schema)
+
+
+@lru_cache(maxsize=128)
+def grammar_for(schema: OutputSchema) -> LlamaGrammar:
+    """Compiled llama.cpp grammar, cached per schema (parsing GBNF is not free)."""
+    return LlamaGrammar.from_string(compile_gbnf(schema), verbose=False)
+
+
+_codec = document_codec()
+
+
+def decode_output(text: str, schema: OutputSchema) -> Any:
+    """Decode like the artifact pipeline does; raises ValueError when keys are missing."""
+    doc = _codec.decode(artifact_blob(kind="llm_output", id="", raw=text, fmt=schema.fmt))
+    if schema.required_keys:
+        if not isinstance(doc, dict):
+            raise ValueError(f"expected a mapping, got {type(doc).__name__}")
+        missing = [k for k in schema.required_keys if k not in doc]
+        if missing:
+            raise ValueError(f"missing keys: {missing}")
+    return doc
@@ -1,11 +1,44 @@
 import logging
+import math
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Generator, List, Optional, Sequence, Tuple, Union
 
+import llama_cpp
 from llama_cpp import (
-    Llama,
     llama_supports_gpu_offload,   # low-level capability check
 )
+from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+from system.sys_components.swe.swe_components.llm.local.implementation.autotune import load_tuning, physical_cores
+from system.sys_components.swe.swe_components.llm.local.implementation.context_packer import (
+    ContextSection,
+    PackingReport,
+    TokenCache,
+    pack_sections,
+)
+from system.sys_components.swe.swe_components.llm.local.implementation.grammar import (
+    OutputSchema,
+    StructuredOutputStats,
+    decode_output,
+    grammar_for,
+)
+from system.sys_components.swe.swe_components.llm.local.implementation.model_pool import (
+    LoadReport,
+    ModelKey,
+    ModelPool,
+    get_model_pool,
+    kv_cache_settings,
+)
+from system.sys_components.swe.swe_components.llm.local.implementation.prefix_cache import PrefixStateCache, get_prefix_cache
+from system.sys_components.swe.swe_components.llm.local.implementation.response_cache import (
+    ResponseCache,
+    get_response_cache,
+    response_key,
+)
+from system.sys_components.swe.swe_components.llm.local.implementation.session_state import SessionStore, get_session_store
+from system.sys_components.swe.swe_components.llm.local.implementation.speculative import CountingDraft, acceptance_ratio
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import KNOWN_LLM_ERRORS, LocalLlmError, llm_answer
 
 # ---- basic logging setup ----
 logging.basicConfig(
@@ -18,6 +51,9 @@ logging.basicConfig(
 class LLMConfig:
     model_path: str
     n_ctx: int = 16384          # you can bump this towards 32768 if RAM/VRAM allows
+    # smaller contexts to choose from per request (prompt + max_tokens); each bucket is its own
+    # llama.cpp context over the one loaded model, so a short prompt only pays a small KV cache
+    ctx_buckets: Tuple[int, ...] = ()
     n_gpu_layers: int = -1     # "all layers" *if* GPU offload is actually available
     n_batch: int = 512
     n_threads: int = 16
@@ -26,11 +62,93 @@ class LLMConfig:
     top_p: float = 0.9
     repeat_penalty: float = 1.1
     max_tokens: int = 2048
+    seed: Optional[int] = None      # fixed seed makes sampling reproducible (and cache hits exact)
+
+    # speculative decoding: a small model with the same vocabulary, or prompt lookup (n-gram
+    # matches in the prompt, no extra model) for outputs that copy large parts of the input
+    draft_model_path: Optional[str] = None
+    draft_n_ctx: int = 0                # context of the draft model; 0 = n_ctx (the largest bucket)
+    draft_tokens: int = 8               # tokens proposed per round by the draft model
+    prompt_lookup_tokens: int = 0       # >0 enables prompt lookup; ignored when draft_model_path is set
+
+    use_mmap: bool = True           # map weights instead of reading them; pages load on first touch
+    use_mlock: bool = False         # pin weights in RAM (needs a sufficient RLIMIT_MEMLOCK)
+    type_k: Optional[str] = None    # KV cache quantisation, e.g. "q8_0" (about half of f16)
+    type_v: Optional[str] = None    # a quantised V cache needs flash_attn (enabled automatically)
+    flash_attn: bool = False
+    lazy_load: bool = False         # load weights on the first run; tokenization uses a vocab_only load
+    verbose: bool = True            # llama.cpp load log (shows whether CUDA / Metal / CPU is used)
+
+    use_prefix_cache: bool = True   # snapshot/restore KV state of the shared prompt prefix
+    use_response_cache: bool = True # only has an effect once configure_response_cache() was called
+
+    @classmethod
+    def tuned(cls, model_path: str, **overrides) -> "LLMConfig":
+        """
+        Config with n_threads / n_batch / n_gpu_layers from the autotune table for this model
+        and host (python autotune.py --model ...); untuned models get physical-core threads.
+        """
+        tuning = load_tuning(model_path) or {}
+        hw = dict(
+            n_threads=tuning.get("n_threads", physical_cores()),
+            n_batch=tuning.get("n_batch", 512),
+            n_gpu_layers=tuning.get("n_gpu_layers", -1),
+        )
+        hw.update(overrides)
+        return cls(model_path=model_path, **hw)
+
+
+@dataclass
+class RenderedPrompt:
+    tokens: List[int]
+    prefix_len: int     # leading tokens shared across calls (system prompt + shared_prefix)
+    stop: List[str]
+
+
+def drain_stream(stream: Generator[str, None, llm_answer], on_token: Optional[Callable[[str], None]] = None) -> llm_answer:
+    """Consume a run_stream() generator, forwarding deltas to on_token, and return its llm_answer."""
+    while True:
+        try:
+            delta = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        if on_token is not None:
+            on_token(delta)
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in 0..100; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def ctx_buckets(cfg: LLMConfig) -> Tuple[int, ...]:
+    """Context sizes an engine can run with, ascending; the largest is always cfg.n_ctx."""
+    return tuple(sorted({b for b in cfg.ctx_buckets if 0 < b < cfg.n_ctx} | {cfg.n_ctx}))
+
+
+def _perf_ctx(llm):
+    # llama_perf_context exists since llama-cpp-python 0.3; older builds have no per-context counters
+    if getattr(llama_cpp, "llama_perf_context", None) is None:
+        return None
+    return getattr(getattr(llm, "_ctx", None), "ctx", None)
 
 
 class LLMEngine:
-    def __init__(self, cfg: LLMConfig):
+    def __init__(
+        self,
+        cfg: LLMConfig,
+        pool: Optional[ModelPool] = None,
+        prefix_cache: Optional[PrefixStateCache] = None,
+        response_cache: Optional[ResponseCache] = None,
+    ):
         self.cfg = cfg
+        self.pool = pool or get_model_pool()
+        self.prefix_cache = (prefix_cache or get_prefix_cache()) if cfg.use_prefix_cache else None
+        self.response_cache = (response_cache or get_response_cache()) if cfg.use_response_cache else None
+        self._formatter = None
 
         # ---- check if this build even supports GPU ----
         gpu_supported = llama_supports_gpu_offload()
@@ -45,78 +163,621 @@ class LLMEngine:
                 cfg.n_gpu_layers,
             )
 
-        # ---- init model (verbose=True prints backend info: CUDA/CPU, layers, etc.) ----
-        t0 = time.perf_counter()
-        self.llm = Llama(
-            model_path=cfg.model_path,
-            n_ctx=cfg.n_ctx,
-            n_gpu_layers=cfg.n_gpu_layers,
-            n_batch=cfg.n_batch,
-            n_threads=cfg.n_threads,
-            verbose=True,  # this will print whether CUDA / Metal / CPU backend is used
+        self._vocab = None                  # leased vocab_only instance for tokenizing
+        self.buckets = ctx_buckets(cfg)
+        self.n_ctx_active = self.buckets[0]
+        self.load_report: Optional[LoadReport] = None
+        if not cfg.lazy_load:
+            self.load()
+
+        self.tokens = TokenCache(
+            tokenize=lambda text: self.tokenizer.tokenize(text.encode("utf-8"), add_bos=False, special=False),
+            detokenize=lambda toks: self.tokenizer.detokenize(toks).decode("utf-8", errors="ignore"),
         )
+        self.last_packing: Optional[PackingReport] = None
+        self.last_messages: List[Dict[str, str]] = []
+        self.output_stats: Dict[str, StructuredOutputStats] = {
+            "constrained": StructuredOutputStats(),
+            "unconstrained": StructuredOutputStats(),
+        }
+
+    @property
+    def llm(self):
+        """
+        The model of the active context bucket, loaded if necessary. It is not leased: the pool
+        may evict it once idle, so use it for inspection only; run_stream leases per request.
+        """
+        return self.load()
+
+    def load(self, n_ctx: Optional[int] = None):
+        """
+        Make sure the model for a context bucket is resident in the process-wide pool (loads on
+        first use, shared afterwards). No lease is kept, so an idle engine does not pin memory.
+        """
+        n_ctx = n_ctx or self.n_ctx_active
+        cfg = self._cfg_for(n_ctx)
+        t0 = time.perf_counter()
+        llm = self.pool.acquire(cfg)
+        self.pool.release(cfg)
         t1 = time.perf_counter()
+        self.load_report = self.pool.load_report(cfg)
         logging.info(
-            "Model loaded from '%s' in %.2f s (n_ctx=%d, n_gpu_layers=%d, n_batch=%d, n_threads=%d)",
-            cfg.model_path,
+            "Model ready from '%s' in %.2f s (n_ctx=%d, n_gpu_layers=%d, n_batch=%d, n_threads=%d, mmap=%s, mlock=%s)",
+            self.cfg.model_path,
             t1 - t0,
-            cfg.n_ctx,
-            cfg.n_gpu_layers,
-            cfg.n_batch,
-            cfg.n_threads,
+            n_ctx,
+            self.cfg.n_gpu_layers,
+            self.cfg.n_batch,
+            self.cfg.n_threads,
+            self.cfg.use_mmap,
+            self.cfg.use_mlock,
         )
+        self.n_ctx_active = n_ctx
+        return llm
+
+    def select_context(self, n_tokens: int) -> int:
+        """Pick the smallest context bucket holding n_tokens (prompt + max_tokens)."""
+        n_ctx = next((b for b in self.buckets if b >= n_tokens), self.buckets[-1])
+        if n_ctx != self.n_ctx_active:
+            logging.info("Using n_ctx=%d for %d tokens (buckets %s)", n_ctx, n_tokens, list(self.buckets))
+        self.n_ctx_active = n_ctx
+        return n_ctx
+
+    @property
+    def kv_cache(self) -> Tuple[str, str, bool]:
+        """(type_k, type_v, flash_attn) of this engine's contexts; saved states only load into the same."""
+        return kv_cache_settings(ModelKey.from_config(self.cfg))
+
+    def _cfg_for(self, n_ctx: int) -> LLMConfig:
+        if n_ctx == self.cfg.n_ctx:
+            return self.cfg
+        # the bucket contexts share the draft of whichever loads first, so it is sized for the largest
+        return replace(self.cfg, n_ctx=n_ctx, draft_n_ctx=max(self.cfg.draft_n_ctx, self.cfg.n_ctx))
+
+    @property
+    def tokenizer(self):
+        """Tokenizer and metadata: a vocab_only instance, leased until close()."""
+        if self._vocab is None:
+            self._vocab = self.pool.acquire(self.cfg, vocab_only=True)
+        return self._vocab
+
+    @property
+    def loaded(self) -> bool:
+        return self.pool.load_report(self._cfg_for(self.n_ctx_active)) is not None
+
+    def reset(self) -> None:
+        """Forget the evaluated tokens of this engine's resident contexts, so the next prompt is evaluated cold."""
+        for n_ctx in self.buckets:
+            cfg = self._cfg_for(n_ctx)
+            if self.pool.load_report(cfg) is None:
+                continue
+            llm = self.pool.acquire(cfg)
+            try:
+                with self.pool.inference_lock(cfg):
+                    llm.reset()
+            finally:
+                self.pool.release(cfg)
+
+    def close(self) -> None:
+        """Give the tokenizer back to the pool. Models are leased per request and stay loaded until evicted."""
+        if self._vocab is not None:
+            self.pool.release(self.cfg, vocab_only=True)
+            self._vocab = None
+
+    def run(
+        self,
+        *,
+        system_prompt: str,
+        user_prompt: str,
+        extra_context: Union[str, Sequence[ContextSection]] = "",
+        shared_prefix: str = "",
+        bypass_cache: bool = False,
+        output_schema: Optional[OutputSchema] = None,
+    ) -> str:
+        """
+        extra_context is where future RAG output will be injected: plain text or prioritised
+        ContextSections. It is packed into what is left of n_ctx after the prompt and max_tokens;
+        low-priority sections are trimmed or dropped first (see context_packer).
 
-    def run(self, *, system_prompt: str, user_prompt: str, extra_context: str = "") -> str:
+        shared_prefix is the part of the user message that is identical across calls
+        (System / Project / Task metadata preamble). Together with the system prompt it is
+        evaluated once and restored from the prefix cache afterwards.
+
+        bypass_cache skips the response cache lookup (the fresh answer still replaces the entry).
+
+        output_schema constrains decoding with a llama.cpp grammar, so the output is structurally
+        valid YAML/JSON (see grammar.py; run_structured also decodes and retries).
         """
-        extra_context is where future RAG output will be injected.
-        For now you can just concatenate it.
+        return self.complete(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            extra_context=extra_context,
+            shared_prefix=shared_prefix,
+            bypass_cache=bypass_cache,
+            output_schema=output_schema,
+        ).response_text
+
+    def complete(self, *, on_token: Optional[Callable[[str], None]] = None, **kwargs) -> llm_answer:
+        """Same as run(), but returns the llm_answer with timings. on_token sees every text delta."""
+        return drain_stream(self.run_stream(**kwargs), on_token)
+
+    def run_stream(
+        self,
+        *,
+        system_prompt: str,
+        user_prompt: str,
+        extra_context: Union[str, Sequence[ContextSection]] = "",
+        shared_prefix: str = "",
+        bypass_cache: bool = False,
+        output_schema: Optional[OutputSchema] = None,
+        prefill: str = "",
+        resume_state: Any = None,
+        history: Sequence[Dict[str, str]] = (),
+        on_release: Optional[Callable[[Any], None]] = None,
+        max_tokens: Optional[int] = None,
+        resume_n_ctx: Optional[int] = None,
+        resume_kv_cache: Sequence[Any] = (),
+    ) -> Generator[str, None, llm_answer]:
         """
-        full_user = user_prompt
-        if extra_context:
-            full_user = (
-                "Additional context:\n"
-                + extra_context.strip()
-                + "\n\nTask:\n"
-                + user_prompt.strip()
+        Yields text deltas as they are generated. The generator's return value
+        (StopIteration.value, or use drain_stream) is the final llm_answer.
+        Closing the generator early stops generation.
+
+        prefill / resume_state continue a preempted generation: prefill is the text generated
+        so far (appended to the prompt, not yielded again) and resume_state the llm.save_state()
+        taken at that point. llama.cpp then keeps the KV prefix shared with the restored state, so
+        only the tokens after it (at least the last one) are evaluated again. Prefill needs a
+        chat template. A state is only restored into a context of the size it was saved in
+        (resume_n_ctx, by default the length of its token buffer) and with the same KV-cache
+        settings (resume_kv_cache, see model_pool.kv_cache_settings; empty if unknown); if that
+        bucket cannot hold this request or the settings differ, the state is dropped and the
+        prompt evaluated from scratch.
+
+        history holds earlier user/assistant turns, placed between the system prompt and this
+        user message (see run_batch); it counts against the extra_context packing budget.
+
+        The pooled model may be shared with other engines and threads, so it is locked from
+        prompt evaluation until the generator finishes or is closed; consume the generator from
+        one thread. on_release is called with the Llama just before the lock is given up (also
+        after an early close, not on a response-cache hit): the place to take llm.save_state().
+
+        max_tokens overrides cfg.max_tokens for this call only.
+        """
+        max_tokens = max_tokens or self.cfg.max_tokens
+        context_text, self.last_packing = self.pack_context(system_prompt, user_prompt, extra_context, shared_prefix, max_tokens, history)
+        messages = self.build_messages(system_prompt, user_prompt, context_text, shared_prefix)
+        if history:
+            messages = messages[:1] + list(history) + messages[1:]
+        self.last_messages = messages
+
+        # ---- response cache: identical model input + sampling settings -> stored answer ----
+        cache_key = None
+        if self.response_cache is not None and not prefill:
+            cache_key = self._response_key(messages, output_schema, max_tokens)
+            if bypass_cache:
+                self.response_cache.note_bypass()
+            else:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    logging.info("Response cache hit (%d chars, originally %.2f s)", len(cached.response_text), cached.execution_time)
+                    yield cached.response_text
+                    return cached
+
+        # ---- timing starts before prompt handling, so TTFT includes prompt evaluation ----
+        t0 = time.perf_counter()
+        rendered = self.render_prompt(messages, boundary=shared_prefix or system_prompt)
+        if prefill:
+            if rendered is None:
+                raise ValueError("Continuing a generation (prefill) needs a model with a chat template")
+            prefill_tokens = self.tokens.tokens(prefill)
+            rendered = RenderedPrompt(rendered.tokens + prefill_tokens, rendered.prefix_len, rendered.stop)
+            max_tokens = max(max_tokens - len(prefill_tokens), 1)
+
+        # ---- fail before spending prompt-eval time on a prompt that cannot fit ----
+        n_prompt = len(rendered.tokens) if rendered is not None else self.tokens.count("\n\n".join(m["content"] for m in messages))
+        if n_prompt + max_tokens > self.cfg.n_ctx:
+            raise LocalLlmError(
+                KNOWN_LLM_ERRORS["LLM_CONTEXT_OVERFLOW"],
+                details={"prompt_tokens": n_prompt, "max_tokens": max_tokens, "n_ctx": self.cfg.n_ctx},
             )
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": full_user},
-        ]
+        # ---- smallest context that fits; KV buffers differ per bucket, weights are shared ----
+        n_ctx = None
+        if resume_state is not None:
+            # a state only fits the context it was saved in (llama-cpp copies its n_ctx-sized buffers)
+            n_ctx = resume_n_ctx or len(getattr(resume_state, "input_ids", ())) or None
+            if n_ctx not in self.buckets or n_prompt + max_tokens > n_ctx:
+                logging.warning(
+                    "Saved state is for n_ctx=%s, which cannot hold %d tokens here (buckets %s); evaluating from scratch",
+                    n_ctx,
+                    n_prompt + max_tokens,
+                    list(self.buckets),
+                )
+                resume_state = n_ctx = None
+            elif resume_kv_cache and tuple(resume_kv_cache) != self.kv_cache:
+                logging.warning(
+                    "Saved state is for KV cache %s, this engine uses %s; evaluating from scratch",
+                    tuple(resume_kv_cache),
+                    self.kv_cache,
+                )
+                resume_state = n_ctx = None
+        if n_ctx is None:
+            n_ctx = self.select_context(n_prompt + max_tokens)
+        cfg = self._cfg_for(n_ctx)
+
+        # ---- lease the model for this request only, so idle engines leave it evictable ----
+        llm = self.pool.acquire(cfg)
+        self.load_report = self.pool.load_report(cfg)
+        try:
+            with self.pool.inference_lock(cfg):
+                try:
+                    answer = yield from self._decode(llm, rendered, messages, n_prompt, max_tokens, t0, resume_state, output_schema)
+                finally:
+                    if on_release is not None:
+                        on_release(llm)
+        finally:
+            self.pool.release(cfg)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, answer, meta={"model_path": self.cfg.model_path})
+        return answer
+
+    def _decode(
+        self,
+        llm: Any,
+        rendered: Optional[RenderedPrompt],
+        messages: List[Dict[str, str]],
+        n_prompt: int,
+        max_tokens: int,
+        t0: float,
+        resume_state: Any,
+        output_schema: Optional[OutputSchema],
+    ) -> Generator[str, None, llm_answer]:
+        """Prompt evaluation and decoding on llm; run_stream holds its lease and lock."""
+        if resume_state is not None:
+            llm.load_state(resume_state)
+        elif rendered is not None and self.prefix_cache is not None:
+            tp = time.perf_counter()
+            self.prefix_cache.restore_or_build(
+                llm,
+                self.cfg.model_path,
+                rendered.tokens[: rendered.prefix_len],
+                self.kv_cache,
+            )
+            logging.info("Prefix of %d tokens ready in %.2f s", rendered.prefix_len, time.perf_counter() - tp)
 
-        # ---- timing the actual inference ----
-        t0 = time.perf_counter()
-        out = self.llm.create_chat_completion(
-            messages=messages,
+        sampling = dict(
             temperature=self.cfg.temperature,
             top_p=self.cfg.top_p,
             repeat_penalty=self.cfg.repeat_penalty,
-            max_tokens=self.cfg.max_tokens,
+            max_tokens=max_tokens,
+            stream=True,
         )
+        if self.cfg.seed is not None:
+            sampling["seed"] = self.cfg.seed
+        if output_schema is not None:
+            sampling["grammar"] = grammar_for(output_schema)
+
+        # ---- KV reuse: llama-cpp keeps the common prefix with its last input (always re-evaluating one token) ----
+        cache_hit = None
+        if rendered is not None:
+            cache_hit = min(
+                llm.longest_token_prefix(llm._input_ids[: llm.n_tokens].tolist(), rendered.tokens),
+                len(rendered.tokens) - 1,
+            )
+        perf_ctx = _perf_ctx(llm)
+        if perf_ctx is not None:
+            llama_cpp.llama_perf_context_reset(perf_ctx)
+
+        if rendered is not None:
+            chunks = llm.create_completion(prompt=rendered.tokens, stop=rendered.stop, **sampling)
+        else:
+            chunks = llm.create_chat_completion(messages=messages, **sampling)
+
+        draft = llm.draft_model if isinstance(getattr(llm, "draft_model", None), CountingDraft) else None
+        draft_before = draft.snapshot() if draft is not None else None
+
+        parts: List[str] = []
+        t_first = None
+        t_last = None
+        gaps: List[float] = []
+        try:
+            for chunk in chunks:
+                choice = chunk["choices"][0]
+                delta = choice.get("text") if rendered is not None else (choice.get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                now = time.perf_counter()
+                if t_first is None:
+                    t_first = now
+                else:
+                    gaps.append(now - t_last)
+                t_last = now
+                parts.append(delta)
+                yield delta
+        finally:
+            chunks.close()
         t1 = time.perf_counter()
 
         elapsed = t1 - t0
-        usage = out.get("usage", {}) or {}
-        prompt_tokens = usage.get("prompt_tokens")
-        completion_tokens = usage.get("completion_tokens")
-        total_tokens = usage.get("total_tokens")
-
-        # crude tokens/s – only completion tokens are interesting for generation speed
-        tok_s = None
-        if completion_tokens is not None and elapsed > 0:
-            tok_s = completion_tokens / elapsed
+        # llama-cpp streams (roughly) one chunk per sampled token
+        completion_tokens = len(parts)
+        prompt_tokens = n_prompt  # exact with a chat template, a close estimate without
+        ttft = t_first - t0 if t_first is not None else None
+        itl = sum(gaps) / len(gaps) if gaps else None
+
+        # ---- split prompt evaluation from decoding: llama.cpp's counters if available, else wall clock ----
+        if perf_ctx is not None:
+            perf = llama_cpp.llama_perf_context(perf_ctx)
+            prompt_eval_s = perf.t_p_eval_ms / 1000
+            decode_s = perf.t_eval_ms / 1000
+            decode_tokens = perf.n_eval
+        else:
+            prompt_eval_s = ttft
+            decode_s = (t_last - t_first) if t_first is not None else None
+            decode_tokens = max(completion_tokens - 1, 0)
+        tok_s = decode_tokens / decode_s if decode_s else 0.0
+        accepted = acceptance_ratio(draft_before, draft.snapshot()) if draft is not None else None
+
+        itl_p50 = percentile(gaps, 50)
+        itl_p95 = percentile(gaps, 95)
 
         logging.info(
-            "Inference finished in %.2f s | prompt=%s, completion=%s, total=%s, gen_speed=%s tok/s",
+            "Inference finished in %.2f s | prompt=%s (cached %s), completion=%s, prompt_eval=%s s, ttft=%s s, "
+            "decode=%s s, itl p50/p95=%s/%s ms, gen_speed=%.1f tok/s",
             elapsed,
             prompt_tokens,
+            cache_hit,
             completion_tokens,
-            total_tokens,
-            f"{tok_s:.1f}" if tok_s is not None else "n/a",
+            f"{prompt_eval_s:.2f}" if prompt_eval_s is not None else "n/a",
+            f"{ttft:.2f}" if ttft is not None else "n/a",
+            f"{decode_s:.2f}" if decode_s is not None else "n/a",
+            f"{itl_p50 * 1000:.1f}" if itl_p50 is not None else "n/a",
+            f"{itl_p95 * 1000:.1f}" if itl_p95 is not None else "n/a",
+            tok_s,
         )
+        if draft is not None:
+            logging.info(
+                "Speculative decoding (%s): accepted %s of proposed draft tokens",
+                draft.kind,
+                f"{accepted:.0%}" if accepted is not None else "n/a",
+            )
 
-        return out["choices"][0]["message"]["content"]
+        answer = llm_answer(
+            execution_time=elapsed,
+            generation_speed=tok_s,
+            response_text="".join(parts),
+            time_to_first_token=ttft,
+            inter_token_latency=itl,
+            draft_acceptance_ratio=accepted,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            prompt_eval_time=prompt_eval_s,
+            decode_time=decode_s,
+            inter_token_latency_p50=itl_p50,
+            inter_token_latency_p95=itl_p95,
+            cache_hit_tokens=cache_hit,
+        )
+        return answer
+
+    def _response_key(
+        self, messages: List[Dict[str, str]], output_schema: Optional[OutputSchema] = None, max_tokens: Optional[int] = None
+    ) -> str:
+        return response_key(
+            model_path=self.cfg.model_path,
+            chat_template=(self.tokenizer.metadata or {}).get("tokenizer.chat_template", ""),
+            messages=messages,
+            temperature=self.cfg.temperature,
+            top_p=self.cfg.top_p,
+            repeat_penalty=self.cfg.repeat_penalty,
+            max_tokens=max_tokens or self.cfg.max_tokens,
+            seed=self.cfg.seed,
+            output_schema=output_schema.key() if output_schema is not None else "",
+        )
+
+    # ---- chained batches ----
+
+    def run_batch(
+        self,
+        *,
+        system_prompt: str,
+        user_prompt: str,
+        task_instance_id: str,
+        batch_id: str,
+        previous_batch_id: Optional[str] = None,
+        store: Optional[SessionStore] = None,
+        **kwargs: Any,
+    ) -> llm_answer:
+        """
+        One batch of a chained unit (scheduler: batch2 has previous_batch "batch1"). user_prompt
+        holds only this batch's new chunk; the conversation and llama.cpp state of the previous
+        batch are restored from the session store, so earlier chunks are not evaluated again.
+        The state after this batch's answer is saved under (task_instance_id, batch_id).
+        Without a configured store every batch runs on its own.
+        """
+        store = store or get_session_store()
+        snapshot = None
+        if store is not None and previous_batch_id:
+            snapshot = store.load(task_instance_id, previous_batch_id, self.cfg.model_path)
+            if snapshot is None:
+                logging.warning("No session snapshot for %s/%s; batch %s starts fresh", task_instance_id, previous_batch_id, batch_id)
+
+        history = snapshot.messages[1:] if snapshot is not None else []
+        states: List[Tuple[Any, int]] = []
+        answer = self.complete(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            history=history,
+            resume_state=snapshot.state if snapshot is not None else None,
+            resume_n_ctx=(snapshot.n_ctx or None) if snapshot is not None else None,
+            resume_kv_cache=snapshot.kv_cache if snapshot is not None else (),
+            on_release=(lambda llm: states.append((llm.save_state(), llm.n_ctx()))) if store is not None else None,
+            **kwargs,
+        )
+
+        if store is not None:
+            messages = self.last_messages + [{"role": "assistant", "content": answer.response_text}]
+            # a response-cache hit never touches the model: keep the conversation without a state,
+            # so the next batch re-evaluates it
+            state, n_ctx = states[0] if states else (None, 0)
+            store.save(task_instance_id, batch_id, self.cfg.model_path, messages, state, n_ctx, self.kv_cache)
+        return answer
+
+    # ---- structured output ----
+
+    def run_structured(
+        self,
+        *,
+        system_prompt: str,
+        user_prompt: str,
+        output_schema: OutputSchema,
+        constrained: bool = True,
+        max_attempts: int = 3,
+        **kwargs,
+    ) -> Tuple[Any, llm_answer]:
+        """
+        Generate until the output decodes through document_codec with the schema's keys.
+        Returns (decoded document, llm_answer). constrained=False skips the grammar, which is
+        only useful to measure retry rate / wasted tokens without it.
+        """
+        stats = self.output_stats["constrained" if constrained else "unconstrained"]
+        stats.requests += 1
+        bypass_cache = kwargs.pop("bypass_cache", False)
+        error = None
+        for attempt in range(max_attempts):
+            stats.attempts += 1
+            answer = self.complete(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                output_schema=output_schema if constrained else None,
+                bypass_cache=bypass_cache or attempt > 0,  # a cached answer would fail the same way
+                **kwargs,
+            )
+            try:
+                doc = decode_output(answer.response_text, output_schema)
+            except Exception as e:
+                error = e
+                stats.wasted_tokens += self.tokens.count(answer.response_text)
+                logging.warning("Output attempt %d/%d does not decode as %s: %s", attempt + 1, max_attempts, output_schema.fmt, e)
+                continue
+            logging.info(
+                "Structured output (%s): retry rate %.2f, %d wasted tokens over %d requests",
+                "constrained" if constrained else "unconstrained",
+                stats.retry_rate,
+                stats.wasted_tokens,
+                stats.requests,
+            )
+            return doc, answer
+        stats.failures += 1
+        raise LocalLlmError(
+            KNOWN_LLM_ERRORS["LLM_OUTPUT_INVALID"],
+            details={"attempts": max_attempts, "format": output_schema.fmt, "error": str(error)},
+        )
+
+    # ---- prompt building ----
+
+    def pack_context(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        extra_context: Union[str, Sequence[ContextSection]],
+        shared_prefix: str,
+        max_tokens: Optional[int] = None,
+        history: Sequence[Dict[str, str]] = (),
+    ) -> Tuple[str, Optional[PackingReport]]:
+        """Fit extra_context into n_ctx - max_tokens - (tokens of everything else, history included)."""
+        if isinstance(extra_context, str):
+            sections = [ContextSection(name="extra_context", text=extra_context)]
+        else:
+            sections = list(extra_context)
+        if not any(s.text for s in sections):
+            return "", None
+
+        bare = self.build_messages(system_prompt, user_prompt, "", shared_prefix)
+        rendered = self.render_prompt(bare[:1] + list(history) + bare[1:], boundary="")
+        if rendered is not None:
+            fixed = len(rendered.tokens)
+        else:
+            fixed = self.tokens.count(system_prompt + "\n\n" + bare[1]["content"])
+            fixed += sum(self.tokens.count(m["content"]) for m in history)
+        fixed += self.tokens.count("Additional context:\n\n\nTask:\n")  # wrapper from build_messages
+
+        budget = self.cfg.n_ctx - (max_tokens or self.cfg.max_tokens) - fixed
+        text, report = pack_sections(sections, budget, fixed, self.tokens)
+        logging.info(
+            "Context packed: budget=%d, fixed=%d, context=%d tokens | %s",
+            report.budget_tokens,
+            report.fixed_tokens,
+            report.context_tokens,
+            ", ".join(f"{p.name}:{p.kept_tokens}/{p.original_tokens} {p.status}" for p in report.sections),
+        )
+        return text, report
+
+    def build_messages(
+        self, system_prompt: str, user_prompt: str, extra_context: str, shared_prefix: str
+    ) -> List[Dict[str, str]]:
+        full_user = user_prompt
+        if extra_context:
+            full_user = (
+                "Additional context:\n"
+                + extra_context.strip()
+                + "\n\nTask:\n"
+                + user_prompt.strip()
+            )
+        if shared_prefix:
+            # shared part first, so it forms a token prefix common to all calls
+            full_user = shared_prefix + full_user
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": full_user},
+        ]
+
+    def render_prompt(self, messages: List[Dict[str, str]], boundary: str) -> Optional[RenderedPrompt]:
+        """
+        Apply the model's own chat template and tokenize, like create_chat_completion would,
+        so the shared prefix is known in tokens before evaluation.
+        Returns None for models without an embedded chat template.
+        """
+        formatter = self._chat_formatter()
+        if formatter is None:
+            return None
+
+        result = formatter(messages=messages)
+        add_bos = not result.added_special
+        tokens = self.tokenizer.tokenize(result.prompt.encode("utf-8"), add_bos=add_bos, special=True)
+
+        prefix_len = 0
+        cut = result.prompt.find(boundary) if boundary else -1
+        if cut >= 0:
+            head = self.tokenizer.tokenize(result.prompt[: cut + len(boundary)].encode("utf-8"), add_bos=add_bos, special=True)
+            # the last token(s) of head may merge differently with what follows; keep only the common part
+            for a, b in zip(head, tokens):
+                if a != b:
+                    break
+                prefix_len += 1
+
+        stop = result.stop or []
+        if isinstance(stop, str):
+            stop = [stop]
+        return RenderedPrompt(tokens=tokens, prefix_len=prefix_len, stop=list(stop))
+
+    def _chat_formatter(self):
+        if self._formatter is None:
+            template = (self.tokenizer.metadata or {}).get("tokenizer.chat_template")
+            if not template:
+                return None
+
+            def token_text(token_id: int) -> str:
+                if token_id == -1:
+                    return ""
+                return self.tokenizer.detokenize([token_id], special=True).decode("utf-8", errors="ignore")
+
+            self._formatter = Jinja2ChatFormatter(
+                template=template,
+                eos_token=token_text(self.tokenizer.token_eos()),
+                bos_token=token_text(self.tokenizer.token_bos()),
+            )
+        return self._formatter
 
 
 if __name__ == "__main__":
@@ -847,9 +1508,12 @@ traceability:
 
 """
 
-    print(engine.run(system_prompt=system_prompt, user_prompt=user_prompt))
+    for delta in engine.run_stream(system_prompt=system_prompt, user_prompt=user_prompt):
+        print(delta, end="", flush=True)
+    print()
 
 
     answer = engine.run(system_prompt=system_prompt, user_prompt=user_prompt)
     print("=== MODEL OUTPUT ===")
     print(answer)
+    logging.info("Model pool stats: %s", engine.pool.stats())
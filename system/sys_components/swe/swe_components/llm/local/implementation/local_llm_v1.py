@@ -1,10 +1,95 @@
+import threading
+from collections import OrderedDict
+from dataclasses import astuple
+from typing import Callable, Tuple
+
 from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import llm_answer, local_llm_port
 from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import llm_config
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm import LLMConfig, LLMEngine
+
+DEFAULT_SYSTEM_PROMPT = "You are a precise software and process architect. Follow the instructions exactly."
+
 
 class local_llm_engine(local_llm_port):
-    def trigger_local_llm (self, prompt: str, settings: llm_config) -> llm_answer:
-        return llm_answer(0.0, 0.0, "This is a dummy response from local_llm_engine.")
-    pass
+    def __init__(self, system_prompt: str = DEFAULT_SYSTEM_PROMPT, lazy_load: bool = False, max_engines: int = 8):
+        self.system_prompt = system_prompt
+        self.lazy_load = lazy_load      # engines load weights on first generation, not on creation
+        self.max_engines = max_engines  # least recently used engines beyond this are closed
+        self._engines: "OrderedDict[Tuple, LLMEngine]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def trigger_local_llm (self, prompt: str, settings: llm_config, on_token: Callable[[str], None] | None = None) -> llm_answer:
+        engine = self.engine_for(settings)
+        return engine.complete(system_prompt=self.system_prompt, user_prompt=prompt, on_token=on_token)
+
+    def trigger_batch(
+        self,
+        prompt: str,
+        settings: llm_config,
+        task_instance_id: str,
+        batch_id: str,
+        previous_batch_id: str | None = None,
+        on_token: Callable[[str], None] | None = None,
+    ) -> llm_answer:
+        """One batch of a chained unit; prompt is only the new chunk (see LLMEngine.run_batch)."""
+        return self.engine_for(settings).run_batch(
+            system_prompt=self.system_prompt,
+            user_prompt=prompt,
+            task_instance_id=task_instance_id,
+            batch_id=batch_id,
+            previous_batch_id=previous_batch_id,
+            on_token=on_token,
+        )
+
+    def engine_for(self, settings: llm_config) -> LLMEngine:
+        # engines are cheap (weights come from the shared model pool and are leased per request),
+        # one per distinct settings
+        key = astuple(settings)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                return engine
+        engine = LLMEngine(LLMConfig(
+            model_path=settings.model_path,
+            n_ctx=settings.n_ctx,
+            ctx_buckets=settings.ctx_buckets,
+            n_gpu_layers=settings.n_gpu_layers,
+            n_batch=settings.n_batch,
+            n_threads=settings.n_threads,
+            temperature=settings.temperature,
+            top_p=settings.top_p,
+            repeat_penalty=settings.repeat_penalty,
+            max_tokens=settings.max_tokens,
+            draft_model_path=settings.draft_model_path,
+            prompt_lookup_tokens=settings.prompt_lookup_tokens,
+            type_k=settings.type_k,
+            type_v=settings.type_v,
+            flash_attn=settings.flash_attn,
+            lazy_load=self.lazy_load,
+        ))
+        evicted = []
+        with self._lock:
+            if key in self._engines:
+                # another thread created it meanwhile
+                evicted.append(engine)
+                engine = self._engines[key]
+            else:
+                self._engines[key] = engine
+                while len(self._engines) > self.max_engines:
+                    evicted.append(self._engines.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+        return engine
+
+    def close(self) -> None:
+        """Close every engine; their models stay in the pool until evicted."""
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for engine in engines:
+            engine.close()
+
 
 if __name__ == "__main__":
     config = llm_config(
@@ -19,4 +104,6 @@ if __name__ == "__main__":
         max_tokens=512
     )
     prompt = "Test prompt"
-    local_llm_engine()
\ No newline at end of file
+    answer = local_llm_engine().trigger_local_llm(prompt, config, on_token=lambda delta: print(delta, end="", flush=True))
+    print()
+    print(f"ttft={answer.time_to_first_token} s, speed={answer.generation_speed:.1f} tok/s")
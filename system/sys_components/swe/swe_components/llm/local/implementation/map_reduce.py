@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm import LLMEngine
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+from system.sys_components.swe.swe_components.llm.local.implementation.model_pool import ModelKey
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import llm_answer
+
+# structural boundaries, strongest first: markdown headings / top-level YAML keys and list items,
+# then blank lines, then single lines
+_TOP_LEVEL = re.compile(r"^(#{1,6}\s|[A-Za-z_][\w.\-]*\s*:|- )")
+_BLANK = re.compile(r"^\s*$")
+
+# room left in every chunk for the chat template and the "Input part" wrapper
+CHUNK_MARGIN_TOKENS = 256
+
+
+@dataclass
+class MapReduceResult:
+    response_text: str
+    chunks: List[str]
+    partials: List[str]
+    cached_chunks: int = 0                   # map calls answered from the runner's chunk cache
+    reduce_rounds: int = 0
+    execution_time: float = 0.0
+    map_answers: List[llm_answer] = field(default_factory=list)
+    reduce_answer: Optional[llm_answer] = None
+
+
+def _split_at(lines: List[str], boundary: re.Pattern) -> List[List[str]]:
+    segments: List[List[str]] = []
+    for line in lines:
+        if not segments or (boundary.match(line) and segments[-1]):
+            segments.append([])
+        segments[-1].append(line)
+    return segments
+
+
+def split_structural(text: str, max_tokens: int, count: Callable[[str], int]) -> List[str]:
+    """
+    Split text into chunks of at most max_tokens, cutting at top-level YAML keys / markdown
+    headings first and falling back to blank lines, then single lines. A single line that is
+    still too long is kept whole; the engine's overflow check reports it.
+
+    Every top-level section is its own chunk, so editing one section leaves the other chunks
+    byte-identical. Only the pieces of a section that had to be split are packed together
+    again, which moves boundaries inside that section only.
+    """
+    levels = [_TOP_LEVEL, _BLANK, None]
+
+    def pieces(lines: List[str], level: int, pack: bool) -> List[str]:
+        block = "".join(lines)
+        if count(block) <= max_tokens or level >= len(levels):
+            return [block]
+        segments = [[l] for l in lines] if levels[level] is None else _split_at(lines, levels[level])
+        if len(segments) == 1:
+            return pieces(lines, level + 1, pack)
+        out: List[str] = []
+        for seg in segments:
+            for piece in pieces(seg, level + 1, True):
+                if pack and out and count(out[-1] + piece) <= max_tokens:
+                    out[-1] += piece
+                else:
+                    out.append(piece)
+        return out
+
+    return [c for c in pieces(text.splitlines(keepends=True), 0, False) if c.strip()]
+
+
+class MapReduceRunner:
+    """
+    Run a task over an input larger than n_ctx: map an extraction prompt over structural
+    chunks, then reduce the partial results (in several rounds if they still do not fit).
+
+    Each engine should own its model (separate ModelPool or different load settings): engines
+    with the same pool and ModelKey would share one Llama and only take turns on it, so they
+    are used once. Map answers are kept in the runner's own chunk cache (keyed by the models,
+    the prompts and the chunk text), so re-runs over an edited document only regenerate the
+    chunks whose text changed.
+    """
+
+    def __init__(self, engines: Sequence[LLMEngine], max_cached_chunks: int = 1024):
+        distinct = {}
+        for e in engines:
+            distinct.setdefault((id(e.pool), ModelKey.from_config(e.cfg)), e)
+        if len(distinct) < len(engines):
+            logging.warning("Map-reduce: %d engine(s) share a model and are ignored", len(engines) - len(distinct))
+        self.engines: List[LLMEngine] = list(distinct.values())
+        self.max_cached_chunks = max_cached_chunks
+        self._chunk_cache: "OrderedDict[str, llm_answer]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+
+    def run(
+        self,
+        *,
+        system_prompt: str,
+        map_prompt: str,
+        reduce_prompt: str,
+        document: str,
+        chunk_tokens: Optional[int] = None,
+        max_reduce_rounds: int = 4,
+    ) -> MapReduceResult:
+        t0 = time.perf_counter()
+        budget = chunk_tokens or self._chunk_budget(system_prompt, max(map_prompt, reduce_prompt, key=len))
+        count = self.engines[0].tokens.count
+
+        chunks = split_structural(document, budget, count)
+        logging.info("Map-reduce: %d chunk(s) of <= %d tokens over %d engine(s)", len(chunks), budget, len(self.engines))
+
+        hits_before = self._cache_hits
+        map_answers = self._map(system_prompt, map_prompt, chunks)
+        cached = self._cache_hits - hits_before
+        partials = [a.response_text.strip() for a in map_answers]
+
+        # ---- reduce, in rounds until the partial results fit one prompt ----
+        rounds = 0
+        while True:
+            rounds += 1
+            joined = "\n\n".join(partials)
+            if count(joined) <= budget or len(partials) == 1 or rounds >= max_reduce_rounds:
+                reduce_answer = self.engines[0].complete(
+                    system_prompt=system_prompt,
+                    shared_prefix=reduce_prompt + "\n\n",
+                    user_prompt="Partial results:\n" + joined,
+                )
+                break
+            groups = split_structural(joined, budget, count)
+            if len(groups) >= len(partials):
+                # grouping does not shrink the input any more; reduce what we have
+                groups = partials
+            partials = [a.response_text.strip() for a in self._map(system_prompt, reduce_prompt, groups)]
+
+        result = MapReduceResult(
+            response_text=reduce_answer.response_text,
+            chunks=chunks,
+            partials=[a.response_text for a in map_answers],
+            cached_chunks=cached,
+            reduce_rounds=rounds,
+            execution_time=time.perf_counter() - t0,
+            map_answers=map_answers,
+            reduce_answer=reduce_answer,
+        )
+        logging.info(
+            "Map-reduce finished in %.2f s | chunks=%d (cached %d), reduce rounds=%d",
+            result.execution_time,
+            len(chunks),
+            cached,
+            rounds,
+        )
+        return result
+
+    # ---- internals ----
+
+    def _chunk_budget(self, system_prompt: str, instruction: str) -> int:
+        fixed = self.engines[0].tokens.count(system_prompt + "\n\n" + instruction)
+        return min(e.cfg.n_ctx - e.cfg.max_tokens for e in self.engines) - fixed - CHUNK_MARGIN_TOKENS
+
+    def _map(self, system_prompt: str, instruction: str, inputs: List[str]) -> List[llm_answer]:
+        results: List[Optional[llm_answer]] = [None] * len(inputs)
+        keys = [self._chunk_key(system_prompt, instruction, text) for text in inputs]
+        todo: List[int] = []
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                hit = self._chunk_cache.get(key)
+                if hit is None:
+                    todo.append(i)
+                    continue
+                self._chunk_cache.move_to_end(key)
+                self._cache_hits += 1
+                results[i] = hit
+
+        def work(engine_idx: int) -> None:
+            engine = self.engines[engine_idx]
+            for i in todo[engine_idx :: len(self.engines)]:
+                # the instruction is the shared prefix, so its KV state is reused across chunks
+                results[i] = engine.complete(
+                    system_prompt=system_prompt,
+                    shared_prefix=instruction + "\n\n",
+                    user_prompt="Input part:\n" + inputs[i],
+                )
+                with self._cache_lock:
+                    self._chunk_cache[keys[i]] = results[i]
+                    while len(self._chunk_cache) > self.max_cached_chunks:
+                        self._chunk_cache.popitem(last=False)
+
+        n = min(len(self.engines), len(todo))
+        if n:
+            with ThreadPoolExecutor(max_workers=n, thread_name_prefix="map-reduce") as pool:
+                for f in [pool.submit(work, i) for i in range(n)]:
+                    f.result()
+        return results  # type: ignore[return-value]
+
+    def _chunk_key(self, system_prompt: str, instruction: str, text: str) -> str:
+        # any engine may answer any chunk, so the key covers all of their models and sampling
+        engines = sorted(
+            [model_digest(e.cfg.model_path), e.cfg.temperature, e.cfg.top_p, e.cfg.repeat_penalty, e.cfg.max_tokens]
+            for e in self.engines
+        )
+        raw = json.dumps([engines, system_prompt, instruction, text], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
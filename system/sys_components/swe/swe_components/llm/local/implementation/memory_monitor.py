@@ -0,0 +1,282 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Optional, Tuple
+
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import KNOWN_LLM_ERRORS, LocalLlmError
+from system.sys_components.swe.swe_components.llm.local.implementation.model_pool import (
+    GIB,
+    ModelKey,
+    ModelPool,
+    get_model_pool,
+)
+
+try:
+    import psutil  # type: ignore
+except Exception:
+    psutil = None
+
+try:
+    import pynvml  # type: ignore
+except Exception:
+    pynvml = None
+
+# layer count assumed when splitting a model between VRAM and RAM by n_gpu_layers
+# (same 7-8B reference model as KV_BYTES_PER_CTX_TOKEN)
+ASSUMED_LAYERS = 32
+
+
+@dataclass(frozen=True)
+class MemorySnapshot:
+    ram_available_bytes: Optional[int]
+    vram_free_bytes: Optional[int]      # summed over all NVIDIA devices; None without NVML
+
+
+@dataclass
+class MemoryMonitorStats:
+    samples: int = 0
+    pressure_events: int = 0            # samples below a headroom threshold
+    unloads: int = 0                    # models unloaded because of memory pressure
+    unloaded_bytes: int = 0             # estimated
+    admitted: int = 0
+    deferred: int = 0                   # loads that had to wait for a lease to be released
+    refused: int = 0
+    last: Optional[MemorySnapshot] = None
+
+
+def _ram_available_bytes() -> Optional[int]:
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+_nvml_ready: Optional[bool] = None
+
+
+def _vram_free_bytes() -> Optional[int]:
+    global _nvml_ready
+    if pynvml is None or _nvml_ready is False:
+        return None
+    try:
+        if _nvml_ready is None:
+            pynvml.nvmlInit()
+            _nvml_ready = True
+        return sum(
+            pynvml.nvmlDeviceGetMemoryInfo(pynvml.nvmlDeviceGetHandleByIndex(i)).free
+            for i in range(pynvml.nvmlDeviceGetCount())
+        )
+    except Exception:
+        # no driver / no device: stop asking
+        _nvml_ready = False
+        return None
+
+
+def sample_memory() -> MemorySnapshot:
+    """Currently available RAM (psutil, like resource_manager) and free VRAM (NVML, if present)."""
+    return MemorySnapshot(ram_available_bytes=_ram_available_bytes(), vram_free_bytes=_vram_free_bytes())
+
+
+def split_need(key: ModelKey, est_bytes: int) -> Tuple[int, int]:
+    """(ram, vram) bytes a load needs; offloaded layers go to VRAM proportionally."""
+    if key.vocab_only or key.n_gpu_layers == 0:
+        return est_bytes, 0
+    share = 1.0 if key.n_gpu_layers < 0 else min(1.0, key.n_gpu_layers / ASSUMED_LAYERS)
+    vram = int(est_bytes * share)
+    return est_bytes - vram, vram
+
+
+class MemoryMonitor:
+    """
+    Keeps the model pool within the memory that is actually free on the machine, which on a
+    shared box is less than the static budget.
+
+    A background thread samples available RAM/VRAM every interval_s; below the headroom it
+    unloads pool models that have been idle for idle_s (least recently used first). Before a
+    load, admit() checks the estimated need against what is free, unloads idle models if
+    required, then waits up to defer_s for leased models to be released, and finally raises
+    LLM_RESOURCE_EXHAUSTED instead of letting the process run out of memory.
+    """
+
+    def __init__(
+        self,
+        pool: ModelPool,
+        ram_headroom_bytes: int = 2 * GIB,
+        vram_headroom_bytes: int = GIB // 2,
+        idle_s: float = 60.0,
+        interval_s: float = 5.0,
+        defer_s: float = 30.0,
+        sampler: Callable[[], MemorySnapshot] = sample_memory,
+    ):
+        self.pool = pool
+        self.ram_headroom_bytes = ram_headroom_bytes
+        self.vram_headroom_bytes = vram_headroom_bytes
+        self.idle_s = idle_s
+        self.interval_s = interval_s
+        self.defer_s = defer_s
+        self._sampler = sampler
+        self._stats = MemoryMonitorStats()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- public API ----
+
+    def start(self) -> "MemoryMonitor":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="llm-memory-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> MemorySnapshot:
+        """One monitoring step: sample, and unload idle models if headroom is too low."""
+        snap = self._sample()
+        deficit = self._deficit(snap, 0, 0)
+        if deficit > 0:
+            with self._stats_lock:
+                self._stats.pressure_events += 1
+            logging.warning(
+                "Memory pressure: RAM available %s GiB, VRAM free %s GiB; unloading models idle > %.0f s",
+                _gib(snap.ram_available_bytes),
+                _gib(snap.vram_free_bytes),
+                self.idle_s,
+            )
+            self._unload(self.idle_s, deficit, reason="memory pressure")
+        return snap
+
+    def admit(self, key: ModelKey, est_bytes: int) -> None:
+        """
+        Called by ModelPool before a load or an extra context, WITHOUT the pool lock held: it may
+        unload idle models and wait for a lease to be released, which both take the pool lock.
+        Returns when the load fits.
+        """
+        ram_need, vram_need = split_need(key, est_bytes)
+        deadline = time.monotonic() + self.defer_s
+        deferred = False
+        while True:
+            snap = self._sample()
+            deficit = self._deficit(snap, ram_need, vram_need)
+            if deficit <= 0:
+                with self._stats_lock:
+                    self._stats.admitted += 1
+                if deferred:
+                    logging.info("Deferred load of '%s' admitted", key.model_path)
+                return
+            if self._unload(0.0, deficit, reason=f"load of '{key.model_path}'"):
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._stats_lock:
+                    self._stats.refused += 1
+                logging.error(
+                    "Refused load of '%s': needs %.2f GiB RAM + %.2f GiB VRAM, available %s GiB RAM / %s GiB VRAM",
+                    key.model_path,
+                    ram_need / GIB,
+                    vram_need / GIB,
+                    _gib(snap.ram_available_bytes),
+                    _gib(snap.vram_free_bytes),
+                )
+                raise LocalLlmError(
+                    KNOWN_LLM_ERRORS["LLM_RESOURCE_EXHAUSTED"],
+                    details={
+                        "model_path": key.model_path,
+                        "ram_need_bytes": ram_need,
+                        "vram_need_bytes": vram_need,
+                        "ram_available_bytes": snap.ram_available_bytes,
+                        "vram_free_bytes": snap.vram_free_bytes,
+                    },
+                )
+            if not deferred:
+                deferred = True
+                with self._stats_lock:
+                    self._stats.deferred += 1
+                logging.warning(
+                    "Deferring load of '%s' (short by %.2f GiB) until a model is released (up to %.1f s)",
+                    key.model_path,
+                    deficit / GIB,
+                    remaining,
+                )
+            self.pool.wait_for_release(min(remaining, self.interval_s))
+
+    def stats(self) -> MemoryMonitorStats:
+        with self._stats_lock:
+            return replace(self._stats)
+
+    # ---- internals ----
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.check()
+            except Exception:
+                logging.exception("Memory monitor check failed")
+
+    def _sample(self) -> MemorySnapshot:
+        snap = self._sampler()
+        with self._stats_lock:
+            self._stats.samples += 1
+            self._stats.last = snap
+        return snap
+
+    def _deficit(self, snap: MemorySnapshot, ram_need: int, vram_need: int) -> int:
+        """Bytes missing to keep both headrooms after a load of the given size (0 if it fits)."""
+        deficit = 0
+        if snap.ram_available_bytes is not None:
+            deficit = max(deficit, ram_need + self.ram_headroom_bytes - snap.ram_available_bytes)
+        if snap.vram_free_bytes is not None and vram_need:
+            deficit = max(deficit, vram_need + self.vram_headroom_bytes - snap.vram_free_bytes)
+        return deficit
+
+    def _unload(self, min_idle_s: float, wanted: int, reason: str) -> int:
+        resident = self.pool.stats().resident_models
+        freed = self.pool.unload_idle(min_idle_s, wanted)
+        if freed:
+            unloaded = resident - self.pool.stats().resident_models
+            with self._stats_lock:
+                self._stats.unloads += unloaded
+                self._stats.unloaded_bytes += freed
+            logging.info("Unloaded %d idle model(s), est. %.2f GiB, for %s", unloaded, freed / GIB, reason)
+        return freed
+
+
+def _gib(n: Optional[int]) -> str:
+    return f"{n / GIB:.2f}" if n is not None else "?"
+
+
+_default_monitor: Optional[MemoryMonitor] = None
+_default_monitor_lock = threading.Lock()
+
+
+def get_memory_monitor() -> Optional[MemoryMonitor]:
+    """Process-wide monitor, or None until configure_memory_monitor() starts one."""
+    return _default_monitor
+
+
+def configure_memory_monitor(pool: Optional[ModelPool] = None, **kwargs) -> MemoryMonitor:
+    """
+    Start (or replace) the process-wide monitor and attach it to the pool:
+
+        configure_memory_monitor(ram_headroom_bytes=4 * GIB, idle_s=120)
+    """
+    global _default_monitor
+    pool = pool or get_model_pool()
+    with _default_monitor_lock:
+        if _default_monitor is not None:
+            _default_monitor.stop()
+        _default_monitor = MemoryMonitor(pool, **kwargs).start()
+        pool.monitor = _default_monitor
+    return _default_monitor
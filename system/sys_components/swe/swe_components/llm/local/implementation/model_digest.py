@@ -0,0 +1,38 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Tuple
+
+# hashing a 10-50 GB GGUF is too slow to do per call; head + tail + size identifies a file
+# well enough in practice (the GGUF header, i.e. metadata and tensor table, is in the head)
+_SAMPLE_BYTES = 8 * 1024 * 1024
+
+_cache: Dict[Tuple[str, int, int], str] = {}
+_cache_lock = threading.Lock()
+
+
+def model_digest(model_path: str) -> str:
+    """
+    Cheap content digest of a model file (sha256 over size, first and last 8 MiB).
+    Memoised per (path, size, mtime) so it is computed once per file per process.
+    """
+    path = os.path.abspath(model_path)
+    st = os.stat(path)
+    memo_key = (path, st.st_size, st.st_mtime_ns)
+    with _cache_lock:
+        cached = _cache.get(memo_key)
+    if cached is not None:
+        return cached
+
+    h = hashlib.sha256()
+    h.update(str(st.st_size).encode("ascii"))
+    with open(path, "rb") as f:
+        h.update(f.read(_SAMPLE_BYTES))
+        if st.st_size > 2 * _SAMPLE_BYTES:
+            f.seek(-_SAMPLE_BYTES, os.SEEK_END)
+            h.update(f.read(_SAMPLE_BYTES))
+    digest = h.hexdigest()
+
+    with _cache_lock:
+        _cache[memo_key] = digest
+    return digest
@@ -0,0 +1,619 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sos_interfaces.if_system_configuration import resources_data
+
+try:
+    import psutil  # type: ignore
+except Exception:
+    psutil = None
+
+GIB = 1024 ** 3
+
+# rough KV-cache cost per context token (f16, 32 layers, 8 KV heads of 128 dims → 128 KiB);
+# a conservative default for the 7-8B GQA models we run, only used for budgeting
+KV_BYTES_PER_CTX_TOKEN = 128 * 1024
+
+# a vocab_only load reads tokenizer metadata only; budget it as a small fixed cost
+VOCAB_ONLY_BYTES = 64 * 1024 ** 2
+
+# bytes per KV element by cache type (quantised types include their block scales)
+KV_TYPE_BYTES = {"f32": 4.0, "f16": 2.0, "q8_0": 34 / 32, "q5_1": 24 / 32, "q5_0": 22 / 32, "q4_1": 20 / 32, "q4_0": 18 / 32}
+
+# Llama()'s default physical batch; extra contexts are created with it like a regular load
+LLAMA_N_UBATCH = 512
+
+
+@dataclass(frozen=True)
+class ModelKey:
+    """Load-relevant fields of LLMConfig / llm_config. Two configs with the same key share one Llama."""
+    model_path: str
+    n_ctx: int
+    n_gpu_layers: int
+    n_batch: int
+    n_threads: int
+    draft_model_path: Optional[str] = None
+    draft_n_ctx: int = 0            # context of the draft model; every context over these weights shares it
+    prompt_lookup_tokens: int = 0
+    draft_tokens: int = 8
+    use_mmap: bool = True
+    use_mlock: bool = False
+    type_k: Optional[str] = None    # KV cache types ("f16", "q8_0", "q4_0", ...); None = llama.cpp default
+    type_v: Optional[str] = None
+    flash_attn: bool = False
+    vocab_only: bool = False        # tokenizer + metadata only, no weights
+    verbose: bool = True
+
+    @classmethod
+    def from_config(cls, cfg: Any, vocab_only: bool = False) -> "ModelKey":
+        # works for both LLMConfig (local_llm.py) and llm_config (if_agent_configurator.py)
+        if vocab_only:
+            # the tokenizer does not depend on context, offload or speculation settings
+            return cls(
+                model_path=os.path.abspath(cfg.model_path),
+                n_ctx=0,
+                n_gpu_layers=0,
+                n_batch=0,
+                n_threads=0,
+                vocab_only=True,
+                verbose=bool(getattr(cfg, "verbose", True)),
+            )
+        return cls(
+            model_path=os.path.abspath(cfg.model_path),
+            n_ctx=int(cfg.n_ctx),
+            n_gpu_layers=int(cfg.n_gpu_layers),
+            n_batch=int(cfg.n_batch),
+            n_threads=int(cfg.n_threads),
+            # the draft is attached at load time, so it is part of the loaded model's identity
+            draft_model_path=os.path.abspath(draft) if (draft := getattr(cfg, "draft_model_path", None)) else None,
+            # sized for the largest context bucket, not for the bucket that happens to load first
+            draft_n_ctx=max(int(cfg.n_ctx), int(getattr(cfg, "draft_n_ctx", 0) or 0)) if draft else 0,
+            prompt_lookup_tokens=int(getattr(cfg, "prompt_lookup_tokens", 0) or 0),
+            draft_tokens=int(getattr(cfg, "draft_tokens", 8) or 8),
+            use_mmap=bool(getattr(cfg, "use_mmap", True)),
+            use_mlock=bool(getattr(cfg, "use_mlock", False)),
+            type_k=getattr(cfg, "type_k", None),
+            type_v=getattr(cfg, "type_v", None),
+            flash_attn=bool(getattr(cfg, "flash_attn", False)),
+            verbose=bool(getattr(cfg, "verbose", True)),
+        )
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    load_time_s: float = 0.0      # summed over all misses
+    resident_models: int = 0
+    resident_bytes: int = 0
+    budget_bytes: Optional[int] = None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+@dataclass
+class LoadReport:
+    model_path: str
+    file_bytes: int
+    load_s: float                       # time to ready: weights mapped/read, context allocated
+    read_mb_s: float                    # file_bytes / load_s; with mmap, pages fault in later
+    rss_before_bytes: Optional[int]
+    rss_after_bytes: Optional[int]
+    use_mmap: bool
+    use_mlock: bool
+    vocab_only: bool
+
+    @property
+    def rss_delta_bytes(self) -> Optional[int]:
+        if self.rss_before_bytes is None or self.rss_after_bytes is None:
+            return None
+        return self.rss_after_bytes - self.rss_before_bytes
+
+
+@dataclass
+class _PoolEntry:
+    llm: Any
+    est_bytes: int
+    load_time_s: float
+    report: Optional[LoadReport] = None
+    leases: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    # a llama.cpp context is not thread-safe: held while evaluating / decoding on llm
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    # set for an extra context over another entry's weights (a different n_ctx bucket)
+    base: Optional[ModelKey] = None
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None if it cannot be determined."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def kv_cache_bytes(key: ModelKey) -> int:
+    """KV cache for n_ctx; KV_BYTES_PER_CTX_TOKEN is for f16, half K and half V."""
+    scale_k = KV_TYPE_BYTES.get(key.type_k or "f16", 2.0) / 2.0
+    scale_v = KV_TYPE_BYTES.get(key.type_v or "f16", 2.0) / 2.0
+    return int(key.n_ctx * KV_BYTES_PER_CTX_TOKEN * (scale_k + scale_v) / 2)
+
+
+def estimate_model_bytes(key: ModelKey) -> int:
+    """Weights (GGUF file size) + KV cache for n_ctx. Heuristic, used for budgeting only."""
+    if key.vocab_only:
+        return VOCAB_ONLY_BYTES
+    try:
+        weights = os.path.getsize(key.model_path)
+    except OSError:
+        weights = 0
+    if key.draft_model_path:
+        try:
+            weights += os.path.getsize(key.draft_model_path)
+        except OSError:
+            pass
+    return weights + kv_cache_bytes(key)
+
+
+def budget_from_resources(resources: resources_data, fraction: float = 0.8) -> int:
+    """
+    Memory budget for resident models, fed from resource_manager.operating_machine().
+    RAM and VRAM are pooled: llama.cpp splits a model between them via n_gpu_layers.
+    """
+    gb = (resources.ram_available_gb or 0.0) + (resources.gpu_vram_gb or 0.0)
+    return int(gb * fraction * GIB)
+
+
+def kv_cache_kwargs(key: ModelKey) -> dict:
+    """Llama() arguments for the KV cache settings; only the ones that differ from the defaults."""
+    import llama_cpp
+
+    kwargs: dict = {}
+    for arg, name in (("type_k", key.type_k), ("type_v", key.type_v)):
+        if name:
+            kwargs[arg] = getattr(llama_cpp, f"GGML_TYPE_{name.upper()}")
+    if key.flash_attn:
+        kwargs["flash_attn"] = True
+    elif key.type_v and key.type_v not in ("f16", "f32"):
+        logging.warning("A quantised V cache (%s) needs flash attention; enabling flash_attn", key.type_v)
+        kwargs["flash_attn"] = True
+    return kwargs
+
+
+def kv_cache_settings(key: ModelKey) -> Tuple[str, str, bool]:
+    """
+    (type_k, type_v, flash_attn) a context for key is created with, defaults filled in. Saved
+    KV state only loads into a context with the same settings.
+    """
+    type_v = key.type_v or "f16"
+    return key.type_k or "f16", type_v, key.flash_attn or type_v not in ("f16", "f32")
+
+
+def _default_loader(key: ModelKey) -> Any:
+    # imported lazily so the pool itself can be used (and tested) without llama-cpp
+    from llama_cpp import Llama
+
+    if key.vocab_only:
+        return Llama(model_path=key.model_path, vocab_only=True, verbose=key.verbose)
+
+    from system.sys_components.swe.swe_components.llm.local.implementation.speculative import build_draft, verify_draft
+
+    llm = Llama(
+        model_path=key.model_path,
+        n_ctx=key.n_ctx,
+        n_gpu_layers=key.n_gpu_layers,
+        n_batch=key.n_batch,
+        n_threads=key.n_threads,
+        use_mmap=key.use_mmap,
+        use_mlock=key.use_mlock,
+        **kv_cache_kwargs(key),
+        draft_model=build_draft(
+            draft_model_path=key.draft_model_path,
+            prompt_lookup_tokens=key.prompt_lookup_tokens,
+            draft_tokens=key.draft_tokens,
+            n_ctx=key.draft_n_ctx or key.n_ctx,
+            n_threads=key.n_threads,
+            n_gpu_layers=key.n_gpu_layers,
+        ),
+        verbose=key.verbose,  # verbose prints whether CUDA / Metal / CPU backend is used
+    )
+    verify_draft(llm)
+    return llm
+
+
+def _default_context_loader(base: Any, key: ModelKey) -> Any:
+    """
+    A Llama with its own key.n_ctx context over base's loaded weights (and draft): only the KV
+    cache, batch and token buffers are allocated, nothing is read or uploaded again.
+    """
+    import contextlib
+    import ctypes
+
+    import numpy as np
+    from llama_cpp import _internals
+
+    # as Llama() would size them for this n_ctx: the base's are capped by its own (maybe smaller) n_ctx
+    n_batch = min(key.n_ctx, key.n_batch)
+    params = type(base.context_params).from_buffer_copy(base.context_params)
+    params.n_ctx = key.n_ctx
+    params.n_batch = n_batch
+    params.n_ubatch = min(n_batch, LLAMA_N_UBATCH)
+    # copy the attributes: copy.copy() would go through Llama.__getstate__ and load the file again
+    llm = object.__new__(type(base))
+    llm.__dict__.update(base.__dict__)
+    llm._stack = contextlib.ExitStack()    # closing this Llama frees its context, not the model
+    llm.context_params = params
+    llm.n_batch = n_batch
+    llm._ctx = llm._stack.enter_context(
+        contextlib.closing(_internals.LlamaContext(model=base._model, params=params, verbose=base.verbose))
+    )
+    llm._batch = llm._stack.enter_context(
+        contextlib.closing(_internals.LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=key.n_ctx, verbose=base.verbose))
+    )
+    llm._n_ctx = llm.n_ctx()
+    llm._candidates = _internals.LlamaTokenDataArray(n_vocab=base._n_vocab)
+    llm._sampler = None
+    llm._mirostat_mu = ctypes.c_float(2.0 * 5.0)
+    llm.cache = None
+    llm.n_tokens = 0
+    llm.input_ids = np.ndarray((key.n_ctx,), dtype=np.intc)
+    llm.scores = np.ndarray((key.n_ctx if base._logits_all else n_batch, base._n_vocab), dtype=np.single)
+    return llm
+
+
+class ModelPool:
+    """
+    Process-wide pool of loaded Llama instances with LRU eviction under a memory budget.
+
+    acquire() hands out a shared Llama and takes a lease on it; release() gives the lease back.
+    Only models without leases are evicted. When every resident model is leased the budget is
+    exceeded with a warning rather than failing the load.
+
+    Keys that differ only in n_ctx (context buckets) share weights: the first one loads the
+    model, the others get their own context over it and are charged only their KV cache. The
+    loaded model is evicted together with its extra contexts, so it stays while any is leased.
+
+    Several leaseholders may share one Llama, so evaluation and decoding must happen under
+    inference_lock(cfg). Loads run outside the pool lock; concurrent acquires of a model that
+    is being loaded wait for that load instead of starting their own.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: Optional[int] = None,
+        loader: Callable[[ModelKey], Any] = _default_loader,
+        context_loader: Callable[[Any, ModelKey], Any] = _default_context_loader,
+    ):
+        self.budget_bytes = budget_bytes
+        self._loader = loader
+        self._context_loader = context_loader
+        self._entries: "OrderedDict[ModelKey, _PoolEntry]" = OrderedDict()
+        self._loading: Dict[ModelKey, threading.Event] = {}
+        self._pending_bytes: Dict[ModelKey, int] = {}   # estimates of the loads in progress
+        self._lock = threading.RLock()
+        self._released = threading.Condition(self._lock)
+        self._stats = PoolStats(budget_bytes=budget_bytes)
+        self.monitor: Any = None        # MemoryMonitor; admits loads against actual free RAM/VRAM
+
+    # ---- public API ----
+
+    def acquire(self, cfg: Any, vocab_only: bool = False) -> Any:
+        key = ModelKey.from_config(cfg, vocab_only)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._stats.hits += 1
+                    self._entries.move_to_end(key)
+                    entry.leases += 1
+                    entry.last_used = time.monotonic()
+                    logging.info("Model pool hit for '%s' (n_ctx=%d)", key.model_path, key.n_ctx)
+                    return entry.llm
+                loading = self._loading.get(key)
+                if loading is None:
+                    self._loading[key] = threading.Event()
+                    self._stats.misses += 1
+                    base_key = self._weights_owner(key)
+                    if base_key is not None:
+                        # pinned, so it is not evicted while the new context is created
+                        base = self._entries[base_key]
+                        base.leases += 1
+                        est = kv_cache_bytes(key)
+                    else:
+                        base = None
+                        est = estimate_model_bytes(key)
+                    self._make_room(est)
+                    self._pending_bytes[key] = est
+                    break
+            # another thread is loading this model: use its result (or retry if that load failed)
+            loading.wait()
+
+        # ---- load outside the pool lock, so hits on other models are not blocked by a cold load ----
+        try:
+            if self.monitor is not None:
+                self.monitor.admit(key, est)   # may unload idle models, wait, or raise
+            rss0 = current_rss_bytes()
+            t0 = time.perf_counter()
+            llm = self._loader(key) if base is None else self._context_loader(base.llm, key)
+            t1 = time.perf_counter()
+            # with concurrent loads the RSS delta includes the other loads as well
+            report = self._load_report(key, t1 - t0, rss0, current_rss_bytes())
+            if base is not None:
+                report = replace(report, file_bytes=0, read_mb_s=0.0)   # no weights were read
+        except BaseException:
+            with self._lock:
+                self._pending_bytes.pop(key, None)
+                self._loading.pop(key).set()
+                if base is not None:
+                    base.leases -= 1
+                    self._released.notify_all()
+            raise
+
+        with self._lock:
+            self._pending_bytes.pop(key, None)
+            entry = _PoolEntry(llm=llm, est_bytes=est, load_time_s=t1 - t0, report=report, leases=1)
+            if base is not None:
+                base.leases -= 1
+                # contexts over one model share its draft, so they take turns with the same lock
+                entry.base, entry.lock = base_key, base.lock
+            self._entries[key] = entry
+            self._stats.load_time_s += t1 - t0
+            self._loading.pop(key).set()
+            logging.info(
+                "Model pool miss: %s '%s'%s in %.2f s (%.0f MB/s, RSS +%s MB, est. %.2f GiB, resident %.2f GiB)",
+                "loaded" if base is None else f"new n_ctx={key.n_ctx} context over",
+                key.model_path,
+                " (vocab only)" if key.vocab_only else "",
+                report.load_s,
+                report.read_mb_s,
+                f"{report.rss_delta_bytes / 1024 ** 2:.0f}" if report.rss_delta_bytes is not None else "?",
+                est / GIB,
+                self._resident_bytes() / GIB,
+            )
+            return llm
+
+    def release(self, cfg: Any, vocab_only: bool = False) -> None:
+        key = ModelKey.from_config(cfg, vocab_only)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.leases > 0:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+                self._released.notify_all()
+
+    def inference_lock(self, cfg: Any, vocab_only: bool = False) -> threading.RLock:
+        """
+        Lock of the resident Llama for cfg; hold it while evaluating or decoding on it. The
+        caller must hold a lease (acquire), so the model cannot be evicted in between.
+        """
+        key = ModelKey.from_config(cfg, vocab_only)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                raise KeyError(f"Model '{key.model_path}' (n_ctx={key.n_ctx}) is not resident in the pool")
+            return entry.lock
+
+    def reserve_context(self, cfg: Any, n_ctx: int) -> int:
+        """
+        Charge an extra context of n_ctx tokens created on the leased model for cfg (e.g. the
+        batch server's multi-sequence context) to that model's entry: the budget and the memory
+        monitor see its KV cache. Returns the bytes charged; hand them back with release_context.
+        """
+        key = ModelKey.from_config(cfg)
+        n_bytes = kv_cache_bytes(replace(key, n_ctx=n_ctx))
+        with self._lock:
+            if key not in self._entries:
+                raise KeyError(f"Model '{key.model_path}' (n_ctx={key.n_ctx}) is not resident in the pool")
+            self._make_room(n_bytes)
+        if self.monitor is not None:
+            self.monitor.admit(key, n_bytes)
+        with self._lock:
+            self._entries[key].est_bytes += n_bytes
+        return n_bytes
+
+    def release_context(self, cfg: Any, n_bytes: int) -> None:
+        key = ModelKey.from_config(cfg)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.est_bytes = max(entry.est_bytes - n_bytes, 0)
+                self._released.notify_all()
+
+    def evict(self, cfg: Any) -> bool:
+        """Drop a model from the pool if it is not leased. Returns True if it was evicted."""
+        key = ModelKey.from_config(cfg)
+        with self._lock:
+            if key not in self._entries or not self._evictable(key):
+                return False
+            self._drop(key)
+            return True
+
+    def unload_idle(self, min_idle_s: float = 0.0, bytes_wanted: Optional[int] = None) -> int:
+        """
+        Evict models without leases that have been idle for at least min_idle_s, least recently
+        used first, until bytes_wanted (estimated) are freed. Returns the estimated bytes freed.
+        """
+        freed = 0
+        now = time.monotonic()
+        with self._lock:
+            for key in list(self._entries):
+                if bytes_wanted is not None and freed >= bytes_wanted:
+                    break
+                entry = self._entries.get(key)
+                if entry is not None and self._evictable(key) and now - entry.last_used >= min_idle_s:
+                    freed += self._drop(key)
+        return freed
+
+    def wait_for_release(self, timeout: float) -> None:
+        """Block until some lease is released (or timeout). The pool lock is released while waiting."""
+        with self._lock:
+            self._released.wait(timeout)
+
+    def load_report(self, cfg: Any, vocab_only: bool = False) -> Optional[LoadReport]:
+        """How the resident model for cfg was loaded, or None if it is not resident."""
+        with self._lock:
+            entry = self._entries.get(ModelKey.from_config(cfg, vocab_only))
+            return entry.report if entry is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if self._evictable(k)]:
+                if key in self._entries:
+                    self._drop(key)
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                load_time_s=self._stats.load_time_s,
+                resident_models=len(self._entries),
+                resident_bytes=self._resident_bytes(),
+                budget_bytes=self.budget_bytes,
+            )
+
+    # ---- internals ----
+
+    @staticmethod
+    def _load_report(key: ModelKey, load_s: float, rss0: Optional[int], rss1: Optional[int]) -> LoadReport:
+        try:
+            file_bytes = os.path.getsize(key.model_path)
+        except OSError:
+            file_bytes = 0
+        return LoadReport(
+            model_path=key.model_path,
+            file_bytes=file_bytes,
+            load_s=load_s,
+            read_mb_s=file_bytes / 1024 ** 2 / load_s if load_s > 0 and not key.vocab_only else 0.0,
+            rss_before_bytes=rss0,
+            rss_after_bytes=rss1,
+            use_mmap=key.use_mmap,
+            use_mlock=key.use_mlock,
+            vocab_only=key.vocab_only,
+        )
+
+    def _weights_owner(self, key: ModelKey) -> Optional[ModelKey]:
+        """Resident entry that loaded the weights key needs (same key up to n_ctx), if any."""
+        if key.vocab_only:
+            return None
+        for k, e in self._entries.items():
+            if e.base is None and not k.vocab_only and replace(k, n_ctx=key.n_ctx) == key:
+                return k
+        return None
+
+    def _evictable(self, key: ModelKey) -> bool:
+        # a loaded model goes with its extra contexts, so none of them may be leased
+        return all(e.leases == 0 for k, e in self._entries.items() if k == key or e.base == key)
+
+    def _resident_bytes(self) -> int:
+        return sum(e.est_bytes for e in self._entries.values())
+
+    def _make_room(self, needed: int) -> None:
+        if self.budget_bytes is None:
+            return
+        # loads still in progress already count against the budget
+        needed += sum(self._pending_bytes.values())
+        # OrderedDict order == LRU order (oldest first)
+        for key in list(self._entries):
+            if self._resident_bytes() + needed <= self.budget_bytes:
+                return
+            if key in self._entries and self._evictable(key):
+                self._drop(key)
+        if self._resident_bytes() + needed > self.budget_bytes:
+            logging.warning(
+                "Model pool budget exceeded: need %.2f GiB, resident %.2f GiB, budget %.2f GiB "
+                "(all resident models are in use)",
+                needed / GIB,
+                self._resident_bytes() / GIB,
+                self.budget_bytes / GIB,
+            )
+
+    def _drop(self, key: ModelKey) -> int:
+        """Evict key (and, for a loaded model, the contexts over it first). Returns the est. bytes freed."""
+        freed = sum(self._drop(k) for k in [k for k, e in self._entries.items() if e.base == key])
+        entry = self._entries.pop(key)
+        self._stats.evictions += 1
+        # an extra context owns neither the weights nor the draft
+        draft = getattr(getattr(entry.llm, "draft_model", None), "inner", None) if entry.base is None else None
+        for llm in (entry.llm, getattr(draft, "llm", None)):
+            try:
+                if llm is not None:
+                    llm.close()
+            except Exception:
+                pass
+        logging.info("Model pool evicted '%s' (n_ctx=%d, freed est. %.2f GiB)", key.model_path, key.n_ctx, entry.est_bytes / GIB)
+        return freed + entry.est_bytes
+
+
+_default_pool: Optional[ModelPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    """Process-wide pool. Unbounded until configure_model_pool() sets a budget."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ModelPool()
+        return _default_pool
+
+
+def configure_model_pool(
+    budget_bytes: Optional[int] = None,
+    resources: Optional[resources_data] = None,
+    fraction: float = 0.8,
+) -> ModelPool:
+    """
+    Set the process-wide budget, either directly or from resource_manager().operating_machine():
+
+        configure_model_pool(resources=resource_manager().operating_machine())
+    """
+    if budget_bytes is None and resources is not None:
+        budget_bytes = budget_from_resources(resources, fraction)
+    pool = get_model_pool()
+    with pool._lock:
+        pool.budget_bytes = budget_bytes
+        pool._stats.budget_bytes = budget_bytes
+        pool._make_room(0)
+    return pool
+
+
+if __name__ == "__main__":
+    # self-check with fake loaders: the draft shared by a model's bucket contexts covers every
+    # bucket, whichever one loads first (cfgs as LLMEngine builds them for its buckets)
+    from types import SimpleNamespace
+
+    buckets = (1024, 4096, 16384)
+    pool = ModelPool(
+        loader=lambda key: SimpleNamespace(n_ctx=key.n_ctx, draft_n_ctx=key.draft_n_ctx or key.n_ctx),
+        context_loader=lambda base, key: SimpleNamespace(n_ctx=key.n_ctx, draft_n_ctx=base.draft_n_ctx),
+    )
+    for n_ctx in buckets:
+        cfg = SimpleNamespace(
+            model_path="model.gguf",
+            n_ctx=n_ctx,
+            n_gpu_layers=0,
+            n_batch=512,
+            n_threads=4,
+            draft_model_path="draft.gguf",
+            draft_n_ctx=0 if n_ctx == buckets[-1] else buckets[-1],
+        )
+        llm = pool.acquire(cfg)
+        pool.release(cfg)
+        assert llm.draft_n_ctx >= n_ctx, f"draft n_ctx={llm.draft_n_ctx} is smaller than the n_ctx={n_ctx} context"
+    assert pool.stats().resident_models == len(buckets)
+    assert sum(e.base is None for e in pool._entries.values()) == 1, "the buckets did not share one model"
+    print(f"ok: one draft with n_ctx={buckets[-1]} for buckets {list(buckets)}")
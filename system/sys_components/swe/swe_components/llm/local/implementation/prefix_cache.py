@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+
+GIB = 1024 ** 3
+
+
+@dataclass
+class PrefixCacheStats:
+    hits_resident: int = 0   # prefix was still in the live context, nothing to restore
+    hits_memory: int = 0
+    hits_disk: int = 0
+    misses: int = 0
+    evictions: int = 0
+    memory_bytes: int = 0
+    disk_bytes: int = 0
+
+
+def state_nbytes(state: Any) -> int:
+    """Approximate in-memory size of a llama_cpp.LlamaState."""
+    size = int(getattr(state, "llama_state_size", 0) or 0)
+    for attr in ("scores", "input_ids"):
+        arr = getattr(state, attr, None)
+        size += int(getattr(arr, "nbytes", 0) or 0)
+    return size
+
+
+class PrefixStateCache:
+    """
+    Snapshots of llama.cpp state taken right after evaluating a shared prompt prefix.
+
+    Keyed by (model file digest, n_ctx, sha256 of the prefix tokens). Snapshots live in a
+    byte-bounded in-memory LRU and, if cache_dir is set, in a byte-bounded on-disk LRU
+    (file mtime is the recency marker).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_memory_bytes: int = 4 * GIB,
+        max_disk_bytes: int = 32 * GIB,
+        min_prefix_tokens: int = 256,
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        # short prefixes are cheaper to re-evaluate than to snapshot
+        self.min_prefix_tokens = min_prefix_tokens
+
+        self._mem: "OrderedDict[str, Any]" = OrderedDict()
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = PrefixCacheStats()
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # ---- keys ----
+
+    @staticmethod
+    def make_key(model_path: str, n_ctx: int, prefix_tokens: Sequence[int], kv_cache: Sequence[Any] = ()) -> str:
+        """kv_cache: the context's KV settings (model_pool.kv_cache_settings); state loads only into the same."""
+        tok_hash = hashlib.sha256(",".join(map(str, prefix_tokens)).encode("ascii")).hexdigest()
+        raw = f"{model_digest(model_path)}|{n_ctx}|{','.join(map(str, kv_cache))}|{tok_hash}"
+        return hashlib.sha256(raw.encode("ascii")).hexdigest()
+
+    # ---- engine-facing helper ----
+
+    def restore_or_build(
+        self,
+        llm: Any,
+        model_path: str,
+        prefix_tokens: Sequence[int],
+        kv_cache: Sequence[Any] = (),
+    ) -> None:
+        """
+        Leave `llm` with exactly `prefix_tokens` evaluated, restoring a snapshot when possible.
+        The following create_completion() then only evaluates the suffix, because llama-cpp
+        reuses the longest common prefix of the live context.
+        """
+        prefix = list(prefix_tokens)
+        if len(prefix) < self.min_prefix_tokens:
+            return
+
+        n = int(llm.n_tokens)
+        if n >= len(prefix) and list(llm.input_ids[: len(prefix)]) == prefix:
+            with self._lock:
+                self._stats.hits_resident += 1
+            return
+
+        key = self.make_key(model_path, llm.n_ctx(), prefix, kv_cache)
+        state = self.get(key)
+        if state is not None:
+            llm.load_state(state)
+            return
+
+        llm.reset()
+        llm.eval(prefix)
+        self.put(key, llm.save_state())
+
+    # ---- cache API ----
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            state = self._mem.get(key)
+            if state is not None:
+                self._mem.move_to_end(key)
+                self._stats.hits_memory += 1
+                return state
+
+        state = self._read_disk(key)
+        with self._lock:
+            if state is None:
+                self._stats.misses += 1
+                return None
+            self._stats.hits_disk += 1
+            self._put_memory(key, state)
+        return state
+
+    def put(self, key: str, state: Any) -> None:
+        with self._lock:
+            self._put_memory(key, state)
+        self._write_disk(key, state)
+
+    def stats(self) -> PrefixCacheStats:
+        with self._lock:
+            s = PrefixCacheStats(**vars(self._stats))
+            s.memory_bytes = self._mem_bytes
+        s.disk_bytes = sum(p.stat().st_size for p in self._disk_files())
+        return s
+
+    # ---- memory tier ----
+
+    def _put_memory(self, key: str, state: Any) -> None:
+        size = state_nbytes(state)
+        if size > self.max_memory_bytes:
+            return
+        if key in self._mem:
+            self._mem_bytes -= state_nbytes(self._mem.pop(key))
+        self._mem[key] = state
+        self._mem_bytes += size
+        while self._mem_bytes > self.max_memory_bytes and self._mem:
+            _, old = self._mem.popitem(last=False)
+            self._mem_bytes -= state_nbytes(old)
+            self._stats.evictions += 1
+
+    # ---- disk tier ----
+
+    def _path(self, key: str) -> Optional[Path]:
+        return self.cache_dir / f"{key}.llstate" if self.cache_dir is not None else None
+
+    def _disk_files(self) -> list:
+        if self.cache_dir is None:
+            return []
+        return list(self.cache_dir.glob("*.llstate"))
+
+    def _read_disk(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            os.utime(path)  # mark as recently used
+            return state
+        except Exception as e:
+            logging.warning("Discarding unreadable prefix snapshot '%s': %s", path, e)
+            path.unlink(missing_ok=True)
+            return None
+
+    def _write_disk(self, key: str, state: Any) -> None:
+        path = self._path(key)
+        if path is None:
+            return
+        tmp = path.with_suffix(".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception as e:
+            logging.warning("Could not persist prefix snapshot '%s': %s", path, e)
+            tmp.unlink(missing_ok=True)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        files = sorted(self._disk_files(), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        while total > self.max_disk_bytes and files:
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+            with self._lock:
+                self._stats.evictions += 1
+
+
+_default_cache: Optional[PrefixStateCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_prefix_cache() -> PrefixStateCache:
+    """Process-wide prefix cache. Memory-only until configure_prefix_cache() sets a directory."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PrefixStateCache()
+        return _default_cache
+
+
+def configure_prefix_cache(**kwargs: Any) -> PrefixStateCache:
+    """Replace the process-wide prefix cache, e.g. configure_prefix_cache(cache_dir=Path(...))."""
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = PrefixStateCache(**kwargs)
+        return _default_cache
@@ -0,0 +1,272 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import (
+    KNOWN_LLM_ERRORS,
+    LocalLlmError,
+    llm_answer,
+    local_llm_port,
+)
+from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import llm_config
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm import percentile
+from system.sys_components.swe.swe_components.llm.local.implementation.local_llm_v1 import local_llm_engine
+
+# same names as the batch priorities in scheduler.create_execution_plan; lower runs first
+PRIORITY_LEVELS: Dict[str, int] = {"high": 0, "normal": 1, "low": 2}
+
+WAIT_SAMPLES = 1000     # wait times kept per priority for the percentiles
+
+
+@dataclass
+class QueueStats:
+    depth: int = 0
+    max_depth: int = 0
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    preemptions: int = 0
+    expired: int = 0                                   # deadline passed before the request finished
+    wait_p50_s: Dict[str, Optional[float]] = field(default_factory=dict)
+    wait_p95_s: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+@dataclass
+class _Request:
+    priority: str
+    deadline: Optional[float]          # time.monotonic() deadline
+    prompt: str
+    settings: llm_config
+    on_token: Optional[Callable[[str], None]]
+    future: Future
+    submitted_at: float
+    started_at: Optional[float] = None
+    run_s: float = 0.0                 # generation time summed over all slices
+    prompt_eval_s: float = 0.0         # preempted slices: time to their first text delta
+    decode_s: float = 0.0              # preempted slices: time after their first text delta
+    time_to_first_token: Optional[float] = None
+    parts: List[str] = field(default_factory=list)
+    state: Any = None                  # llm.save_state() of a preempted generation
+    preemptions: int = 0
+
+    def sort_key(self, seq: int) -> tuple:
+        return (PRIORITY_LEVELS[self.priority], self.deadline if self.deadline is not None else float("inf"), seq)
+
+
+class priority_local_llm_engine(local_llm_port):
+    """
+    Priority queue in front of local_llm_engine: one generation at a time, highest priority and
+    earliest deadline first.
+
+    A running request is preempted at a token boundary when a strictly higher-priority request
+    arrives: its KV state is saved and it goes back to the queue. On resume the saved state is
+    restored and the text so far is passed as prefill, so llama.cpp keeps the matching KV
+    prefix and evaluates little beyond it (at least the last token). Preemption needs a model
+    with a chat template and is limited per request (max_preemptions) so bulk work cannot
+    starve. The final llm_answer covers all slices: token counts and timings are summed.
+    """
+
+    def __init__(self, sync_engine: Optional[local_llm_engine] = None, max_preemptions: int = 3):
+        self._sync = sync_engine or local_llm_engine()
+        self._owns_sync = sync_engine is None
+        self.max_preemptions = max_preemptions
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = QueueStats()
+        self._waits: Dict[str, Deque[float]] = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_LEVELS}
+        self._closed = False
+        self._worker = threading.Thread(target=self._loop, name="llm-priority-queue", daemon=True)
+        self._worker.start()
+
+    def trigger_local_llm(
+        self,
+        prompt: str,
+        settings: llm_config,
+        on_token: Callable[[str], None] | None = None,
+        priority: str = "normal",
+        deadline_s: float | None = None,
+    ) -> llm_answer:
+        return self.submit(prompt, settings, on_token, priority, deadline_s).result()
+
+    def submit(
+        self,
+        prompt: str,
+        settings: llm_config,
+        on_token: Callable[[str], None] | None = None,
+        priority: str = "normal",
+        deadline_s: float | None = None,
+    ) -> "Future[llm_answer]":
+        if priority not in PRIORITY_LEVELS:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {list(PRIORITY_LEVELS)}")
+        now = time.monotonic()
+        req = _Request(
+            priority=priority,
+            deadline=now + deadline_s if deadline_s is not None else None,
+            prompt=prompt,
+            settings=settings,
+            on_token=on_token,
+            future=Future(),
+            submitted_at=now,
+        )
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("priority_local_llm_engine is shut down")
+            self._push(req)
+            self._stats.submitted += 1
+            self._cond.notify()
+        return req.future
+
+    def stats(self) -> QueueStats:
+        with self._cond:
+            s = replace(self._stats, depth=len(self._heap))
+            s.wait_p50_s = {p: percentile(list(w), 50) for p, w in self._waits.items()}
+            s.wait_p95_s = {p: percentile(list(w), 95) for p, w in self._waits.items()}
+        return s
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+        if self._owns_sync:
+            self._sync.close()
+
+    # ---- internals ----
+
+    def _push(self, req: _Request) -> None:
+        heapq.heappush(self._heap, req.sort_key(next(self._seq)) + (req,))
+        self._stats.max_depth = max(self._stats.max_depth, len(self._heap))
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    for *_, req in self._heap:
+                        req.future.cancel()
+                    self._heap.clear()
+                    return
+                req = heapq.heappop(self._heap)[-1]
+
+            if req.future.cancelled():
+                continue
+            if req.deadline is not None and time.monotonic() > req.deadline:
+                self._expire(req)
+                continue
+            if req.started_at is None:
+                req.started_at = time.monotonic()
+                with self._cond:
+                    self._waits[req.priority].append(req.started_at - req.submitted_at)
+            try:
+                self._run_slice(req)
+            except Exception as e:
+                with self._cond:
+                    self._stats.failed += 1
+                req.future.set_exception(e)
+
+    def _preempt_for(self, req: _Request) -> bool:
+        with self._cond:
+            if not self._heap or req.preemptions >= self.max_preemptions:
+                return False
+            return self._heap[0][0] < PRIORITY_LEVELS[req.priority]
+
+    def _run_slice(self, req: _Request) -> None:
+        engine = self._sync.engine_for(req.settings)
+        resumable = engine._chat_formatter() is not None  # continuation needs raw-token prompts
+        preempting: List[bool] = []
+
+        def keep_state(llm: Any) -> None:
+            # runs while the stream still holds the model, so no other request has touched the KV yet
+            if preempting:
+                req.state = llm.save_state()
+
+        stream = engine.run_stream(
+            system_prompt=self._sync.system_prompt,
+            user_prompt=req.prompt,
+            prefill="".join(req.parts),
+            resume_state=req.state,
+            bypass_cache=req.state is not None,
+            on_release=keep_state,
+        )
+        req.state = None
+        prefill = "".join(req.parts)
+        t0 = time.perf_counter()
+        t_first: Optional[float] = None
+        try:
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as done:
+                    answer = done.value
+                    break
+                if t_first is None:
+                    t_first = time.perf_counter()
+                    if req.time_to_first_token is None:
+                        req.time_to_first_token = t_first - t0
+                req.parts.append(delta)
+                if req.on_token is not None:
+                    req.on_token(delta)
+                if req.deadline is not None and time.monotonic() > req.deadline:
+                    req.run_s += time.perf_counter() - t0
+                    self._expire(req)
+                    return
+                if resumable and self._preempt_for(req):
+                    # token boundary: snapshot KV (prompt + text so far) and requeue
+                    preempting.append(True)
+                    stream.close()
+                    req.preemptions += 1
+                    t_end = time.perf_counter()
+                    req.run_s += t_end - t0
+                    req.prompt_eval_s += t_first - t0
+                    req.decode_s += t_end - t_first
+                    with self._cond:
+                        self._stats.preemptions += 1
+                        self._push(req)
+                    logging.info(
+                        "Preempted %s-priority generation after %d chunks (preemption %d)",
+                        req.priority,
+                        len(req.parts),
+                        req.preemptions,
+                    )
+                    return
+        finally:
+            stream.close()
+
+        req.run_s += time.perf_counter() - t0
+        if req.preemptions:
+            answer = self._merge_slices(req, answer, engine.tokens.count(prefill))
+        with self._cond:
+            self._stats.completed += 1
+        req.future.set_result(answer)
+
+    def _merge_slices(self, req: _Request, answer: llm_answer, n_prefill: int) -> llm_answer:
+        # the last slice saw the earlier text as prompt (prefill); move it back to the completion
+        completion = n_prefill + (answer.completion_tokens or 0)
+        decode = req.decode_s + (answer.decode_time or 0.0)
+        return replace(
+            answer,
+            response_text="".join(req.parts),
+            execution_time=req.run_s,
+            generation_speed=completion / decode if decode > 0 else answer.generation_speed,
+            time_to_first_token=req.time_to_first_token,
+            prompt_tokens=answer.prompt_tokens - n_prefill if answer.prompt_tokens is not None else None,
+            completion_tokens=completion,
+            prompt_eval_time=req.prompt_eval_s + (answer.prompt_eval_time or 0.0),
+            decode_time=decode,
+        )
+
+    def _expire(self, req: _Request) -> None:
+        with self._cond:
+            self._stats.expired += 1
+        req.future.set_exception(LocalLlmError(
+            KNOWN_LLM_ERRORS["LLM_TIMEOUT"],
+            details={"priority": req.priority, "queued_s": time.monotonic() - req.submitted_at},
+        ))
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import llm_answer
+
+GIB = 1024 ** 3
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    writes: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def response_key(
+    *,
+    model_path: str,
+    chat_template: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    top_p: float,
+    repeat_penalty: float,
+    max_tokens: int,
+    seed: Optional[int],
+    output_schema: str = "",
+) -> str:
+    """Content address of one generation request: same key, same model input and sampling."""
+    fields = {
+        "model": model_digest(model_path),
+        "chat_template": chat_template,
+        "messages": messages,
+        "temperature": temperature,
+        "top_p": top_p,
+        "repeat_penalty": repeat_penalty,
+        "max_tokens": max_tokens,
+        "seed": seed,
+    }
+    if output_schema:
+        # only added when set, so keys of unconstrained requests are unchanged
+        fields["output_schema"] = output_schema
+    raw = json.dumps(fields, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk, content-addressed cache of LLM responses with their llm_answer timing.
+
+    One JSON file per entry under cache_dir/<key[:2]>/<key>.json. Total size is capped at
+    max_bytes; least-recently-used entries (file mtime, refreshed on hit) are evicted first.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 1 * GIB):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = ResponseCacheStats()
+        # key -> (size, mtime); rebuilt from disk so the cap holds across process restarts
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for p in self.cache_dir.glob("*/*.json"):
+            st = p.stat()
+            self._index[p.stem] = (st.st_size, st.st_mtime)
+
+    def get(self, key: str) -> Optional[llm_answer]:
+        path = self._path(key)
+        with self._lock:
+            if key not in self._index:
+                self._stats.misses += 1
+                return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                obj = json.load(f)
+            answer = llm_answer(**obj["answer"])
+            os.utime(path)
+        except Exception as e:
+            logging.warning("Dropping unreadable response cache entry '%s': %s", path, e)
+            with self._lock:
+                self._forget(key)
+                self._stats.misses += 1
+            return None
+        with self._lock:
+            self._stats.hits += 1
+            self._index[key] = (self._index[key][0], path.stat().st_mtime)
+        return answer
+
+    def put(self, key: str, answer: llm_answer, meta: Optional[Dict[str, Any]] = None) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = json.dumps({"answer": asdict(answer), "meta": meta or {}}, ensure_ascii=False)
+        # one temp file per writer: concurrent puts of the same key must not share it
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, prefix=f"{key}.", suffix=".tmp", delete=False) as f:
+            f.write(payload)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            Path(f.name).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            st = path.stat()
+            self._index[key] = (st.st_size, st.st_mtime)
+            self._stats.writes += 1
+            self._evict()
+
+    def note_bypass(self) -> None:
+        with self._lock:
+            self._stats.bypassed += 1
+
+    def stats(self) -> ResponseCacheStats:
+        with self._lock:
+            s = ResponseCacheStats(**vars(self._stats))
+            s.entries = len(self._index)
+            s.size_bytes = sum(size for size, _ in self._index.values())
+        return s
+
+    # ---- internals ----
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _forget(self, key: str) -> None:
+        self._index.pop(key, None)
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        total = sum(size for size, _ in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            self._forget(key)
+            total -= size
+            self._stats.evictions += 1
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide response cache, or None until configure_response_cache() is called."""
+    with _default_cache_lock:
+        return _default_cache
+
+
+def configure_response_cache(cache_dir: Path, max_bytes: int = 1 * GIB) -> ResponseCache:
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = ResponseCache(cache_dir, max_bytes)
+        return _default_cache
@@ -0,0 +1,167 @@
+import logging
+import os
+import pickle
+import re
+import shutil
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from system.sys_components.swe.swe_components.llm.local.implementation.model_digest import model_digest
+
+
+@dataclass
+class SessionSnapshot:
+    model_digest: str
+    messages: List[Dict[str, str]]      # conversation so far, ending with the batch's answer
+    state: Any                          # llama_cpp.LlamaState after the answer
+    n_tokens: int
+    n_ctx: int = 0                      # context the state was saved in; it restores only into that size (0: unknown)
+    kv_cache: Tuple[Any, ...] = ()      # its (type_k, type_v, flash_attn); restores only into the same (empty: unknown)
+
+
+@dataclass
+class SessionStoreStats:
+    saves: int = 0
+    restores: int = 0
+    misses: int = 0                     # no snapshot, or one from another model
+    raw_bytes: int = 0                  # pickled size of everything saved
+    stored_bytes: int = 0               # compressed size of everything saved
+    save_time_s: float = 0.0
+    restore_time_s: float = 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0
+
+
+def _safe(name: str) -> str:
+    return re.sub(r"[^\w.-]", "_", name) or "_"
+
+
+class SessionStore:
+    """
+    llama.cpp state at the end of each batch of a task instance, on disk and zlib-compressed,
+    so batch N+1 of a chained unit continues the conversation of batch N instead of
+    re-evaluating every earlier chunk.
+
+    Layout: <root_dir>/<task_instance_id>/<batch_id>.llsession. A task instance's snapshots
+    are removed with drop() once the unit is finished.
+    """
+
+    def __init__(self, root_dir: Path, compress_level: int = 3):
+        self.root_dir = Path(root_dir)
+        # KV data is mostly f16 noise: low levels get nearly all of the gain at a fraction of the time
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._stats = SessionStoreStats()
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+
+    def save(
+        self,
+        task_instance_id: str,
+        batch_id: str,
+        model_path: str,
+        messages: List[Dict[str, str]],
+        state: Any,
+        n_ctx: int = 0,
+        kv_cache: Sequence[Any] = (),
+    ) -> None:
+        t0 = time.perf_counter()
+        snapshot = SessionSnapshot(
+            model_digest=model_digest(model_path),
+            messages=list(messages),
+            state=state,
+            n_tokens=int(getattr(state, "n_tokens", 0) or 0),
+            n_ctx=n_ctx,
+            kv_cache=tuple(kv_cache),
+        )
+        raw = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        data = zlib.compress(raw, self.compress_level)
+
+        path = self._path(task_instance_id, batch_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception as e:
+            logging.warning("Could not persist session snapshot '%s': %s", path, e)
+            tmp.unlink(missing_ok=True)
+            return
+
+        dt = time.perf_counter() - t0
+        with self._lock:
+            self._stats.saves += 1
+            self._stats.raw_bytes += len(raw)
+            self._stats.stored_bytes += len(data)
+            self._stats.save_time_s += dt
+        logging.info(
+            "Session snapshot %s/%s saved: %d tokens, %.1f MB -> %.1f MB in %.2f s",
+            task_instance_id,
+            batch_id,
+            snapshot.n_tokens,
+            len(raw) / 1024 ** 2,
+            len(data) / 1024 ** 2,
+            dt,
+        )
+
+    def load(self, task_instance_id: str, batch_id: str, model_path: str) -> Optional[SessionSnapshot]:
+        """Snapshot of batch_id, or None if there is none or it was taken with another model."""
+        path = self._path(task_instance_id, batch_id)
+        if not path.exists():
+            self._miss()
+            return None
+        t0 = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                snapshot: SessionSnapshot = pickle.loads(zlib.decompress(f.read()))
+        except Exception as e:
+            logging.warning("Discarding unreadable session snapshot '%s': %s", path, e)
+            path.unlink(missing_ok=True)
+            self._miss()
+            return None
+        if snapshot.model_digest != model_digest(model_path):
+            logging.info("Session snapshot %s/%s was taken with another model; ignoring it", task_instance_id, batch_id)
+            self._miss()
+            return None
+        with self._lock:
+            self._stats.restores += 1
+            self._stats.restore_time_s += time.perf_counter() - t0
+        return snapshot
+
+    def drop(self, task_instance_id: str) -> None:
+        shutil.rmtree(self.root_dir / _safe(task_instance_id), ignore_errors=True)
+
+    def stats(self) -> SessionStoreStats:
+        with self._lock:
+            return SessionStoreStats(**vars(self._stats))
+
+    # ---- internals ----
+
+    def _path(self, task_instance_id: str, batch_id: str) -> Path:
+        return self.root_dir / _safe(task_instance_id) / f"{_safe(batch_id)}.llsession"
+
+    def _miss(self) -> None:
+        with self._lock:
+            self._stats.misses += 1
+
+
+_default_store: Optional[SessionStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_session_store() -> Optional[SessionStore]:
+    """Process-wide store, or None (batches are independent) until configure_session_store()."""
+    return _default_store
+
+
+def configure_session_store(root_dir: Path, compress_level: int = 3) -> SessionStore:
+    global _default_store
+    with _default_store_lock:
+        _default_store = SessionStore(root_dir, compress_level)
+    return _default_store
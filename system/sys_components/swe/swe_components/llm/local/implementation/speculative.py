@@ -0,0 +1,162 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+import numpy as np
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+# probe text for the tokenizer comparison: YAML, code and prose, like our real outputs
+_VOCAB_PROBE = "artifact_kind: interface_spec\ncard:\n  id: 'IF.example'  # naïve → résumé\ndef f(x): return x**2\n"
+
+
+@dataclass
+class DraftCounters:
+    calls: int = 0        # verification rounds (one draft call each)
+    proposed: int = 0     # draft tokens handed to the target model
+    settled: int = 0      # proposed tokens of rounds whose outcome is known
+    accepted: int = 0     # of the settled tokens, the ones the target kept
+
+
+class SmallModelDraft(LlamaDraftModel):
+    """
+    Draft tokens from a small model that shares the target's vocabulary.
+
+    The draft keeps its own context; llama-cpp's generate() reuses the longest common
+    prefix with the previous call, so each round only evaluates the newly accepted tokens.
+    """
+
+    def __init__(self, llm: Any, num_pred_tokens: int = 8):
+        self.llm = llm
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:
+        out = []
+        gen = self.llm.generate(input_ids.tolist(), temp=0.0, top_k=1, repeat_penalty=1.0, reset=True)
+        try:
+            for token in gen:
+                if token == self.llm.token_eos():
+                    break
+                out.append(token)
+                if len(out) >= self.num_pred_tokens:
+                    break
+        finally:
+            gen.close()
+        return np.array(out, dtype=np.intc)
+
+
+class CountingDraft(LlamaDraftModel):
+    """
+    Wraps a draft model and counts proposed and accepted draft tokens.
+
+    llama-cpp calls the draft with the target's accepted tokens plus the one it sampled, so
+    the next call shows how many tokens of the previous proposal were kept. The last round of
+    a generation has no next call; it is counted as proposed but not settled.
+    """
+
+    def __init__(self, inner: LlamaDraftModel, kind: str):
+        self.inner = inner
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._counters = DraftCounters()
+        self._last: Optional[Tuple[int, int, np.ndarray]] = None   # (input length, last input token, proposal)
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:
+        draft = self.inner(input_ids, **kwargs)
+        n = len(input_ids)
+        with self._lock:
+            if self._last is not None:
+                prev_n, prev_tail, prev_draft = self._last
+                accepted = n - 1 - prev_n
+                # otherwise a new generation started and the previous round's outcome is unknown
+                if (
+                    0 <= accepted <= len(prev_draft)
+                    and int(input_ids[prev_n - 1]) == prev_tail
+                    and np.array_equal(input_ids[prev_n : prev_n + accepted], prev_draft[:accepted])
+                ):
+                    self._counters.settled += len(prev_draft)
+                    self._counters.accepted += accepted
+            self._last = (n, int(input_ids[-1]), np.asarray(draft)) if n else None
+            self._counters.calls += 1
+            self._counters.proposed += len(draft)
+        return draft
+
+    def snapshot(self) -> DraftCounters:
+        with self._lock:
+            return DraftCounters(**vars(self._counters))
+
+
+def acceptance_ratio(before: DraftCounters, after: DraftCounters) -> Optional[float]:
+    """
+    Measured share of draft tokens the target accepted between two snapshots, over the rounds
+    whose outcome is known; None if no round settled (e.g. a single-round generation).
+    """
+    settled = after.settled - before.settled
+    if settled <= 0:
+        return None
+    return (after.accepted - before.accepted) / settled
+
+
+def vocab_compatible(target: Any, draft: Any) -> bool:
+    """Same vocabulary size, same special tokens and same tokenization of a mixed probe text."""
+    if target.n_vocab() != draft.n_vocab():
+        return False
+    if (target.token_bos(), target.token_eos()) != (draft.token_bos(), draft.token_eos()):
+        return False
+    probe = _VOCAB_PROBE.encode("utf-8")
+    return target.tokenize(probe, add_bos=False) == draft.tokenize(probe, add_bos=False)
+
+
+def build_draft(
+    *,
+    draft_model_path: Optional[str],
+    prompt_lookup_tokens: int,
+    draft_tokens: int,
+    n_ctx: int,
+    n_threads: int,
+    n_gpu_layers: int,
+) -> Optional[CountingDraft]:
+    """
+    Draft for Llama(draft_model=...), or None when speculation is not configured. A draft model
+    that cannot be loaded only disables speculation, the target still loads.
+    """
+    if draft_model_path:
+        from llama_cpp import Llama
+
+        try:
+            small = Llama(
+                model_path=draft_model_path,
+                n_ctx=n_ctx,
+                n_gpu_layers=n_gpu_layers,
+                n_threads=n_threads,
+                verbose=False,
+            )
+        except Exception as e:
+            logging.warning("Could not load draft model '%s' (%s); speculative decoding disabled", draft_model_path, e)
+            return None
+        return CountingDraft(SmallModelDraft(small, num_pred_tokens=draft_tokens), kind="draft_model")
+    if prompt_lookup_tokens > 0:
+        return CountingDraft(LlamaPromptLookupDecoding(num_pred_tokens=prompt_lookup_tokens), kind="prompt_lookup")
+    return None
+
+
+def verify_draft(target: Any) -> Optional[CountingDraft]:
+    """
+    Check the draft attached to a freshly loaded target. An incompatible small model is
+    detached (and closed), so generation falls back to plain decoding instead of failing.
+    """
+    draft = getattr(target, "draft_model", None)
+    if not isinstance(draft, CountingDraft):
+        return None
+    if isinstance(draft.inner, SmallModelDraft) and not vocab_compatible(target, draft.inner.llm):
+        logging.warning(
+            "Draft model '%s' has a different vocabulary than the target; speculative decoding disabled",
+            getattr(draft.inner.llm, "model_path", "?"),
+        )
+        target.draft_model = None
+        try:
+            draft.inner.llm.close()
+        except Exception:
+            pass
+        return None
+    return draft
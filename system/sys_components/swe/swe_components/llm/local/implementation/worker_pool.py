@@ -0,0 +1,348 @@
+import logging
+import multiprocessing as mp
+import queue
+import threading
+import time
+from dataclasses import asdict, astuple, dataclass, field
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from system.sys_components.swe.swe_interfaces.implementation.if_local_llm import (
+    KNOWN_LLM_ERRORS,
+    LocalLlmError,
+    llm_answer,
+    local_llm_port,
+)
+from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import llm_config
+
+DEFAULT_SYSTEM_PROMPT = "You are a precise software and process architect. Follow the instructions exactly."
+
+# responses above this size travel through a shared_memory buffer instead of being pickled into the pipe
+SHM_THRESHOLD_BYTES = 64 * 1024
+
+
+# ---- worker process side ----
+
+def _worker_main(conn: Any, settings: llm_config, system_prompt: str, shm_threshold: int) -> None:
+    """
+    Entry point of one worker process: load the model once, then serve requests.
+
+    Messages in:  ("ping",) | ("run", req_id, prompt, stream) | ("stop",)
+    Messages out: ("ready", pid) | ("pong", pid) | ("token", req_id, delta)
+                  | ("done", req_id, answer_fields, shm_name, n_bytes) | ("error", req_id, code, details)
+    """
+    import os
+
+    try:
+        from system.sys_components.swe.swe_components.llm.local.implementation.local_llm_v1 import local_llm_engine
+
+        engine = local_llm_engine(system_prompt)
+        engine.engine_for(settings)  # load now, so "ready" means the model is resident
+    except Exception as e:
+        conn.send(("error", None, "LLM_INTERNAL_ERROR", {"error": repr(e), "stage": "load"}))
+        return
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return  # parent went away
+        if msg[0] == "stop":
+            return
+        if msg[0] == "ping":
+            conn.send(("pong", os.getpid()))
+            continue
+
+        _, req_id, prompt, stream = msg
+        on_token = (lambda delta: conn.send(("token", req_id, delta))) if stream else None
+        try:
+            answer = engine.trigger_local_llm(prompt, settings, on_token=on_token)
+        except LocalLlmError as e:
+            conn.send(("error", req_id, e.info.code, e.details))
+            continue
+        except Exception as e:
+            conn.send(("error", req_id, "LLM_INTERNAL_ERROR", {"error": repr(e)}))
+            continue
+
+        fields = asdict(answer)
+        payload = fields["response_text"].encode("utf-8")
+        if len(payload) < shm_threshold:
+            conn.send(("done", req_id, fields, None, 0))
+            continue
+        fields["response_text"] = ""
+        shm = shared_memory.SharedMemory(create=True, size=len(payload))
+        shm.buf[: len(payload)] = payload
+        # ownership passes to the parent, which unlinks after reading
+        resource_tracker.unregister(shm._name, "shared_memory")
+        shm.close()
+        conn.send(("done", req_id, fields, shm.name, len(payload)))
+
+
+# ---- parent side ----
+
+@dataclass
+class WorkerPoolStats:
+    workers: int = 0
+    requests: int = 0
+    failures: int = 0
+    restarts: int = 0
+    shm_transfers: int = 0
+    per_worker_requests: Dict[int, int] = field(default_factory=dict)   # pid -> served requests
+
+
+class _Worker:
+    def __init__(self, ctx: Any, settings: llm_config, system_prompt: str, shm_threshold: int):
+        self.settings = settings
+        self._ctx = ctx
+        self._system_prompt = system_prompt
+        self._shm_threshold = shm_threshold
+        self.proc: Any = None
+        self.conn: Any = None
+        self.pid: Optional[int] = None
+
+    def start(self, load_timeout_s: float) -> None:
+        parent, child = self._ctx.Pipe(duplex=True)
+        self.proc = self._ctx.Process(
+            target=_worker_main,
+            args=(child, self.settings, self._system_prompt, self._shm_threshold),
+            daemon=True,
+        )
+        self.proc.start()
+        child.close()
+        self.conn = parent
+        try:
+            msg = self.recv(load_timeout_s)
+        except BaseException:
+            # a worker that missed the load timeout is still loading: do not leave it behind
+            self.terminate()
+            raise
+        if msg[0] != "ready":
+            self.terminate()
+            raise LocalLlmError(KNOWN_LLM_ERRORS[msg[2]], details=msg[3])
+        self.pid = msg[1]
+
+    def recv(self, timeout_s: Optional[float]) -> Tuple:
+        """Next message; raises LLM_WORKER_FAILED if the process dies, LLM_TIMEOUT on timeout."""
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        while True:
+            try:
+                if self.conn.poll(0.1):
+                    return self.conn.recv()
+            except (EOFError, OSError):
+                self._failed()
+            if not self.proc.is_alive():
+                self._failed()
+            if deadline is not None and time.monotonic() > deadline:
+                raise LocalLlmError(KNOWN_LLM_ERRORS["LLM_TIMEOUT"], details={"timeout_s": timeout_s, "pid": self.pid})
+
+    def _failed(self) -> None:
+        self.proc.join(timeout=1)
+        raise LocalLlmError(
+            KNOWN_LLM_ERRORS["LLM_WORKER_FAILED"],
+            details={"pid": self.pid, "exitcode": self.proc.exitcode},
+        )
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(("stop",))
+        except Exception:
+            pass
+        self.proc.join(timeout=5)
+        self.kill()
+
+    def terminate(self, grace_s: float = 5.0) -> None:
+        """Ask the process to exit, and kill it if it has not within grace_s."""
+        if self.proc is not None and self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join(timeout=grace_s)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.proc is not None and self.proc.is_alive():
+            self.proc.kill()
+            self.proc.join(timeout=5)
+        if self.conn is not None:
+            self.conn.close()
+
+
+class local_llm_worker_pool(local_llm_port):
+    """
+    local_llm_port that runs generation in worker processes, one loaded model per worker.
+
+    A crashing or hung generation only takes down its worker, which is restarted; the caller
+    gets LLM_WORKER_FAILED (TRANSPORT) or LLM_TIMEOUT. Workers for the same llm_config share
+    the load: size n_threads so that workers_per_model * n_threads fits the physical cores.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+        workers_per_model: int = 1,
+        request_timeout_s: Optional[float] = None,
+        load_timeout_s: float = 600.0,
+        health_interval_s: float = 10.0,
+        shm_threshold_bytes: int = SHM_THRESHOLD_BYTES,
+    ):
+        self.system_prompt = system_prompt
+        self.workers_per_model = workers_per_model
+        self.request_timeout_s = request_timeout_s
+        self.load_timeout_s = load_timeout_s
+        self.shm_threshold_bytes = shm_threshold_bytes
+        self._ctx = mp.get_context("spawn")  # never fork a process that may hold a llama.cpp context
+        self._lock = threading.Lock()
+        self._workers: Dict[Tuple, List[_Worker]] = {}
+        self._idle: Dict[Tuple, "queue.Queue[_Worker]"] = {}
+        self._starting: Dict[Tuple, threading.Event] = {}
+        self._stats = WorkerPoolStats()
+        self._req_seq = 0
+        self._closed = threading.Event()
+        self._monitor = threading.Thread(target=self._health_loop, args=(health_interval_s,), daemon=True)
+        self._monitor.start()
+
+    def trigger_local_llm(self, prompt: str, settings: llm_config, on_token: Callable[[str], None] | None = None) -> llm_answer:
+        idle = self._idle_queue(settings)
+        worker = idle.get()
+        with self._lock:
+            self._req_seq += 1
+            req_id = self._req_seq
+            self._stats.requests += 1
+        try:
+            return self._request(worker, req_id, prompt, on_token)
+        except LocalLlmError as e:
+            if e.info.code in ("LLM_WORKER_FAILED", "LLM_TIMEOUT"):
+                self._restart(worker)
+            raise
+        finally:
+            idle.put(worker)
+
+    def stats(self) -> WorkerPoolStats:
+        with self._lock:
+            s = WorkerPoolStats(**vars(self._stats))
+            s.per_worker_requests = dict(self._stats.per_worker_requests)
+            s.workers = sum(len(ws) for ws in self._workers.values())
+        return s
+
+    def shutdown(self) -> None:
+        self._closed.set()
+        with self._lock:
+            workers = [w for ws in self._workers.values() for w in ws]
+            self._workers.clear()
+            self._idle.clear()
+        for w in workers:
+            w.stop()
+
+    # ---- internals ----
+
+    def _idle_queue(self, settings: llm_config) -> "queue.Queue[_Worker]":
+        key = astuple(settings)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if idle is not None:
+                    return idle
+                starting = self._starting.get(key)
+                if starting is None:
+                    self._starting[key] = threading.Event()
+                    break
+            # concurrent first requests for these settings wait for one start (or retry if it failed)
+            starting.wait()
+
+        # ---- spawn outside the lock: a model load must not block other models' requests or stats() ----
+        idle = queue.Queue()
+        workers: List[_Worker] = []
+        try:
+            for _ in range(self.workers_per_model):
+                w = _Worker(self._ctx, settings, self.system_prompt, self.shm_threshold_bytes)
+                w.start(self.load_timeout_s)
+                logging.info("LLM worker %d ready for '%s'", w.pid, settings.model_path)
+                workers.append(w)
+                idle.put(w)
+            if self._closed.is_set():
+                raise RuntimeError("local_llm_worker_pool is shut down")
+        except BaseException:
+            for w in workers:
+                w.stop()
+            with self._lock:
+                self._starting.pop(key).set()
+            raise
+        with self._lock:
+            self._workers[key] = workers
+            self._idle[key] = idle
+            self._starting.pop(key).set()
+        return idle
+
+    def _request(self, worker: _Worker, req_id: int, prompt: str, on_token: Optional[Callable[[str], None]]) -> llm_answer:
+        try:
+            worker.conn.send(("run", req_id, prompt, on_token is not None))
+        except (OSError, ValueError):
+            raise LocalLlmError(KNOWN_LLM_ERRORS["LLM_WORKER_FAILED"], details={"pid": worker.pid}) from None
+
+        deadline = None if self.request_timeout_s is None else time.monotonic() + self.request_timeout_s
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            msg = worker.recv(remaining)
+            kind = msg[0]
+            if kind == "token":
+                if on_token is not None:
+                    on_token(msg[2])
+                continue
+            if kind == "error":
+                with self._lock:
+                    self._stats.failures += 1
+                raise LocalLlmError(KNOWN_LLM_ERRORS.get(msg[2], KNOWN_LLM_ERRORS["LLM_INTERNAL_ERROR"]), details=msg[3])
+            if kind == "done":
+                _, _, fields, shm_name, n_bytes = msg
+                if shm_name is not None:
+                    fields["response_text"] = self._read_shm(shm_name, n_bytes)
+                with self._lock:
+                    self._stats.per_worker_requests[worker.pid] = self._stats.per_worker_requests.get(worker.pid, 0) + 1
+                return llm_answer(**fields)
+            # stale pong / token from an earlier request: ignore
+
+    def _read_shm(self, name: str, n_bytes: int) -> str:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            text = bytes(shm.buf[:n_bytes]).decode("utf-8")
+        finally:
+            shm.close()
+            shm.unlink()
+        with self._lock:
+            self._stats.shm_transfers += 1
+        return text
+
+    def _restart(self, worker: _Worker) -> None:
+        old_pid = worker.pid
+        worker.kill()
+        with self._lock:
+            self._stats.failures += 1
+            self._stats.restarts += 1
+        if self._closed.is_set():
+            return
+        try:
+            worker.start(self.load_timeout_s)
+            logging.warning("LLM worker %s restarted as %s", old_pid, worker.pid)
+        except LocalLlmError as e:
+            # keep the dead worker in rotation; its next request fails fast and retries the restart
+            logging.error("LLM worker %s could not be restarted: %s", old_pid, e.details)
+
+    def _health_loop(self, interval_s: float) -> None:
+        while not self._closed.wait(interval_s):
+            with self._lock:
+                queues = list(self._idle.values())
+            for idle in queues:
+                # only idle workers are pinged, one at a time; busy ones are watched by their request loop
+                for _ in range(idle.qsize()):
+                    try:
+                        w = idle.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        w.conn.send(("ping",))
+                        if w.recv(timeout_s=5.0)[0] != "pong":
+                            raise LocalLlmError(KNOWN_LLM_ERRORS["LLM_WORKER_FAILED"], details={"pid": w.pid})
+                    except (LocalLlmError, OSError, ValueError):
+                        logging.warning("LLM worker %s failed health check", w.pid)
+                        self._restart(w)
+                    finally:
+                        idle.put(w)
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Protocol, Sequence
 
-from system.sys_components.swe.swe_interfaces.implementation.if_resources import resources_data
+from sos_interfaces.if_system_configuration import resources_data
 from system.sys_components.swe.swe_interfaces.implementation.if_task import task_spec
 
 @dataclass
@@ -18,6 +18,14 @@ class llm_config:
     repeat_penalty: float 
     max_tokens: int
 
+    draft_model_path: str | None = None   # speculative decoding, see LLMConfig
+    prompt_lookup_tokens: int = 0
+
+    ctx_buckets: tuple[int, ...] = ()     # per-request context sizes, see LLMConfig
+    type_k: str | None = None             # KV cache quantisation, e.g. "q8_0"
+    type_v: str | None = None
+    flash_attn: bool = False
+
 @dataclass(frozen=True)
 class llm_interview_results:
     responses: dict[str, str]
@@ -0,0 +1,28 @@
+# core/embedding_index/design/interfaces/if_embedding_index.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Protocol, Sequence
+
+from system.sys_components.swe.swe_interfaces.implementation.if_artifact_manager import artifact_ref, cm_anchor_ref
+
+
+@dataclass(frozen=True)
+class embedding_hit:
+    source: str          # repo_relpath of the artifact (or kind:id when it has none)
+    chunk_no: int
+    text: str
+    score: float         # cosine similarity
+
+
+@dataclass(frozen=True)
+class index_update:
+    added: int           # chunks embedded
+    removed: int         # chunks dropped because their artifact changed
+    unchanged_sources: int
+    embed_time_s: float
+
+
+class embedding_index_port(Protocol):
+    def index_artifacts(self, refs: Sequence[artifact_ref | cm_anchor_ref]) -> index_update: ...
+    def search(self, query: str, k: int = 8) -> list[embedding_hit]: ...
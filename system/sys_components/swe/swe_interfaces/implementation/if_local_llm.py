@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Protocol, Sequence, Mapping, Any
+from typing import Protocol, Sequence, Mapping, Any, Callable
 from enum import Enum
 from system.sys_components.swe.swe_interfaces.implementation.if_agent_configurator import llm_config
 
@@ -12,6 +12,7 @@ class LlmErrorCategory(str, Enum):
     VALIDATION = "validation"
     INTERNAL = "internal"
     TRANSPORT = "transport"
+    RESOURCE = "resource"
 
 
 class LlmErrorSeverity(str, Enum):
@@ -54,6 +55,48 @@ KNOWN_LLM_ERRORS: dict[str, LlmErrorInfo] = {
     # "MODEL_NOT_FOUND": LlmErrorInfo(...),
     # "TIMEOUT": LlmErrorInfo(...),
     # ...
+    "LLM_CONTEXT_OVERFLOW": LlmErrorInfo(
+        code="LLM_CONTEXT_OVERFLOW",
+        description="Prompt plus max_tokens does not fit into the model context window.",
+        category=LlmErrorCategory.VALIDATION,
+        severity=LlmErrorSeverity.ERROR,
+        recoverable=False,
+    ),
+    "LLM_OUTPUT_INVALID": LlmErrorInfo(
+        code="LLM_OUTPUT_INVALID",
+        description="Model output did not decode into the requested output schema after all attempts.",
+        category=LlmErrorCategory.VALIDATION,
+        severity=LlmErrorSeverity.ERROR,
+        recoverable=True,
+    ),
+    "LLM_TIMEOUT": LlmErrorInfo(
+        code="LLM_TIMEOUT",
+        description="Generation did not finish before the request deadline.",
+        category=LlmErrorCategory.TIMEOUT,
+        severity=LlmErrorSeverity.ERROR,
+        recoverable=True,
+    ),
+    "LLM_WORKER_FAILED": LlmErrorInfo(
+        code="LLM_WORKER_FAILED",
+        description="The inference worker process died or stopped responding; it has been restarted.",
+        category=LlmErrorCategory.TRANSPORT,
+        severity=LlmErrorSeverity.ERROR,
+        recoverable=True,
+    ),
+    "LLM_RESOURCE_EXHAUSTED": LlmErrorInfo(
+        code="LLM_RESOURCE_EXHAUSTED",
+        description="Not enough free RAM/VRAM to load the model, even after unloading idle models.",
+        category=LlmErrorCategory.RESOURCE,
+        severity=LlmErrorSeverity.ERROR,
+        recoverable=True,
+    ),
+    "LLM_INTERNAL_ERROR": LlmErrorInfo(
+        code="LLM_INTERNAL_ERROR",
+        description="Generation failed with an unexpected error inside the inference engine.",
+        category=LlmErrorCategory.INTERNAL,
+        severity=LlmErrorSeverity.ERROR,
+        recoverable=False,
+    ),
 }
 
 # Success model for Local LLMs
@@ -61,9 +104,34 @@ KNOWN_LLM_ERRORS: dict[str, LlmErrorInfo] = {
 @dataclass(frozen=True)
 class llm_answer:
     execution_time: float
-    generation_speed: float # tokens per second
+    generation_speed: float # decode tokens per second (prompt evaluation excluded)
     response_text: str
+    time_to_first_token: float | None = None   # seconds from request to first streamed text
+    inter_token_latency: float | None = None   # mean seconds between streamed tokens
+    draft_acceptance_ratio: float | None = None  # measured share of speculative draft tokens accepted
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    prompt_eval_time: float | None = None      # seconds evaluating the prompt (excl. KV-cache hits)
+    decode_time: float | None = None           # seconds generating after the prompt
+    inter_token_latency_p50: float | None = None
+    inter_token_latency_p95: float | None = None
+    cache_hit_tokens: int | None = None        # prompt tokens reused from the KV cache, not evaluated
 
 class local_llm_port (Protocol):
-    def trigger_local_llm (self, prompt: str, settings: llm_config) -> llm_answer:
-        ...
\ No newline at end of file
+    def trigger_local_llm (self, prompt: str, settings: llm_config, on_token: Callable[[str], None] | None = None) -> llm_answer:
+        """on_token, if given, is called with every text delta while the model is still generating."""
+        ...
+
+class async_local_llm_port (Protocol):
+    async def trigger_local_llm (
+        self,
+        prompt: str,
+        settings: llm_config,
+        on_token: Callable[[str], None] | None = None,
+        deadline_s: float | None = None,
+    ) -> llm_answer:
+        """
+        Cancelling the awaiting task stops generation at the next token.
+        Exceeding deadline_s raises LocalLlmError with LlmErrorCategory.TIMEOUT.
+        """
+        ...